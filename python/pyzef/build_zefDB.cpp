@@ -619,6 +619,31 @@ PYBIND11_MODULE(pyzef, toplevel_module) {
 	main_module.def("instantiate", py::overload_cast<ZefRef, RelationType, ZefRef, const Graph&, std::optional<BaseUID>>(&instantiate), py::call_guard<py::gil_scoped_release>(), "A function to instantiate an relation", "src"_a, "relation_type"_a, "dst"_a, "g"_a, "uid"_a = py::none());
 	main_module.def("instantiate", py::overload_cast<EZefRef, RelationType, EZefRef, const Graph&, std::optional<BaseUID>>(&instantiate), py::call_guard<py::gil_scoped_release>(), "A function to instantiate an relation", "src"_a, "relation_type"_a, "dst"_a, "g"_a, "uid"_a = py::none());
 
+	// Bulk versions of instantiate, to avoid crossing the python boundary once per item.
+	main_module.def("instantiate_many", [](EntityType entity_type, int n, const Graph& g) {
+			std::vector<ZefRef> out;
+			out.reserve(n);
+			for (int i = 0; i < n; i++)
+				out.push_back(instantiate(entity_type, g));
+			return out;
+		}, py::call_guard<py::gil_scoped_release>(), "Instantiate n entities of the same type", "entity_type"_a, "n"_a, "g"_a);
+	main_module.def("instantiate_many", [](AttributeEntityType atomic_entity_type, int n, const Graph& g) {
+			std::vector<ZefRef> out;
+			out.reserve(n);
+			for (int i = 0; i < n; i++)
+				out.push_back(instantiate(atomic_entity_type, g));
+			return out;
+		}, py::call_guard<py::gil_scoped_release>(), "Instantiate n atomic entities of the same type", "atomic_entity_type"_a, "n"_a, "g"_a);
+	main_module.def("instantiate_many", [](const std::vector<ZefRef>& srcs, RelationType relation_type, const std::vector<ZefRef>& dsts, const Graph& g) {
+			if (srcs.size() != dsts.size())
+				throw std::runtime_error("instantiate_many needs the same number of sources and targets");
+			std::vector<ZefRef> out;
+			out.reserve(srcs.size());
+			for (size_t i = 0; i < srcs.size(); i++)
+				out.push_back(instantiate(srcs[i], relation_type, dsts[i], g));
+			return out;
+		}, py::call_guard<py::gil_scoped_release>(), "Instantiate a relation of the same type for each pair of sources and targets", "srcs"_a, "relation_type"_a, "dsts"_a, "g"_a);
+
 	main_module.def("instantiate_value_node", &instantiate_value_node<bool>, py::call_guard<py::gil_scoped_release>(), "value"_a, "g"_a);
 	main_module.def("instantiate_value_node", &instantiate_value_node<int>, py::call_guard<py::gil_scoped_release>(), "value"_a, "g"_a);
 	main_module.def("instantiate_value_node", &instantiate_value_node<double>, py::call_guard<py::gil_scoped_release>(), "value"_a, "g"_a);
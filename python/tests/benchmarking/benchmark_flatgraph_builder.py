@@ -0,0 +1,60 @@
+# Copyright 2022 Synchronous Technologies Pte Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# Compares building a FlatGraph through repeated inserts with the
+# FlatGraphBuilder, both through its generic insert and its add_* fast paths.
+
+from zef import *
+from zef.ops import *
+import time
+
+def people(n):
+    return [(f"p{i}", f"Person {i}") for i in range(n)]
+
+def with_repeated_insert(n):
+    fg = FlatGraph()
+    for key,name in people(n):
+        fg = fg | insert[ET.Person[key]] | collect
+        fg = fg | insert[(Any[key], RT.Name, name)] | collect
+    return fg
+
+def with_builder_insert(n):
+    with FlatGraphBuilder() as builder:
+        for key,name in people(n):
+            builder.insert(ET.Person[key])
+            builder.insert((Any[key], RT.Name, name))
+    return builder.flatgraph
+
+def with_builder_fast_path(n):
+    with FlatGraphBuilder() as builder:
+        for key,name in people(n):
+            p = builder.add_entity(ET.Person, name=key)
+            builder.add_relation(p, RT.Name, builder.add_aet(AET.String, value=name))
+    return builder.flatgraph
+
+def timed(f, n):
+    start = time.perf_counter()
+    fg = f(n)
+    print(f"{f.__name__:>25}: {len(fg.blobs):>8} blobs in {time.perf_counter() - start:.2f}s")
+    return fg
+
+small = 2000
+assert with_repeated_insert(100).blobs == with_builder_insert(100).blobs == with_builder_fast_path(100).blobs
+timed(with_repeated_insert, small)
+timed(with_builder_insert, small)
+timed(with_builder_fast_path, small)
+
+# Three blobs per person
+timed(with_builder_fast_path, 500000 // 3)
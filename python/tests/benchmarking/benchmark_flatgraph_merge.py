@@ -0,0 +1,50 @@
+# Copyright 2022 Synchronous Technologies Pte Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# Merges 100 FlatGraphs of 10k blobs each, once with the N-way merge and once
+# pairwise, which copies the accumulated result for every pair.
+
+from zef import *
+from zef.ops import *
+import time
+
+n_graphs = 100
+n_people = 10000 // 3      # Three blobs per person
+
+def make_flatgraph(i):
+    with FlatGraphBuilder() as builder:
+        for j in range(n_people):
+            p = builder.add_entity(ET.Person, name=f"p{i}_{j}")
+            builder.add_relation(p, RT.Name, builder.add_aet(AET.String, value=f"Person {j}"))
+        # Shared between all graphs and deduplicated when merging
+        builder.add_relation(p, RT.Language, builder.add_value_node("English"))
+    return builder.flatgraph
+
+start = time.perf_counter()
+fgs = [make_flatgraph(i) for i in range(n_graphs)]
+print(f"Building {n_graphs} FlatGraphs: {time.perf_counter() - start:.2f}s")
+
+start = time.perf_counter()
+merged = merge(fgs)
+print(f"N-way merge: {len(merged.blobs)} blobs in {time.perf_counter() - start:.2f}s")
+
+start = time.perf_counter()
+pairwise = fgs[0]
+for fg in fgs[1:]:
+    pairwise = merge(pairwise, fg)
+print(f"Pairwise merge: {len(pairwise.blobs)} blobs in {time.perf_counter() - start:.2f}s")
+
+assert merged.blobs == pairwise.blobs
+assert merged.key_dict == pairwise.key_dict
@@ -0,0 +1,62 @@
+# Copyright 2022 Synchronous Technologies Pte Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# Compares loading a saved FlatGraph from the binary serialization format
+# with opening it from the on-disk columnar format, both for opening alone
+# and for opening followed by a lookup of a single blob.
+
+from zef import *
+from zef.ops import *
+from zef.core.serialization import serialize_binary, deserialize_binary
+import os
+import tempfile
+import time
+
+def make_flatgraph(n):
+    with FlatGraphBuilder() as builder:
+        for i in range(n):
+            p = builder.add_entity(ET.Person, name=f"p{i}")
+            builder.add_relation(p, RT.Name, builder.add_aet(AET.String, value=f"Person {i}"))
+    return builder.flatgraph
+
+def timed(f):
+    start = time.perf_counter()
+    out = f()
+    return out, time.perf_counter() - start
+
+def load_binary(path):
+    with open(path, "rb") as f:
+        return deserialize_binary(f.read())
+
+def lookup(fg):
+    return fg["p1000"] | Out[RT.Name] | value | collect
+
+
+fg = make_flatgraph(200000)
+with tempfile.TemporaryDirectory() as d:
+    bin_path = os.path.join(d, "fg.zefb")
+    col_path = os.path.join(d, "fg.zfg")
+    with open(bin_path, "wb") as f:
+        f.write(serialize_binary(fg))
+    FlatGraph.save(fg, col_path)
+
+    _, t_bin = timed(lambda: lookup(load_binary(bin_path)))
+    _, t_open = timed(lambda: FlatGraph.open(col_path))
+    _, t_open_lookup = timed(lambda: lookup(FlatGraph.open(col_path)))
+    _, t_read_lookup = timed(lambda: lookup(FlatGraph.open(col_path, mmap=False)))
+    print(f"binary load+lookup {t_bin:7.3f}s ({os.path.getsize(bin_path)/1e6:.1f}MB)")
+    print(f"mmap open          {t_open:7.3f}s ({os.path.getsize(col_path)/1e6:.1f}MB)")
+    print(f"mmap open+lookup   {t_open_lookup:7.3f}s")
+    print(f"read open+lookup   {t_read_lookup:7.3f}s")
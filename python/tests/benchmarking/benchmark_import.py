@@ -0,0 +1,51 @@
+# Copyright 2022 Synchronous Technologies Pte Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Cold-import time of zef. Every run is a fresh interpreter, so that nothing is
+# already in sys.modules. The slowest zef modules are taken from
+# zef.import_profile() of the last run.
+
+import subprocess
+import statistics
+import sys
+import json
+
+n_runs = 10
+n_slowest = 15
+
+script = """
+import time
+start = time.perf_counter()
+import zef
+wall = time.perf_counter() - start
+import json, sys
+prof = zef.import_profile()
+heavy = [name for name in ["pandas", "yaml", "toml", "rx", "dateparser", "pytz", "watchdog", "ariadne", "functional", "IPython"]
+         if name in sys.modules]
+print(json.dumps({"wall": wall, "profile": prof, "heavy": heavy}))
+"""
+
+def run_once():
+    out = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+results = [run_once() for _ in range(n_runs)]
+walls = [r["wall"] for r in results]
+print(f"import zef over {n_runs} runs: min {min(walls):.3f}s, median {statistics.median(walls):.3f}s, max {max(walls):.3f}s")
+
+last = results[-1]
+print(f"Heavy dependencies loaded at startup: {last['heavy'] or 'none'}")
+print("Slowest zef modules:")
+for name,dt in sorted(last["profile"]["modules"], key=lambda x: -x[1])[:n_slowest]:
+    print(f"  {dt*1000:8.1f}ms  {name}")
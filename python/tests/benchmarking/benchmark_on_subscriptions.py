@@ -0,0 +1,64 @@
+# Copyright 2022 Synchronous Technologies Pte Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Compares many `g | on[...]` listeners, which share one indexed dispatcher,
+# against the same number of listeners that each have their own subscription
+# and filter every event of every transaction, as on[...] used to do.
+
+from zef import *
+from zef.ops import *
+from zef.pyzef import zefops as pyzefops
+import time
+
+n_listeners = 1000
+n_writes = 200
+
+def setup_graph():
+    g = Graph()
+    machines = [ET.Machine | g | run for _ in range(n_listeners)]
+    return g, machines
+
+def legacy_on_terminated(g, z, callback):
+    def filter_func(root_node):
+        root_node | frame | to_tx | events[Terminated] | filter[lambda ev: to_ezefref(ev.target) == to_ezefref(z)] | for_each[callback]
+    return g | pyzefops.subscribe[pyzefops.keep_alive[True]][filter_func]
+
+def write_load(g):
+    start = time.time()
+    for i in range(n_writes):
+        (ET.Person, RT.Name, str(i)) | g | run
+    return time.time() - start
+
+def bench(name, add_listener):
+    g, machines = setup_graph()
+    count = [0]
+    def callback(ev):
+        count[0] += 1
+
+    start = time.time()
+    subs = [add_listener(g, z, callback) for z in machines]
+    registered = time.time()
+    print(f"{name}: time to register {n_listeners} listeners: {registered-start:.3f}s")
+
+    dt = write_load(g)
+    print(f"{name}: {n_writes} transactions: {dt:.3f}s ({n_writes/dt:.1f} tx/s)")
+
+    start = time.time()
+    machines[0] | terminate | g | run
+    print(f"{name}: delivering one termination: {time.time()-start:.4f}s")
+    assert count[0] == 1
+    return subs
+
+bench("on[...]", lambda g, z, callback: g | on[terminated[z]] | subscribe[callback])
+bench("legacy", legacy_on_terminated)
@@ -0,0 +1,62 @@
+# Copyright 2022 Synchronous Technologies Pte Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# Compares the interpreted evaluation of a LazyValue with the evaluation from a
+# compiled (cached) plan of the same op chain.
+
+from zef import *
+from zef.ops import *
+from zef.core.op_structs import LazyValue_, compile_op_chain
+import time
+
+n_repeats = 100000
+
+chains = {
+    "scalar": (42, add[1] | multiply[2] | subtract[3]),
+    "list": ([1,2,3,4,5], map[add[1]] | filter[greater_than[2]] | sum),
+    "dict": ({"a": 1, "b": 2}, get["a"] | add[1]),
+    # The interpreted path runs one nested generator per op, the compiled one fuses them
+    "fused": (list(range(1000)), map[add[1]] | filter[greater_than[2]] | map[multiply[2]] | take[500] | sum),
+}
+# Chains over long inputs are repeated fewer times
+repeats = {"fused": n_repeats // 100}
+
+def make_lazy_value(x, op_chain):
+    lv = LazyValue_(x)
+    lv.el_ops = CollectingOp(op_chain)
+    return lv
+
+for name,(x,op_chain) in chains.items():
+    lv = make_lazy_value(x, op_chain)
+    n = repeats.get(name, n_repeats)
+    assert lv.evaluate() == lv.evaluate_interpreted()
+    compile_op_chain(lv.el_ops.el_ops)
+
+    start = time.perf_counter()
+    for _ in range(n):
+        lv.evaluate_interpreted()
+    interpreted = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(n):
+        lv.evaluate()
+    compiled = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(n):
+        x | op_chain | collect
+    piped = time.perf_counter() - start
+
+    print(f"{name:>8} x{n}: interpreted {interpreted:.3f}s, compiled {compiled:.3f}s ({interpreted/compiled:.2f}x), full pipe syntax {piped:.3f}s")
@@ -0,0 +1,104 @@
+# Copyright 2022 Synchronous Technologies Pte Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# Compares the JSON serialization path (serialize + json.dumps, as used by
+# to_json) with the binary format, on payload size and encode/decode time.
+# Then compares the peak memory of writing a large FlatGraph to a file in one
+# go against streaming it.
+
+from zef import *
+from zef.ops import *
+from zef.core.serialization import serialize_binary, deserialize_binary, serialize_iter, deserialize_stream
+import json
+import time
+import tempfile
+import tracemalloc
+
+def make_flatgraph(n):
+    with FlatGraphBuilder() as builder:
+        for i in range(n):
+            p = builder.add_entity(ET.Person, name=f"p{i}")
+            builder.add_relation(p, RT.Name, builder.add_aet(AET.String, value=f"Person {i}"))
+    return builder.flatgraph
+
+def make_list(n):
+    return [{"id": i, "name": f"item {i}", "score": i / 7, "tags": ("a", "b"), "active": i % 2 == 0}
+            for i in range(n)]
+
+def make_bytes(n):
+    return [bytes(range(256)) * 4 for _ in range(n)]
+
+def make_ops(n):
+    return [map[lambda x: x] | filter[greater_than[i]] | take[10] for i in range(n)]
+
+
+def via_json(v):
+    return json.dumps(serialize(v)).encode("utf-8")
+
+def from_json(data):
+    return deserialize(json.loads(data))
+
+
+def timed(f, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = f(*args)
+        t = time.perf_counter() - start
+        best = t if best is None else min(best, t)
+    return out, best
+
+def compare(name, v):
+    json_data, t_json_enc = timed(via_json, v)
+    _, t_json_dec = timed(from_json, json_data)
+    bin_data, t_bin_enc = timed(serialize_binary, v)
+    _, t_bin_dec = timed(deserialize_binary, bin_data)
+    print(f"{name:>12}: json {len(json_data)/1e6:8.2f}MB enc {t_json_enc:6.3f}s dec {t_json_dec:6.3f}s"
+          f" | binary {len(bin_data)/1e6:8.2f}MB enc {t_bin_enc:6.3f}s dec {t_bin_dec:6.3f}s")
+
+
+compare("flatgraph", make_flatgraph(100000))
+compare("list", make_list(100000))
+compare("bytes", make_bytes(10000))
+compare("ops", make_ops(2000))
+
+
+def write_whole(v, f):
+    f.write(serialize_binary(v))
+
+def write_streamed(v, f):
+    for chunk in serialize_iter(v):
+        f.write(chunk)
+
+def peak_memory(f, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    f(*args)
+    t = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, t
+
+fg = make_flatgraph(200000)
+with tempfile.TemporaryFile() as f:
+    peak_whole, t_whole = peak_memory(write_whole, fg, f)
+    f.seek(0)
+    f.truncate()
+    peak_stream, t_stream = peak_memory(write_streamed, fg, f)
+    f.seek(0)
+    peak_read, t_read = peak_memory(lambda: next(deserialize_stream(f)))
+print(f"   write fg: whole peak {peak_whole/1e6:8.2f}MB {t_whole:6.3f}s"
+      f" | streamed peak {peak_stream/1e6:8.2f}MB {t_stream:6.3f}s"
+      f" | streamed read {t_read:6.3f}s")
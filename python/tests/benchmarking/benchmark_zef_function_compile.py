@@ -0,0 +1,65 @@
+# Copyright 2022 Synchronous Technologies Pte Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Time to load many zef functions: compiling from source, loading the code
+# objects from the on-disk cache (as a new process would) and from memory.
+
+import os
+import tempfile
+import time
+
+cache_dir = tempfile.mkdtemp()
+os.environ["ZEF_FUNCTION_CACHE_DIR"] = cache_dir
+
+from zef import *
+from zef.ops import *
+from zef.core import zef_functions
+
+n_functions = 2000
+
+def make_source(i):
+    return f"""
+def zef_function_{i:048x}(x, y=1):
+    total = 0
+    for item in x | filter[lambda z: z > {i}] | collect:
+        total += item * y
+    return {{"sum": total, "count": length(x), "index": {i}}}
+"""
+
+sources = [make_source(i) for i in range(n_functions)]
+
+def load_all():
+    start = time.time()
+    for src in sources:
+        zef_functions.compile_in_zef_context(src, {})
+    return time.time() - start
+
+os.environ["ZEF_FUNCTION_CACHE"] = "0"
+dt_nocache = load_all()
+print(f"Compiling {n_functions} functions without a cache: {dt_nocache:.3f}s")
+zef_functions._code_cache.clear()
+
+del os.environ["ZEF_FUNCTION_CACHE"]
+dt_write = load_all()
+print(f"Compiling and writing to the disk cache: {dt_write:.3f}s")
+
+zef_functions._code_cache.clear()
+dt_disk = load_all()
+print(f"Loading from the disk cache: {dt_disk:.3f}s ({dt_nocache/dt_disk:.1f}x)")
+
+dt_mem = load_all()
+print(f"Loading from the memory cache: {dt_mem:.3f}s ({dt_nocache/dt_mem:.1f}x)")
+
+import shutil
+shutil.rmtree(cache_dir)
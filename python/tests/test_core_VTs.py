@@ -38,5 +38,55 @@ class MyTestCase(unittest.TestCase):
         self.assertIsInstance(d, Pattern[{Optional["a"]: Any, Optional["b"]: Any, Optional["c"]: Any}])
 
 
+    def test_compiled_is_a(self):
+        from zef.core.VT.value_type import is_a_cache_stats, reset_is_a_cache_stats
+
+        typ = PyInt | String | PyDict
+        self.assertIsInstance(1, typ)
+        self.assertIsInstance(True, typ)
+        self.assertIsInstance("a", typ)
+        self.assertIsInstance({}, typ)
+        self.assertNotIsInstance(1.5, typ)
+        self.assertNotIsInstance(1.5, PyInt | String)
+        self.assertIsInstance(1.5, ~(PyInt | String))
+        self.assertIsInstance(1, PyInt & ~PyBool)
+        self.assertNotIsInstance(True, PyInt & ~PyBool)
+
+        # Int depends on the value, not just the type
+        self.assertIsInstance(1.0, Int | String)
+        self.assertNotIsInstance(1.5, Int | String)
+        self.assertIsInstance(1, Int & Is[lambda x: x > 0])
+        self.assertNotIsInstance(-1, Int & Is[lambda x: x > 0])
+
+        # Freshly constructed types share the decisions of equal types
+        self.assertIsInstance(0, PyInt | String)
+        reset_is_a_cache_stats()
+        for i in range(10):
+            self.assertIsInstance(i, PyInt | String)
+        stats = is_a_cache_stats()
+        self.assertGreaterEqual(stats["type_hits"], 10)
+
+        self.assertEqual(hash(PyInt | String), hash(PyInt | String))
+
+    def test_compiled_match(self):
+        from zef.core.op_implementations.implementation_typing_functions import compile_match
+
+        dispatch = compile_match([
+            ({24, 42}, lambda x: "special"),
+            (PyInt & Is[lambda x: x < 0], lambda x: "negative"),
+            (PyInt, lambda x: "int"),
+            (String | PyBool, lambda x: "string or bool"),
+            (Any, lambda x: "other"),
+        ])
+        for x in [42, -3, 5, True, "a", 1.5, None]:
+            self.assertEqual(dispatch(x), x | match[dispatch.patterns] | collect)
+        self.assertEqual(dispatch.select(5), dispatch.patterns[2][1])
+
+        # Bools are ints, so the PyInt case is reached before String | PyBool
+        self.assertEqual(dispatch(True), "int")
+
+        with self.assertRaises(Exception):
+            compile_match([(PyInt, lambda x: x)])("not an int")
+
 if __name__ == '__main__':
     unittest.main()
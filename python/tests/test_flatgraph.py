@@ -186,5 +186,179 @@ class MyTestCase(unittest.TestCase):
         merge(fg, fg2)
 
 
+    def test_merging_list_matches_pairwise(self):
+        from functools import reduce
+        g  = Graph()
+        z0 = ET.Person | g | run
+        z1 = ET.Person | g | run
+
+        fgs = [
+            FlatGraph([{
+                ET.Person['p1'] : {
+                    RT.Name: "Fred",
+                    RT.Friend: z0,
+                    RT.Language: Val("English"),
+                }
+            }]),
+            # 'p1' is used again, and z0 and the value node are shared
+            FlatGraph([
+                (ET.Dog['p1'], RT.Owner, z0),
+                (z0, RT.Knows, z1),
+                (Any['p1'], RT.Speaks, Val("English")),
+            ]),
+            FlatGraph(),
+            FlatGraph([
+                (z1, RT.Likes, ET.Cat['c1']),
+                Val("English"),
+                (Any['c1'], RT.Age, Val(42)),
+            ]),
+            FlatGraph([(z0, RT.Knows, z1), Val(42)]),
+        ]
+        def snapshot(fg):
+            return [b if b is None else (b[0], b[1], tuple(b[2]), *b[3:]) for b in fg.blobs], {**fg.key_dict}
+        before = [snapshot(fg) for fg in fgs]
+
+        for n in range(1, len(fgs)+1):
+            merged = merge(fgs[:n])
+            pairwise = reduce(merge, fgs[:n])
+            self.assertEqual(merged.blobs, pairwise.blobs)
+            self.assertEqual(merged.key_dict, pairwise.key_dict)
+
+        # Shared value nodes and uids are only present once
+        value_nodes = [b[3] for b in merged.blobs if b is not None and b[1] == BT.VALUE_NODE]
+        self.assertEqual(sorted(value_nodes, key=str), [42, "English"])
+        self.assertEqual(len(merged | all[RT.Knows] | collect), 2)
+
+        # The inputs are left untouched
+        self.assertEqual([snapshot(fg) for fg in fgs], before)
+
+
+    def test_columnar_storage(self):
+        fg = FlatGraph([{
+                ET.Person['z1'] : {
+                RT.FirstName: "Fred",
+                RT.YearOfBirth: 1970,
+                RT.Nickname: Val("Freddy"),
+            }
+        }])
+        cols = FlatGraphColumns.from_blobs(fg.blobs, fg.key_dict)
+        fg_cols = FlatGraph(cols)
+        self.assertEqual(fg_cols.blobs, fg.blobs)
+        self.assertEqual(fg_cols.key_dict, fg.key_dict)
+
+        cols = FlatGraphColumns()
+        p = cols.append_node(ET.Person, key="p")
+        name = cols.append_aet(AET.String, value="Fred")
+        r = cols.append_relation(RT.Name, p, name)
+        fg = FlatGraph(cols)
+        self.assertEqual(fg.blobs[p][2], [r])
+        self.assertEqual(fg.blobs[name][2], [-r])
+        self.assertEqual(fg["p"] | Out[RT.Name] | value | collect, "Fred")
+        with self.assertRaises(Exception):
+            cols.append_node(ET.Person)
+
+
+    def test_builder_matches_insert(self):
+        elements = [
+            ET.Person['p1'],
+            AET.String['n1'] | assign["Fred"],
+            (Any['p1'], RT.Name, Any['n1']),
+            Val("English"),
+            (Any['p1'], RT.Language, Val("English")),
+        ]
+        fg = FlatGraph()
+        for el in elements:
+            fg = fg | insert[el] | collect
+
+        with FlatGraphBuilder() as builder:
+            for el in elements:
+                builder.insert(el)
+        self.assertEqual(builder.flatgraph.blobs, fg.blobs)
+        self.assertEqual(builder.flatgraph.key_dict, fg.key_dict)
+
+        builder = FlatGraphBuilder()
+        p = builder.add_entity(ET.Person, name='p1')
+        n = builder.add_aet(AET.String, name='n1', value="Fred")
+        builder.add_relation(p, RT.Name, n)
+        v = builder.add_value_node("English")
+        builder.add_relation('p1', RT.Language, v)
+        fg2 = builder.build()
+        self.assertEqual(fg2.blobs, fg.blobs)
+        self.assertEqual(fg2.key_dict, fg.key_dict)
+
+
+    def test_type_index(self):
+        fg = FlatGraph([
+            ET.Person['p1'],
+            ET.Person['p2'],
+            ET.Dog['d1'],
+            (Any['p1'], RT.Owns, Any['d1']),
+            (Any['p2'], RT.Owns, Any['d1']),
+            (Any['p1'], RT.Name, "Fred"),
+        ])
+        def linear_all(selector):
+            return [b[0] for b in fg.blobs if is_a(b[1], selector)]
+        for selector in [ET.Person, ET, RT.Owns, RT, AET, ET.Person | ET.Dog]:
+            self.assertEqual(fg | all[selector] | collect | map[lambda fr: fr.idx] | collect, linear_all(selector))
+
+        p1 = fg['p1']
+        self.assertEqual(len(p1 | out_rels[RT.Owns] | collect), 1)
+        self.assertEqual(len(fg['d1'] | in_rels[RT.Owns] | collect), 2)
+
+        # Inserting must not change the edges of the original FlatGraph
+        n_edges = len(fg.blobs[p1.idx][2])
+        fg2 = fg | insert[(Any['p1'], RT.Owns, ET.Dog)] | collect
+        self.assertEqual(len(fg.blobs[p1.idx][2]), n_edges)
+        self.assertEqual(len(fg | all[ET.Dog] | collect), 1)
+        self.assertEqual(len(fg2 | all[ET.Dog] | collect), 2)
+        self.assertEqual(len(fg2['p1'] | out_rels[RT.Owns] | collect), 2)
+
+
+    def test_mapped_file(self):
+        import tempfile, os
+        fg = FlatGraph([{
+                ET.Person['z1'] : {
+                RT.FirstName: "Fred",
+                RT.YearOfBirth: 1970,
+                RT.Nickname: Val("Freddy"),
+            }
+        }])
+        fg = fg | insert[(Any['z1'], RT.Owns, ET.Dog['d1'])] | collect
+
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "fg.zfg")
+            FlatGraph.save(fg, path)
+            for use_mmap in [True, False]:
+                fg2 = FlatGraph.open(path, mmap=use_mmap)
+                self.assertEqual(len(fg2.blobs), len(fg.blobs))
+                # Nothing is materialized until accessed
+                self.assertEqual(len(fg2.blobs._cache), 0)
+                self.assertEqual(fg2 | all[ET.Dog] | collect | map[lambda fr: fr.idx] | collect,
+                                 fg | all[ET.Dog] | collect | map[lambda fr: fr.idx] | collect)
+                self.assertEqual(len(fg2.blobs._cache), 0)
+
+                self.assertEqual(fg2['z1'] | Out[RT.FirstName] | value | collect, "Fred")
+                # Value nodes keep their BT.VALUE_NODE type and value
+                value_nodes = [b for b in fg2.blobs if b is not None and b[1] == BT.VALUE_NODE]
+                self.assertEqual([b[3] for b in value_nodes], ["Freddy"])
+                self.assertEqual(value_nodes, [b for b in fg.blobs if b is not None and b[1] == BT.VALUE_NODE])
+                self.assertEqual(tuple(fg2.blobs), tuple(fg.blobs))
+                self.assertEqual(fg2.key_dict, fg.key_dict)
+
+                fg3 = fg2 | insert[(Any['z1'], RT.Owns, ET.Dog)] | collect
+                self.assertEqual(len(fg3 | all[ET.Dog] | collect), 2)
+
+            # Writing out an opened FlatGraph gives the same file
+            path2 = os.path.join(d, "fg2.zfg")
+            FlatGraph.save(FlatGraph.open(path), path2)
+            with open(path, "rb") as f1, open(path2, "rb") as f2:
+                self.assertEqual(f1.read(), f2.read())
+
+            with open(path2, "wb") as f:
+                f.write(b"not a flatgraph")
+            with self.assertRaises(Exception):
+                FlatGraph.open(path2)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -36,5 +36,49 @@ class MyTestCase(unittest.TestCase):
         self.assertEqual(5 | func[adder] | collect, 6)
         self.assertEqual(5 | func[adder][2] | collect, 7)
 
+    def test_compile_cache(self):
+        import os, tempfile
+        from zef.core import zef_functions
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            os.environ["ZEF_FUNCTION_CACHE_DIR"] = cache_dir
+            try:
+                g = Graph()
+
+                @func(g)
+                def adder(x, y=1):
+                    return x + y
+
+                z_adder = g | now | all[ET.ZEF_Function] | single | collect
+                self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+                # As for a new process, which only has the code objects on disk
+                zef_functions._code_cache.clear()
+                zef_functions._compiled_by_closure.clear()
+                ET.Dummy | g | run
+                fct = zef_functions.compile_zef_function(z_adder | now | collect)
+                self.assertEqual(fct(5), 6)
+
+                # Later time slices share the compiled function
+                ET.Dummy | g | run
+                z_now = z_adder | now | collect
+                self.assertIs(zef_functions.compile_zef_function(z_now), fct)
+                # Already compiled for this slice
+                self.assertIs(zef_functions.compile_zef_function(z_now), fct)
+
+                # A corrupt file on disk is compiled again
+                for fname in os.listdir(cache_dir):
+                    path = os.path.join(cache_dir, fname)
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    with open(path, "wb") as f:
+                        f.write(data[:-8] + b"\xff" * 8)
+                zef_functions._code_cache.clear()
+                zef_functions._compiled_by_closure.clear()
+                ET.Dummy | g | run
+                self.assertEqual(zef_functions.compile_zef_function(z_adder | now | collect)(5), 6)
+            finally:
+                del os.environ["ZEF_FUNCTION_CACHE_DIR"]
+
 if __name__ == '__main__':
     unittest.main()
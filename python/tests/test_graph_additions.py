@@ -21,6 +21,7 @@ from zef.core.graph_additions.types import *
 from zef.core.graph_additions.low_level import *
 from zef.core.graph_additions.wish_translation2 import *
 from zef.core.graph_additions.wish_interpretation import *
+from zef.core.graph_additions.prepared import prepare_wish, wish_param
 
 
 class MyTestCase(unittest.TestCase):
@@ -50,6 +51,191 @@ class MyTestCase(unittest.TestCase):
         gs_updated,receipt2 = perform_level1_commands(concrete_cmd_list, False)
         self.assertEqual(origin_uid(receipt["asdf"]), origin_uid(receipt2["two"]))
 
+    def test_level1_batched(self):
+        g = Graph()
+
+        n = 20
+        cmds = []
+        for i in range(n):
+            cmds += [PleaseInstantiate({"atom": ET.Machine,
+                                        "internal_ids": [getattr(V, f"m{i}")]})]
+        for i in range(n):
+            cmds += [PleaseInstantiate({"atom": AET.Int,
+                                        "internal_ids": [getattr(V, f"a{i}")]})]
+        # Interleaved types are not batched, so the order is kept
+        for i in range(2):
+            cmds += [PleaseInstantiate({"atom": ET.Dummy}),
+                     PleaseInstantiate({"atom": ET.Other})]
+        for i in range(n):
+            cmds += [PleaseInstantiate({"atom": {"rt": RT.Value,
+                                                 "source": getattr(V, f"m{i}"),
+                                                 "target": getattr(V, f"a{i}")},
+                                        "internal_ids": [getattr(V, f"r{i}")]})]
+        for i in range(n):
+            cmds += [PleaseAssign({"target": getattr(V, f"a{i}"),
+                                   "value": Val(i)})]
+        # Relations to value nodes and delegates can't be batched
+        cmds += [PleaseInstantiate({"atom": Val("shared")}),
+                 PleaseInstantiate({"atom": delegate_of(ET.Machine)})]
+        for i in range(3):
+            cmds += [PleaseInstantiate({"atom": {"rt": RT.Label,
+                                                 "source": getattr(V, f"m{i}"),
+                                                 "target": Val("shared")}})]
+        for i in range(3):
+            cmds += [PleaseInstantiate({"atom": {"rt": RT.Kind,
+                                                 "source": getattr(V, f"m{i}"),
+                                                 "target": delegate_of(ET.Machine)}})]
+
+        steps = compile_level1_commands(cmds)
+        for step in steps:
+            if step[0] == "instantiate_relations":
+                for cmd in step[2]:
+                    self.assertNotIsInstance(cmd.atom["target"], Val | DelegateRef)
+        # The steps cover the commands in their original order
+        stepped = []
+        for step in steps:
+            if step[0] in ["instantiate_many", "instantiate_relations"]:
+                stepped += step[2]
+            elif step[0] == "assign_many":
+                stepped += step[1]
+            else:
+                stepped += [step[1]]
+        self.assertEqual([id(cmd) for cmd in stepped], [id(cmd) for cmd in cmds])
+
+        concrete_cmd_list = Level1CommandInfo({"cmds": cmds,
+                                               "gs": now(g),
+                                               "resolved_variables": {}})
+        gs_updated,receipt = perform_level1_commands(concrete_cmd_list, False)
+
+        self.assertEqual(len(receipt), 3*n)
+        self.assertEqual(gs_updated | all[ET.Dummy] | length | collect, 2)
+        for i in range(n):
+            self.assertIsInstance(receipt[f"m{i}"], ET.Machine)
+            self.assertEqual(origin_uid(source(receipt[f"r{i}"])), origin_uid(receipt[f"m{i}"]))
+        self.assertEqual(gs_updated | all[ET.Machine] | length | collect, n)
+        self.assertEqual(gs_updated | all[RT.Value] | length | collect, n)
+        self.assertEqual(gs_updated | all[AET.Int] | map[value] | sort | collect, list(range(n)))
+        self.assertEqual(gs_updated | all[RT.Label] | map[target | value] | collect, ["shared"]*3)
+        self.assertEqual(gs_updated | all[RT.Kind] | length | collect, 3)
+
+    def test_command_ordering(self):
+        from zef.core.graph_additions.command_ordering import order_level1_commands, are_commands_ordered, command_dep_rules
+
+        def reference_order(commands, gs):
+            # The quadratic ordering that order_level1_commands replaced
+            def simple_key(cmd):
+                if isinstance(cmd, PleaseInstantiate):
+                    if isinstance(cmd.atom, PleaseInstantiateEntity | PleaseInstantiateAttributeEntity):
+                        return 0
+                    elif isinstance(cmd.atom, PleaseInstantiateRelation):
+                        return 1
+                elif isinstance(cmd, PleaseAssign):
+                    return 10
+                return 999
+            commands = commands | sort[simple_key] | collect
+            new_commands = []
+            cmd_mapping = {}
+            ready_cmds = []
+            dependencies = {}
+            dependents = {}
+            for cmd in commands:
+                # Through match_rules, so the reference doesn't share the dispatch under test
+                name,deps = (cmd,gs) | match_rules[[
+                    *command_dep_rules,
+                    (Any, not_implemented_error["Command unknown for dependency ordering"]),
+                ]] | collect
+                if name is None:
+                    new_commands += [cmd]
+                    continue
+                cmd_mapping[name] = cmd
+                if len(deps) == 0:
+                    ready_cmds += [name]
+                else:
+                    dependencies[name] = list(deps)
+                    for dep in deps:
+                        dependents.setdefault(dep, []).append(name)
+            while len(ready_cmds) > 0:
+                name = ready_cmds.pop(0)
+                new_commands += [cmd_mapping[name]]
+                for other in dependents.get(name, []):
+                    dependencies[other].remove(name)
+                    if len(dependencies[other]) == 0:
+                        ready_cmds += [other]
+            return new_commands
+
+        g = Graph()
+        # Deliberately out of order: relations and assignments come before
+        # the atoms they refer to.
+        cmds = [
+            PleaseAssign({"target": V.a0, "value": Val(1)}),
+            PleaseInstantiate({"atom": {"rt": RT.Meta, "source": V.r0, "target": V.a0},
+                               "internal_ids": [V.r1]}),
+            PleaseInstantiate({"atom": {"rt": RT.Value, "source": V.m0, "target": V.a0},
+                               "internal_ids": [V.r0]}),
+            # Both ends are the same, so the dependency is duplicated
+            PleaseInstantiate({"atom": {"rt": RT.Self, "source": V.m1, "target": V.m1},
+                               "internal_ids": [V.r2]}),
+            PleaseInstantiate({"atom": {"rt": RT.Label, "source": V.m1, "target": Val("label")},
+                               "internal_ids": [V.r4]}),
+            PleaseInstantiate({"atom": Val("label")}),
+            PleaseInstantiate({"atom": ET.Machine, "internal_ids": [V.m1]}),
+            PleaseInstantiate({"atom": ET.Machine}),
+            PleaseInstantiate({"atom": AET.Int, "internal_ids": [V.a0]}),
+            PleaseInstantiate({"atom": ET.Machine, "internal_ids": [V.m0]}),
+        ]
+        gs = now(g)
+        ordered = order_level1_commands(cmds, gs)
+        self.assertEqual(ordered, reference_order(cmds, gs))
+        self.assertEqual(len(ordered), len(cmds))
+        self.assertTrue(are_commands_ordered(ordered, gs))
+
+        # A relation to something that is never instantiated can't be ordered
+        cmds += [PleaseInstantiate({"atom": {"rt": RT.Value, "source": V.m0, "target": V.missing},
+                                    "internal_ids": [V.r3]})]
+        with self.assertRaisesRegex(Exception, "Unable to order"):
+            order_level1_commands(cmds, gs)
+
+    def test_prepared_wish(self):
+        g = Graph()
+
+        prepared = prepare_wish([
+            ET.Person[V.p],
+            (V.p, RT.Name, wish_param("name", AET.String)),
+            (V.p, RT.Age, wish_param("age", AET.Int)),
+        ])
+        self.assertEqual(prepared.params, {"name": AET.String, "age": AET.Int})
+        self.assertTrue(prepared.slice_independent)
+
+        for name,age in [("a", 1), ("b", 2), ("c", 3)]:
+            eff = prepared.transact(g, name=name, age=age)
+            self.assertIn("level1_commands", eff)
+            gs_updated,receipt = eff | run
+            z = gs_updated | get[receipt["p"]] | collect
+            self.assertEqual(z | Out[RT.Name] | value | collect, name)
+            self.assertEqual(z | Out[RT.Age] | value | collect, age)
+
+        self.assertEqual(now(g) | all[ET.Person] | length | collect, 3)
+
+        with self.assertRaises(TypeError):
+            prepared.transact(g, name="d")
+        with self.assertRaises(TypeError):
+            prepared.transact(g, name="d", age="not an int")
+
+        # Referring to an existing entity only reuses the interpretation
+        z_org = ET.Organisation | g | run
+        prepared = prepare_wish([
+            (z_org, RT.Member, ET.Person[V.p]),
+            (V.p, RT.Name, wish_param("name", AET.String)),
+        ])
+        self.assertFalse(prepared.slice_independent)
+        for name in ["x", "y"]:
+            eff = prepared.transact(g, name=name)
+            self.assertNotIn("level1_commands", eff)
+            eff | run
+        self.assertEqual(now(g) | get[z_org] | Outs[RT.Member] | Out[RT.Name] | value | func[set] | collect,
+                         {"x", "y"})
+
+
     def test_generate_level1(self):
         # lvl1_rules = default_translation_rules
 
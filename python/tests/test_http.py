@@ -55,6 +55,105 @@ class MyTestCase(unittest.TestCase):
             "type": FX.HTTP.StopServer,
             "server_uuid": eff_resp["server_uuid"],
         } | run
+    def test_http_server_asyncio(self):
+        from zef.core.fx.http import send_response, middleware_worker, fallback_not_found, route, _effects_processes
+        port = 4991
+        payload = b"successful test"
+        eff = {
+            'type': FX.HTTP.StartServer,
+            'port': port,
+            'engine': "asyncio",
+            'request_timeout': 1.0,
+            'pipe_into': (filter[lambda query: query["path"] != "/no-response"]
+                          | map[middleware_worker[route["/test-url"][lambda query: {**query, "response_body": payload + query["request_body"]}],
+                                                fallback_not_found,
+                                                send_response]]
+                          | subscribe[run]),
+            'bind_address': "localhost",
+        }
+
+        eff_resp = eff | run
+
+        import requests
+        with requests.Session() as session:
+            for i in range(5):
+                r = session.post(f"http://localhost:{port}/test-url", data=str(i))
+                self.assertEqual(r.status_code, 200)
+                self.assertEqual(r.content, payload + str(i).encode())
+
+            r = session.get(f"http://localhost:{port}")
+            self.assertEqual(r.status_code, 404)
+
+            r = session.get(f"http://localhost:{port}/no-response")
+            self.assertEqual(r.status_code, 500)
+            self.assertEqual(_effects_processes[eff_resp["server_uuid"]]["open_requests"], {})
+
+        # Pipelined requests are answered in order
+        import socket
+        with socket.create_connection(("localhost", port)) as sock:
+            sock.sendall(b"POST /test-url HTTP/1.1\r\nContent-Length: 1\r\n\r\na"
+                         b"POST /test-url HTTP/1.1\r\nContent-Length: 1\r\n\r\nb"
+                         b"GET /test-url HTTP/1.1\r\nConnection: close\r\n\r\n")
+            data = b""
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+        self.assertEqual(data.count(b"HTTP/1.1 200"), 3)
+        self.assertLess(data.index(payload + b"a"), data.index(payload + b"b"))
+
+        {
+            "type": FX.HTTP.StopServer,
+            "server_uuid": eff_resp["server_uuid"],
+        } | run
+    def test_http_streaming(self):
+        from zef.core.fx.http import send_response, middleware_worker, fallback_not_found, route
+        import io
+
+        def echo(query):
+            body = query["request_body"]
+            if not isinstance(body, bytes):
+                body = body.read()
+            return {**query, "response_body": body}
+
+        for port,engine,stream_request_body in [(4992, "threading", False), (4993, "asyncio", True)]:
+            eff = {
+                'type': FX.HTTP.StartServer,
+                'port': port,
+                'engine': engine,
+                'stream_request_body': stream_request_body,
+                'pipe_into': (map[middleware_worker[route["/echo"][echo],
+                                                    route["/generated"][lambda query: {**query, "response_body": (b"x" * 1000 for _ in range(1000))}],
+                                                    route["/file"][lambda query: {**query, "response_body": io.BytesIO(b"f" * 300000)}],
+                                                    fallback_not_found,
+                                                    send_response]]
+                              | subscribe[run]),
+                'bind_address': "localhost",
+            }
+            eff_resp = eff | run
+
+            import requests
+            r = requests.get(f"http://localhost:{port}/generated")
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual(r.headers["Transfer-Encoding"], "chunked")
+            self.assertEqual(r.content, b"x" * 1000000)
+
+            r = requests.get(f"http://localhost:{port}/file")
+            self.assertEqual(r.content, b"f" * 300000)
+
+            # A chunked request body
+            r = requests.post(f"http://localhost:{port}/echo", data=iter([b"a" * 100000, b"b", b"c"]))
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual(r.content, b"a" * 100000 + b"bc")
+
+            r = requests.post(f"http://localhost:{port}/echo", data=b"plain")
+            self.assertEqual(r.content, b"plain")
+
+            {
+                "type": FX.HTTP.StopServer,
+                "server_uuid": eff_resp["server_uuid"],
+            } | run
 
 if __name__ == '__main__':
     unittest.main()
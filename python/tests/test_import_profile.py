@@ -0,0 +1,48 @@
+# Copyright 2022 Synchronous Technologies Pte Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest  # pytest takes ages to run anything as soon as anything from zef is imported
+import subprocess
+import sys
+import json
+
+class MyTestCase(unittest.TestCase):
+
+    def test_import_profile(self):
+        # Run in a fresh interpreter, as other tests may have imported the
+        # optional dependencies already.
+        script = """
+import sys, json
+import zef
+prof = zef.import_profile()
+lazy = ["pandas", "yaml", "toml", "rx", "dateparser", "watchdog", "ariadne"]
+print(json.dumps({"names": [name for name,_ in prof["modules"]],
+                  "total": prof["total"],
+                  "loaded": [name for name in lazy if name in sys.modules]}))
+"""
+        out = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True)
+        res = json.loads(out.stdout.strip().splitlines()[-1])
+        self.assertEqual(res["names"][0], "zef")
+        self.assertIn("zef.core", res["names"])
+        self.assertGreater(res["total"], 0)
+        self.assertEqual(res["loaded"], [])
+
+    def test_lazy_import(self):
+        from zef import lazy_import
+        mod = lazy_import("zef.core.fx.local_file")
+        self.assertTrue(hasattr(mod, "monitor_path_handler"))
+        self.assertIn("zef.core.fx.local_file", repr(mod))
+
+if __name__ == '__main__':
+    unittest.main()
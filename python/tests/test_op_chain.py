@@ -0,0 +1,90 @@
+# Copyright 2022 Synchronous Technologies Pte Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest  # pytest takes ages to run anything as soon as anything from zef is imported
+from zef import *
+from zef.ops import *
+from zef.core.op_structs import compile_op_chain
+
+
+class MyTestCase(unittest.TestCase):
+    def test_compiled_chain_matches_interpreted(self):
+        from zef.core.op_structs import LazyValue_
+        for x,op_chain in [(42, add[1] | multiply[2]),
+                           ([1,2,3,4], map[add[1]] | filter[greater_than[2]] | collect | sum),
+                           ([], map[add[1]])]:
+            lv = LazyValue_(x)
+            lv.el_ops = CollectingOp(op_chain)
+            self.assertEqual(lv.evaluate(), lv.evaluate_interpreted())
+
+    def test_compiled_plan_is_reused(self):
+        self.assertEqual(41 | add[1] | multiply[2] | collect, 84)
+        plan = compile_op_chain((add[5] | multiply[3] | collect).el_ops)
+        self.assertIsNotNone(plan)
+        self.assertEqual(len(plan), 2)
+        self.assertIsNone(plan[0][2])
+        self.assertIs(plan, compile_op_chain((add[1] | multiply[2] | collect).el_ops))
+        # The curried arguments come from the evaluated chain, not the plan
+        self.assertEqual(1 | add[5] | multiply[3] | collect, 18)
+
+    def test_fused_elementwise_ops(self):
+        plan = compile_op_chain((map[add[1]] | filter[greater_than[2]] | map[multiply[2]] | take[3] | sum).el_ops)
+        self.assertEqual(len(plan), 2)
+        self.assertEqual(len(plan[0][2]), 4)
+
+        self.assertEqual(range(10) | map[add[1]] | filter[greater_than[2]] | map[multiply[2]] | take[3] | collect, [6, 8, 10])
+        self.assertEqual([1,2,3,4,5] | skip[1] | take_while[less_than[4]] | map[add[1]] | collect, [3, 4])
+        self.assertEqual([1,2,3] | map[add[1]] | take[0] | collect, [])
+        self.assertEqual([1,2,3] | skip[5] | map[add[1]] | collect, [])
+        # The same as the individual op
+        self.assertEqual([1,2,3] | skip[5] | collect, [])
+
+        # Inputs the fused loop does not handle go through the individual ops
+        self.assertEqual("hello" | skip[1] | take[3] | collect, "ell")
+        self.assertEqual([1,2,3,4] | map[add[1]] | take[-2] | collect, (4, 5))
+
+    def test_fused_take_does_not_overpull(self):
+        seen = []
+        def record(x):
+            seen.append(x)
+            return x
+        self.assertEqual(range(100) | map[record] | take[2] | collect, [0, 1])
+        self.assertEqual(seen, [0, 1])
+
+    def test_fused_errors_name_the_failing_op(self):
+        import zef
+        from zef.core._error import ExceptionWrapper
+        if not zef.core._error.custom_error_handling_activated():
+            self.skipTest("Needs zef error handling")
+        def fail_on_3(x):
+            if x == 3:
+                raise ValueError("boom")
+            return True
+        with self.assertRaises(ExceptionWrapper) as cm:
+            [1,2,3,4] | map[add[1]] | filter[fail_on_3] | map[add[1]] | collect
+        # The contexts of the failing op and those after it, as without fusing
+        op_is = [context["op_i"] for context in cm.exception.wrapped.contexts if "op_i" in context]
+        self.assertEqual(op_is, [2, 1])
+
+    def test_run_is_not_compiled(self):
+        self.assertIsNone(compile_op_chain(run[print].el_ops))
+
+    def test_compiled_chain_errors(self):
+        with self.assertRaises(Exception):
+            "a" | add[1] | collect
+
+
+if __name__ == '__main__':
+    unittest.main()
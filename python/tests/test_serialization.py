@@ -17,6 +17,17 @@ from zef import *
 from zef.ops import *
 
 
+def comparable(v):
+    # FlatGraphs don't define equality, so compare their contents
+    from zef.core.flat_graph import FlatGraph_
+    if isinstance(v, FlatGraph_):
+        return ("FlatGraph", v.key_dict, tuple(v.blobs))
+    if type(v) in (list, tuple):
+        return type(v)(comparable(x) for x in v)
+    if type(v) == dict:
+        return {k: comparable(x) for k,x in v.items()}
+    return v
+
 class MyTestCase(unittest.TestCase):
     def test_serialization(self):
         from zef.core.graph_delta import PleaseAssign
@@ -41,5 +52,85 @@ class MyTestCase(unittest.TestCase):
         for item in to_check:
             self.assertEqual(deserialize(serialize(item)), item)
 
+    def test_binary_serialization(self):
+        from zef.core.serialization import serialize_binary, deserialize_binary
+
+        g = Graph()
+        z = ET.Machine | g | run
+        a,b,c = (z, RT.Something, "data") | g | run
+
+        fg = FlatGraph()
+        fg = fg | insert[ET.Person["p"]] | insert[(Any["p"], RT.Name, "name")] | collect
+
+        to_check = [
+            None, True, False, 0, 1, -1, 2**70, -2**70, 1.5, "", "unicode \u2603",
+            b"", b"raw \x00\xff bytes",
+            [1, [2, (3, 4)], {"a": b"x"}],
+            {"_zeftype": "not a zeftype", 5: None},
+            z, a, discard_frame(c), uid(z), RT.Something, ET.Machine,
+            {"key": 5, z: ([z,z,(z,z),[z,z], {z: z}], z)},
+            fg,
+            [fg, fg],
+        ]
+        for item in to_check:
+            data = serialize_binary(item)
+            self.assertIsInstance(data, bytes)
+            self.assertEqual(comparable(deserialize_binary(data)), comparable(item))
+            self.assertEqual(comparable(deserialize_binary(data)), comparable(deserialize(serialize(item))))
+
+        # Type tags and field names are only written once
+        many = serialize_binary([z] * 100)
+        self.assertLess(len(many), 100 * len(serialize_binary(z)))
+
+        with self.assertRaises(Exception):
+            deserialize_binary(b"not zef")
+
+    def test_streaming_serialization(self):
+        from zef.core.serialization import serialize_binary, serialize_iter, serialize_to_stream, deserialize_stream
+        import io
+
+        g = Graph()
+        z = ET.Machine | g | run
+
+        fg = FlatGraph()
+        for i in range(50):
+            fg = fg | insert[ET.Person[f"p{i}"]] | insert[(Any[f"p{i}"], RT.Name, f"name {i}")] | collect
+
+        to_check = [
+            5, "string", b"x" * 1000,
+            [1, [2, (3, b"y" * 500)], {"a": list(range(100))}],
+            {z: [z] * 10},
+            fg,
+        ]
+        for item in to_check:
+            for chunk_size in [1, 64, 4096]:
+                chunks = list(serialize_iter(item, chunk_size))
+                # The same bytes as the in-memory encoder
+                self.assertEqual(b"".join(chunks), serialize_binary(item))
+                self.assertEqual(comparable(list(deserialize_stream(iter(chunks), chunk_size))), comparable([item]))
+                self.assertEqual(comparable(list(deserialize_stream(io.BytesIO(b"".join(chunks)), chunk_size))), comparable([item]))
+
+        # Chunks stay close to the chunk size
+        chunks = list(serialize_iter(fg, 256))
+        self.assertGreater(len(chunks), 1)
+        self.assertLess(max(len(chunk) for chunk in chunks), 1024)
+
+        # A columnar FlatGraph is streamed without materializing its blobs
+        from zef.core.flat_graph import FlatGraph_
+        col_fg = FlatGraph_(fg.to_columns())
+        chunks = list(serialize_iter(col_fg, 256))
+        self.assertIsNone(col_fg._blobs)
+        self.assertEqual(b"".join(chunks), serialize_binary(fg))
+
+        # Several values in one stream
+        f = io.BytesIO()
+        for item in to_check:
+            serialize_to_stream(item, f, 100)
+        f.seek(0)
+        self.assertEqual(comparable(list(deserialize_stream(f, 100))), comparable(to_check))
+
+        with self.assertRaises(Exception):
+            list(deserialize_stream(serialize_binary([1,2,3])[:-1]))
+
 if __name__ == '__main__':
     unittest.main()
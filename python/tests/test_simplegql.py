@@ -276,6 +276,534 @@ testString: ""
         self.assertEqual(r.status_code, 400)
 
 
+class QueryCacheTestCase(unittest.TestCase):
+    def test_lru_eviction(self):
+        from zef.graphql.simplegql.server2 import QueryResultCache
+        cache = QueryResultCache(max_entries=2)
+        cache.put(1, "a", {"data": "a"})
+        cache.put(1, "b", {"data": "b"})
+        # Using "a" makes "b" the least recently used
+        self.assertEqual(cache.get(1, "a"), {"data": "a"})
+        cache.put(1, "c", {"data": "c"})
+        self.assertIsNone(cache.get(1, "b"))
+        self.assertEqual(cache.get(1, "a"), {"data": "a"})
+        self.assertEqual(cache.get(1, "c"), {"data": "c"})
+        stats = cache.stats()
+        self.assertEqual(stats["entries"], 2)
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["hits"], 3)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_byte_limit(self):
+        import json
+        from zef.graphql.simplegql.server2 import QueryResultCache
+        data = {"data": "x"*100}
+        size = len(json.dumps(data))
+        cache = QueryResultCache(max_bytes=2*size + size//2)
+        for key in ["a", "b", "c"]:
+            cache.put(1, key, data)
+            self.assertLessEqual(cache.stats()["bytes"], cache.max_bytes)
+        self.assertIsNone(cache.get(1, "a"))
+        self.assertEqual(cache.get(1, "c"), data)
+        self.assertEqual(cache.stats()["entries"], 2)
+
+        # Replacing an entry doesn't count its old size
+        cache.put(1, "c", data)
+        self.assertEqual(cache.stats()["bytes"], 2*size)
+
+        # An entry larger than the whole cache is not stored, and doesn't
+        # evict anything
+        cache.put(1, "huge", {"data": "x"*(3*size)})
+        self.assertIsNone(cache.get(1, "huge"))
+        self.assertEqual(cache.stats()["entries"], 2)
+
+    def test_invalidation(self):
+        from zef.graphql.simplegql.server2 import QueryResultCache
+        cache = QueryResultCache()
+        cache.put(1, "a", {"data": "a"})
+        self.assertEqual(cache.get(1, "a"), {"data": "a"})
+        # A newer slice drops everything cached for the older one
+        self.assertIsNone(cache.get(2, "a"))
+        self.assertEqual(cache.stats()["invalidations"], 1)
+        self.assertEqual(cache.stats()["entries"], 0)
+        self.assertEqual(cache.stats()["bytes"], 0)
+
+        # A query still running on an older slice neither drops nor adds
+        # entries
+        cache.put(2, "a", {"data": "a2"})
+        cache.put(1, "a", {"data": "a1"})
+        self.assertIsNone(cache.get(1, "a"))
+        self.assertEqual(cache.get(2, "a"), {"data": "a2"})
+        self.assertEqual(cache.stats()["invalidations"], 1)
+        self.assertEqual(cache.stats()["entries"], 1)
+
+    def test_keys(self):
+        from zef.graphql.simplegql.server2 import QueryResultCache, is_read_only_query
+        cache = QueryResultCache()
+        q = {"query": "query { a b }"}
+        self.assertEqual(cache.make_key(1, q, None),
+                         cache.make_key(1, {"query": "query {\n  a\n  b\n}"}, None))
+        self.assertNotEqual(cache.make_key(1, q, None), cache.make_key(2, q, None))
+        self.assertNotEqual(cache.make_key(1, q, None), cache.make_key(1, q, {"email": "x"}))
+        self.assertNotEqual(cache.make_key(1, q, None),
+                            cache.make_key(1, {**q, "variables": {"x": 1}}, None))
+        self.assertIsNone(cache.make_key(1, {"query": "query {"}, None))
+
+        self.assertTrue(is_read_only_query(q, cache))
+        self.assertTrue(is_read_only_query({"query": "{ a }"}, cache))
+        self.assertFalse(is_read_only_query({"query": "mutation { a }"}, cache))
+        self.assertFalse(is_read_only_query({"query": "query A { a } mutation B { a }"}, cache))
+        self.assertFalse(is_read_only_query({"query": "query {"}, cache))
+        self.assertFalse(is_read_only_query("query { a }", cache))
+
+    def test_query_caching(self):
+        import json
+        from ariadne import QueryType, MutationType, make_executable_schema
+        from zef.graphql.simplegql.server2 import QueryResultCache, query
+
+        g_data = Graph()
+        g_schema = Graph()
+        root = ET.GQL_Root | g_schema | run
+        calls = {"query": 0, "mutation": 0}
+
+        query_type = QueryType()
+        @query_type.field("sliceIndex")
+        def resolve_slice_index(_, info):
+            calls["query"] += 1
+            return graph_slice_index(info.context["gs"])
+        mutation_type = MutationType()
+        @mutation_type.field("bump")
+        def resolve_bump(_, info):
+            calls["mutation"] += 1
+            ET.Bump | g_data | run
+            return True
+        schema = make_executable_schema("type Query { sliceIndex: Int } type Mutation { bump: Boolean }",
+                                        query_type, mutation_type)
+
+        context = {
+            "z_gql_root": root,
+            "g_data": g_data,
+            "ari_schema": schema,
+            "debug_level": -1,
+            "read_only": False,
+            "field_index": None,
+            "query_cache": QueryResultCache(),
+        }
+        def run_query(body):
+            r = query({"method": "POST", "request_body": json.dumps(body)}, context)
+            return json.loads(r["response_body"])
+
+        read = {"query": "query { sliceIndex }"}
+        mutate = {"query": "mutation { bump }"}
+
+        first = run_query(read)
+        self.assertEqual(run_query(read), first)
+        self.assertEqual(calls["query"], 1)
+
+        # Mutations are never cached, and invalidate through the new slice
+        run_query(mutate)
+        run_query(mutate)
+        self.assertEqual(calls["mutation"], 2)
+        after = run_query(read)
+        self.assertEqual(calls["query"], 2)
+        self.assertEqual(after["data"]["sliceIndex"], first["data"]["sliceIndex"] + 2)
+        self.assertEqual(context["query_cache"].stats()["entries"], 1)
+
+        # Within a batch, queries after a mutation see its changes
+        out = run_query([read, mutate, read])
+        self.assertEqual(out[0], after)
+        self.assertEqual(out[2]["data"]["sliceIndex"], after["data"]["sliceIndex"] + 1)
+        self.assertEqual(calls["mutation"], 3)
+
+
+items_schema = """
+# Zef.SchemaVersion: v1
+# Zef.Authentication: {"Algo": "HS256", "VerificationKey": "unused", "Audience": "test", "Header": "X-Auth-Token"}
+
+type Item
+  @auth(
+    add: "True"
+    update: "True"
+    delete: "True"
+    query: "context['auth_checks'].append(z) or z | F.Owner | collect == auth['owner']"
+  )
+  @upfetch(field: "code")
+ {
+  code: String! @unique @search
+  category: String @search
+  rank: Int @search
+  owner: String
+  tags: [Tag]
+}
+
+type Tag {
+  name: String @search
+  weight: Int
+  related: [Tag]
+}
+"""
+
+items_data = [
+    {"code": "a1", "category": "red", "rank": 3, "owner": "alice",
+     "tags": [{"name": "t1", "weight": 1, "related": [{"name": "t2", "weight": 2}, {"name": "t3"}]},
+              {"name": "t4", "weight": 4}]},
+    {"code": "a2", "category": "blue", "rank": 1, "owner": "bob"},
+    {"code": "a3", "category": "red", "rank": 2, "owner": "alice",
+     "tags": [{"name": "t5", "related": [{"name": "t6", "weight": 6}]}]},
+    {"code": "a4", "category": "green", "rank": 3, "owner": "bob"},
+    {"code": "a5", "category": "red", "rank": 3, "owner": "alice"},
+    {"code": "a6", "category": "blue", "rank": 2, "owner": "alice", "tags": [{"name": "t7", "weight": 7}]},
+    {"code": "a7", "rank": 1, "owner": "alice"},
+    {"code": "a8", "category": "red", "rank": 2, "owner": "bob"},
+]
+
+def gql_value(v):
+    if type(v) == dict:
+        return "{" + ", ".join(f"{k}: {gql_value(x)}" for k,x in v.items()) + "}"
+    if type(v) == list:
+        return "[" + ", ".join(gql_value(x) for x in v) + "]"
+    import json
+    return json.dumps(v)
+
+def full_scan():
+    """Disables the index-backed planning and the top-k selection, so queries
+    go through the plain filter and sort."""
+    from unittest import mock
+    from contextlib import ExitStack
+    from zef.graphql.simplegql import generate_api2 as api
+    def sort_and_take(opts, z_node, info, sort_decl, k):
+        return api.maybe_sort_result(opts, z_node, info, sort_decl) | take[k] | collect
+    stack = ExitStack()
+    stack.enter_context(mock.patch.object(api, "plan_initial_list", lambda *args: None))
+    stack.enter_context(mock.patch.object(api, "maybe_top_k_result", sort_and_take))
+    return stack
+
+class ItemsTestCase(unittest.TestCase):
+    # Runs queries against the generated schema directly, without a server.
+    def setUp(self):
+        from zef.graphql.simplegql.main import create_schema_graph
+        from zef.graphql.simplegql.generate_api2 import generate_resolvers_fcts
+        from zef.graphql import make_graphql_api
+        self.root = create_schema_graph(items_schema)
+        self.g_data = Graph()
+        self.ari_schema = make_graphql_api(generate_resolvers_fcts(self.root))
+        self.field_index = None
+        self.auth_checks = []
+
+        self.old_error_value = zef.core._error.custom_error_handling
+        zef.core._error.custom_error_handling = False
+
+        data = self.run_query("mutation { addItem(input: " + gql_value(items_data) + ") { count } }")
+        self.assertEqual(data["addItem"]["count"], len(items_data))
+
+    def tearDown(self):
+        zef.core._error.custom_error_handling = self.old_error_value
+
+    def run_query(self, query, owner="alice", expect_errors=False):
+        from ariadne import graphql_sync
+        self.auth_checks.clear()
+        self.context = {"gs": now(self.g_data),
+                        "auth": {"owner": owner},
+                        "debug_level": -1,
+                        "read_only": False,
+                        "field_index": self.field_index,
+                        "auth_checks": self.auth_checks}
+        success,data = graphql_sync(self.ari_schema, {"query": query}, context_value=self.context)
+        if expect_errors:
+            self.assertIn("errors", data)
+            return data
+        self.assertTrue(success)
+        self.assertNotIn("errors", data)
+        return data["data"]
+
+    def item_type(self):
+        return self.root | Outs[RT.GQL_Type] | filter[F.Name | equals["Item"]] | single | collect
+
+    def start_field_index(self):
+        from zef.graphql.simplegql.generate_api2 import FieldValueIndex
+        self.field_index = FieldValueIndex(self.root).start(self.g_data)
+        self.wait_for_index()
+
+    def wait_for_index(self):
+        # The index is updated from a graph subscription
+        import time
+        for _ in range(500):
+            if self.field_index.in_sync(now(self.g_data)):
+                return
+            time.sleep(0.01)
+        self.fail("The field index didn't catch up with the data graph")
+
+planned_queries = [
+    'queryItem(filter: {code: {eq: "a3"}})',
+    'queryItem(filter: {code: {in: ["a1", "a4", "a6", "missing"]}})',
+    'queryItem(filter: {rank: {between: {min: 2, max: 3}}})',
+    'queryItem(filter: {category: {eq: "red"}, rank: {between: {min: 1, max: 2}}})',
+    'queryItem(filter: {and: [{category: {in: ["red", "blue"]}}, {rank: {eq: 3}}]})',
+    'queryItem(filter: {category: {eq: "red"}, or: [{rank: {eq: 3}}, {rank: {eq: 2}}]})',
+    'queryItem(filter: {category: {eq: "nothing"}})',
+    # Ties on rank are kept in the order of the stable sort
+    'queryItem(order: {desc: rank}, first: 2)',
+    'queryItem(order: {desc: rank, then: {asc: code}}, first: 3)',
+    'queryItem(order: {asc: rank}, first: 2, offset: 1)',
+    'queryItem(order: {asc: rank}, first: 0)',
+    'queryItem(filter: {category: {eq: "red"}}, order: {desc: rank}, first: 2)',
+    'queryItem(filter: {rank: {between: {min: 1, max: 3}}}, order: {desc: rank, then: {desc: code}}, first: 10)',
+]
+
+@unittest.skip("SimpleGQL doesn't work with atoms yet")
+class PlanningTestCase(ItemsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.start_field_index()
+
+    def test_planned_queries_match_scan(self):
+        for q in planned_queries:
+            for owner in ["alice", "bob"]:
+                query = "query { " + q + " { code rank } }"
+                with full_scan():
+                    expected = self.run_query(query, owner)
+                self.assertEqual(self.run_query(query, owner), expected, f"{q} for {owner}")
+
+    def test_auth_after_filter(self):
+        data = self.run_query('query { queryItem(filter: {category: {eq: "red"}}) { code } }')
+        self.assertEqual(sorted(x["code"] for x in data["queryItem"]), ["a1", "a3", "a5"])
+        # Only the red items are checked, not every item
+        self.assertEqual(len(self.auth_checks), 4)
+
+        data = self.run_query('query { queryItem(filter: {code: {eq: "a2"}}) { code } }')
+        self.assertEqual(data["queryItem"], [])
+        self.assertEqual(len(self.auth_checks), 1)
+
+        data = self.run_query('query { queryItem(filter: {code: {eq: "a2"}}) { code } }', owner="bob")
+        self.assertEqual(data["queryItem"], [{"code": "a2"}])
+        self.assertEqual(len(self.auth_checks), 1)
+
+
+@unittest.skip("SimpleGQL doesn't work with atoms yet")
+class FieldIndexTestCase(ItemsTestCase):
+    def setUp(self):
+        super().setUp()
+        from zef.graphql.simplegql.generate_api2 import get_field_rel_by_name
+        self.start_field_index()
+        self.code_field = get_field_rel_by_name(self.item_type(), "code")
+
+    def lookup_codes(self, code):
+        gs = now(self.g_data)
+        view = self.field_index.field(gs, self.item_type(), self.code_field)
+        return sorted(gs[ent_uid] | F.Code | collect for ent_uid in view.eq(code))
+
+    def assert_queries_match_scan(self):
+        for q in planned_queries:
+            for owner in ["alice", "bob"]:
+                query = "query { " + q + " { code rank } }"
+                with full_scan():
+                    expected = self.run_query(query, owner)
+                self.assertEqual(self.run_query(query, owner), expected, f"{q} for {owner}")
+
+    def test_eq_after_mutations(self):
+        self.wait_for_index()
+        self.assertEqual(self.lookup_codes("a1"), ["a1"])
+
+        self.run_query('mutation { updateItem(input: {filter: {code: {eq: "a1"}}, set: {code: "b1"}}) { count } }')
+        self.wait_for_index()
+        self.assertEqual(self.lookup_codes("a1"), [])
+        self.assertEqual(self.lookup_codes("b1"), ["b1"])
+
+        self.run_query('mutation { deleteItem(filter: {code: {eq: "a3"}}) { count } }')
+        self.wait_for_index()
+        self.assertEqual(self.lookup_codes("a3"), [])
+
+        self.run_query('mutation { addItem(input: [{code: "a9", category: "red", rank: 3, owner: "alice"}]) { count } }')
+        self.wait_for_index()
+        self.assertEqual(self.lookup_codes("a9"), ["a9"])
+
+        self.assert_queries_match_scan()
+        data = self.run_query('query { queryItem(filter: {code: {in: ["a1", "b1", "a3", "a9"]}}) { code } }')
+        self.assertEqual(sorted(x["code"] for x in data["queryItem"]), ["a9", "b1"])
+
+    def test_upfetch_and_unique(self):
+        self.wait_for_index()
+        data = self.run_query('mutation { upfetchItem(input: [{code: "a2", category: "pink", rank: 5, owner: "bob"}]) { count } }', owner="bob")
+        self.assertEqual(data["upfetchItem"]["count"], 0)
+        self.wait_for_index()
+        self.assertEqual(self.lookup_codes("a2"), ["a2"])
+        data = self.run_query('query { queryItem(filter: {code: {eq: "a2"}}) { category rank } }', owner="bob")
+        self.assertEqual(data["queryItem"], [{"category": "pink", "rank": 5}])
+
+        data = self.run_query('mutation { upfetchItem(input: [{code: "a9", owner: "alice"}]) { count } }')
+        self.assertEqual(data["upfetchItem"]["count"], 1)
+        self.wait_for_index()
+        self.assertEqual(self.lookup_codes("a9"), ["a9"])
+        self.assertEqual(now(self.g_data) | all[ET.Item] | length | collect, len(items_data) + 1)
+
+        data = self.run_query('mutation { addItem(input: [{code: "a2", owner: "bob"}]) { count } }', owner="bob", expect_errors=True)
+        self.assertIn("Non-unique", data["errors"][0]["message"])
+        self.wait_for_index()
+        self.assertEqual(self.lookup_codes("a2"), ["a2"])
+
+    def test_lagging_index(self):
+        self.wait_for_index()
+        old_gs = now(self.g_data)
+        self.run_query('mutation { addItem(input: [{code: "a9", category: "red", rank: 1, owner: "alice"}]) { count } }')
+        self.wait_for_index()
+
+        # Pretend the index missed the last transaction. Queries and upfetches
+        # must not use it, but fall back to scanning the slice.
+        self.field_index.rebuild(old_gs)
+        self.assertFalse(self.field_index.in_sync(now(self.g_data)))
+        self.assert_queries_match_scan()
+        data = self.run_query('query { queryItem(filter: {code: {eq: "a9"}}) { code } }')
+        self.assertEqual(data["queryItem"], [{"code": "a9"}])
+
+        data = self.run_query('mutation { upfetchItem(input: [{code: "a9", rank: 2}]) { count } }')
+        self.assertEqual(data["upfetchItem"]["count"], 0)
+        self.assertEqual(now(self.g_data) | all[ET.Item] | length | collect, len(items_data) + 1)
+
+        # Seeing a transaction after a gap rebuilds the index
+        self.wait_for_index()
+        self.assertEqual(self.lookup_codes("a9"), ["a9"])
+        self.assert_queries_match_scan()
+
+class FieldValueIndexTestCase(unittest.TestCase):
+    # Uses a hand-built schema graph, so that this doesn't depend on the
+    # schema parser.
+    def setUp(self):
+        from zef.graphql.simplegql.generate_api2 import get_field_rel_by_name
+        g_schema = Graph()
+        r = [
+            ET.GQL_Root["root"],
+            (ET.GQL_Type["item"], RT.Name, "Item"),
+            (Z["root"], RT.GQL_Type, Z["item"]),
+            (Z["item"], RT.GQL_Delegate, delegate_of(ET.Item)),
+            AET.String["string"],
+            (Z["item"], RT.GQL_Field["code"], Z["string"]),
+            (Z["code"], RT.Name, "code"),
+            (Z["code"], RT.Unique, True),
+            (Z["code"], RT.GQL_Resolve_With, delegate_of(RT.Code)),
+        ] | transact[g_schema] | run
+        self.root = r["root"] | now | collect
+        self.type_node = r["item"] | now | collect
+        self.code_field = get_field_rel_by_name(self.type_node, "code")
+
+        self.g = Graph()
+        r = [
+            (ET.Item["a"], RT.Code, "a1"),
+            (ET.Item["b"], RT.Code, "b1"),
+            ET.Item["c"],
+        ] | transact[self.g] | run
+        self.a, self.b, self.c = (r[name] | now | collect for name in "abc")
+
+    def apply(self, index, actions):
+        r = actions | transact[self.g] | run
+        gs = now(self.g)
+        index._apply_transaction(gs, gs | to_tx | collect)
+        return r
+
+    def lookup(self, index, *vals):
+        return index.lookup(now(self.g), uid(self.code_field), vals)
+
+    def test_apply_transaction(self):
+        from zef.graphql.simplegql.generate_api2 import FieldValueIndex, FieldIndexOutOfSync
+        index = FieldValueIndex(self.root)
+        old_gs = now(self.g)
+        index.rebuild(old_gs)
+        self.assertTrue(index.in_sync(old_gs))
+        self.assertEqual(self.lookup(index, "a1"), {origin_uid(self.a)})
+        self.assertEqual(self.lookup(index, "a1", "b1", "missing"), {origin_uid(self.a), origin_uid(self.b)})
+
+        r = self.apply(index, [
+            now(self.a) | set_field[RT.Code]["a2"][False],
+            terminate(now(self.b)),
+            now(self.c) | set_field[RT.Code]["c1"][False],
+            (ET.Item["d"], RT.Code, "d1"),
+        ])
+        self.assertTrue(index.in_sync(now(self.g)))
+        self.assertEqual(self.lookup(index, "a1", "b1"), set())
+        self.assertEqual(self.lookup(index, "a2"), {origin_uid(self.a)})
+        self.assertEqual(self.lookup(index, "c1"), {origin_uid(self.c)})
+        self.assertEqual(self.lookup(index, "d1"), {origin_uid(r["d"])})
+        self.assertEqual(index.lookup_between(now(self.g), uid(self.code_field), "a", "c9"),
+                         {origin_uid(self.a), origin_uid(self.c)})
+
+        # Lookups are only answered for the slice the index describes
+        with self.assertRaises(FieldIndexOutOfSync):
+            index.lookup(old_gs, uid(self.code_field), ["a1"])
+
+        # Removing the field removes the value
+        rel = now(self.a) | out_rel[RT.Code] | collect
+        self.apply(index, [terminate(rel), terminate(target(rel))])
+        self.assertEqual(self.lookup(index, "a2"), set())
+
+    def test_plan_initial_list(self):
+        from types import SimpleNamespace
+        from zef.graphql.simplegql.generate_api2 import FieldValueIndex, plan_initial_list
+        fil = {"code": {"in": ["a1", "b1"]}}
+        def plan(field_index):
+            info = SimpleNamespace(context={"gs": now(self.g), "field_index": field_index})
+            return plan_initial_list(self.type_node, fil, info)
+
+        # Without an index the type is scanned
+        self.assertIsNone(plan(None))
+
+        index = FieldValueIndex(self.root)
+        index.rebuild(now(self.g))
+        self.assertEqual(plan(index), [now(self.a), now(self.b)])
+
+        # Nor is an index used that lags the queried slice
+        ET.Item | self.g | run
+        self.assertIsNone(plan(index))
+
+    def test_unique_check(self):
+        from types import SimpleNamespace
+        from zef.graphql.simplegql.generate_api2 import FieldValueIndex, field_index_duplicates
+        index = FieldValueIndex(self.root)
+        gs = now(self.g)
+        index.rebuild(gs)
+        info = SimpleNamespace(context={"gs": gs, "field_index": index})
+
+        # The checks only need the values written by the transaction and the
+        # index of the slice before it.
+        r = [now(self.c) | set_field[RT.Code]["c1"][False],
+             (ET.Item["d"], RT.Code, "b1")] | transact[self.g] | run
+        post_checks = [("update", self.c, self.type_node), ("add", "d", self.type_node)]
+        self.assertEqual(field_index_duplicates(self.code_field, self.type_node, post_checks, r, self.g, info), {"b1"})
+
+        # Swapping values between entities is fine
+        gs = now(self.g)
+        index.rebuild(gs)
+        info = SimpleNamespace(context={"gs": gs, "field_index": index})
+        r = [now(self.a) | set_field[RT.Code]["c1"][False],
+             now(self.c) | set_field[RT.Code]["a1"][False]] | transact[self.g] | run
+        post_checks = [("update", self.a, self.type_node), ("update", self.c, self.type_node)]
+        self.assertEqual(field_index_duplicates(self.code_field, self.type_node, post_checks, r, self.g, info), set())
+
+        # Without an index of the slice before the transaction, the caller has
+        # to scan instead
+        info = SimpleNamespace(context={"gs": now(self.g), "field_index": index})
+        self.assertIsNone(field_index_duplicates(self.code_field, self.type_node, post_checks, r, self.g, info))
+
+
+# Each query with whether some of its fields are resolved in batches
+nested_queries = [
+    ("query { queryItem { code rank tags { name weight related { name weight } } } }", True),
+    ('query { queryItem(filter: {category: {eq: "red"}}) { code tags(order: {asc: name}, first: 1) { name related { weight name } } } }', True),
+    ("query { queryItem { tags { related { related { name } } } } }", False),
+    ('mutation { upfetchItem(input: [{code: "a6", rank: 4}]) { item { code rank tags { name weight } } } }', False),
+]
+
+@unittest.skip("SimpleGQL doesn't work with atoms yet")
+class BatchedResolutionTestCase(ItemsTestCase):
+    def test_nested_lists_match_per_field(self):
+        from unittest import mock
+        from zef.graphql.simplegql import generate_api2 as api
+        for q,batched in nested_queries:
+            with mock.patch.object(api, "prefetch_fields", lambda *args: None):
+                expected = self.run_query(q)
+                self.assertNotIn("field_cache", self.context)
+            self.assertEqual(self.run_query(q), expected, q)
+            if batched:
+                self.assertGreater(len(self.context["field_cache"]), 0)
+
 
 if __name__ == '__main__':
     unittest.main()
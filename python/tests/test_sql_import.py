@@ -0,0 +1,168 @@
+# Copyright 2022 Synchronous Technologies Pte Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest  # pytest takes ages to run anything as soon as anything from zef is imported
+from zef import *
+from zef.ops import *
+
+import os
+import tempfile
+
+people_csv = """id,name,city
+1,Ann,Perth
+2,Bob,Paris
+3,Cat,Perth
+4,Dan,Oslo
+5,Eve,Paris
+6,Fay,Perth
+7,Gus,
+"""
+
+cities_csv = """name,country
+Perth,Australia
+Oslo,Norway
+Paris,France
+Rome,Italy
+"""
+
+friends_csv = """a,b,since
+1,2,2001
+2,3,2002
+1,3,2003
+4,5,2004
+1,2,2005
+6,7,2006
+"""
+
+def make_decl(d):
+    files = {"people": people_csv, "cities": cities_csv, "friends": friends_csv}
+    for name,content in files.items():
+        with open(os.path.join(d, f"{name}.csv"), "w") as f:
+            f.write(content)
+    def source(name):
+        return {"type": "csv", "filename": os.path.join(d, f"{name}.csv")}
+
+    return {
+        "default_ID": "ID",
+        "definitions": [
+            {
+                "tag": "people",
+                "kind": "entity",
+                "ET": "Person",
+                "ID_col": "id",
+                "data_source": source("people"),
+                "cols": [
+                    {"name": "id", "data_type": "Int", "purpose": "id", "RT": "ID"},
+                    {"name": "name", "data_type": "String", "purpose": "field", "RT": "Name"},
+                    {"name": "city", "data_type": "String", "purpose": "entity", "ET": "City", "RT": "LivesIn"},
+                ],
+            },
+            {
+                # Cities are first created by the people referring to them
+                "tag": "cities",
+                "kind": "entity",
+                "ET": "City",
+                "ID_col": "name",
+                "data_source": source("cities"),
+                "cols": [
+                    {"name": "name", "data_type": "String", "purpose": "id", "RT": "CityName"},
+                    {"name": "country", "data_type": "String", "purpose": "field", "RT": "Country"},
+                ],
+            },
+            {
+                "tag": "friends",
+                "kind": "relation",
+                "RT": "FriendOf",
+                "data_source": source("friends"),
+                "cols": [
+                    {"name": "a", "data_type": "Int", "purpose": "source", "ET": "Person"},
+                    {"name": "b", "data_type": "Int", "purpose": "target", "ET": "Person"},
+                    {"name": "since", "data_type": "Int", "purpose": "field", "RT": "Since"},
+                ],
+            },
+        ],
+    }
+
+def is_field(rel):
+    return is_a(rae_type(target(rel)), AET)
+
+def fields(z):
+    return tuple(sorted((str(rae_type(rel)), value(target(rel)))
+                        for rel in z | out_rels | collect
+                        if is_field(rel)))
+
+def object_id(z):
+    return (str(rae_type(z)), fields(z))
+
+def graph_summary(g):
+    """A description of the graph which doesn't depend on the order or the
+    uids of its contents."""
+    gs = now(g)
+    ents = sorted(object_id(z) for et in [ET.Person, ET.City]
+                  for z in gs | all[et] | collect)
+    rels = sorted((str(rt), object_id(source(rel)), object_id(target(rel)), fields(rel))
+                  for rt in [RT.LivesIn, RT.FriendOf]
+                  for rel in gs | all[rt] | collect)
+    n_aes = sum(gs | all[aet] | length | collect for aet in [AET.Int, AET.String])
+    return ents, rels, n_aes
+
+def count(g, typ):
+    return now(g) | all[typ] | length | collect
+
+
+class MyTestCase(unittest.TestCase):
+    def test_streaming_import(self):
+        from zef.experimental.sql_import import import_actions, import_streaming
+
+        with tempfile.TemporaryDirectory() as d:
+            decl = make_decl(d)
+
+            g_ref = Graph()
+            import_actions(decl) | transact[g_ref] | run
+            expected = graph_summary(g_ref)
+            # Perth and Paris are referred to from several chunks, but are
+            # only created once, with each field once
+            self.assertEqual(count(g_ref, ET.City), 4)
+            self.assertEqual(count(g_ref, RT.CityName), 4)
+
+            for chunk_size in [1, 2, 3, 100]:
+                g = Graph()
+                progress = []
+                committed = import_streaming(decl, g, chunk_size=chunk_size, progress=progress.append)
+                self.assertEqual(graph_summary(g), expected, f"chunk_size={chunk_size}")
+                self.assertEqual(progress[-1]["rows"], 6)
+                # Only entities and relations are tracked, not their fields.
+                # The friend relations have no ID column, so are only named
+                # by their row and not tracked either.
+                self.assertEqual(len(committed),
+                                 sum(count(g, typ) for typ in [ET.Person, ET.City, RT.LivesIn]))
+
+    def test_parallel_import(self):
+        from zef.experimental.sql_import import import_streaming
+
+        with tempfile.TemporaryDirectory() as d:
+            decl = make_decl(d)
+
+            g_serial = Graph()
+            committed_serial = import_streaming(decl, g_serial, chunk_size=2)
+            expected = graph_summary(g_serial)
+
+            for chunk_size in [1, 2, 100]:
+                g = Graph()
+                committed = import_streaming(decl, g, chunk_size=chunk_size, processes=2)
+                self.assertEqual(graph_summary(g), expected, f"chunk_size={chunk_size}")
+                self.assertEqual(committed.keys(), committed_serial.keys())
+
+if __name__ == '__main__':
+    unittest.main()
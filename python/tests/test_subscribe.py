@@ -85,6 +85,62 @@ class MyTestCase(unittest.TestCase):
             ("term", RT.Value),
             ("inst", RT.Value),
         ])
+
+    def test_on_dispatch(self):
+        from zef.core.op_implementations.event_dispatch import dispatcher_for, remove_stream
+        g = Graph()
+        z = ET.Machine | g | run
+        (z, RT.Name, "a") | g | run
+        z_name = z | now | Out[RT.Name] | collect
+
+        log = []
+        streams = [
+            g | on[instantiated[ET.Machine]],
+            g | on[instantiated[ET]],
+            g | on[assigned[AET.String]],
+            g | on[assigned[z_name]],
+            g | on[instantiated[(z, RT.Owner, ET)]],
+            g | on[terminated[z]],
+        ]
+        subs = [
+            streams[0] | subscribe[lambda ev: log.append(("inst", rae_type(ev.target)))],
+            streams[1] | subscribe[lambda ev: log.append(("inst ET", rae_type(ev.target)))],
+            streams[2] | subscribe[lambda ev: log.append(("assign", ev.current))],
+            streams[3] | subscribe[lambda ev: log.append(("assign z", ev.current))],
+            streams[4] | subscribe[lambda ev: log.append(("owner", rae_type(target(ev.target))))],
+            streams[5] | subscribe[lambda ev: log.append(("term", rae_type(ev.target)))],
+        ]
+        # All of the listeners share one subscription
+        self.assertEqual(dispatcher_for(g).n_listeners, 6)
+
+        ET.Machine | g | run
+        z_name | assign["b"] | g | run
+        (z, RT.Owner, ET.Person) | g | run
+        (z, RT.Owner, "c") | g | run
+        z | terminate | g | run
+
+        self.assertEqual(log, [
+            ("inst", ET.Machine),
+            ("inst ET", ET.Machine),
+            ("assign", "b"),
+            ("assign z", "b"),
+            ("inst ET", ET.Person),
+            ("owner", ET.Person),
+            ("assign", "c"),
+            ("term", ET.Machine),
+        ])
+
+        # Removing all streams ends the shared subscription
+        dispatcher = dispatcher_for(g)
+        for stream in streams[:-1]:
+            remove_stream(g, stream)
+        self.assertIs(dispatcher_for(g), dispatcher)
+        self.assertEqual(dispatcher.n_listeners, 1)
+        del log[:]
+        ET.Machine | g | run
+        self.assertEqual(log, [])
+        remove_stream(g, streams[-1])
+        self.assertIsNot(dispatcher_for(g), dispatcher)
                           
 if __name__ == '__main__':
     unittest.main()
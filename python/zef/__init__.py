@@ -19,13 +19,92 @@ __version__ = _version.get_versions()['version']
 # * Exposing common functions
 #------------------------------------------------------
 
+from time import perf_counter as _perf_counter
+
 import_order = []
+# (module name, time at which it started importing)
+_import_starts = []
+_import_finished = None
+# (module name, time taken), for modules loaded through lazy_import
+_lazy_loads = []
+
 def report_import(x):
     if x in import_order:
         return
     import_order.append(x)
+    _import_starts.append((x, _perf_counter()))
 report_import("zef")
 
+def import_profile():
+    """
+    How long `import zef` took, and where the time went. The time of each
+    module is measured from when it reported its import until the next zef
+    module did so, which includes any external packages that it imports.
+    Modules imported through `lazy_import` are listed separately, with the
+    time taken when they were first used.
+
+    ---- Examples ----
+    >>> prof = zef.import_profile()
+    >>> prof["total"]                                       # => 1.23
+    >>> sorted(prof["modules"], key=lambda x: -x[1])[:5]    # => [("zef.core.patching", 0.41), ...]
+    >>> prof["lazy"]                                        # => [("pandas", 0.62)]
+    """
+    ends = [start for _,start in _import_starts[1:]]
+    ends.append(_import_finished if _import_finished is not None else _perf_counter())
+    modules = [(name, end - start) for (name,start),end in zip(_import_starts, ends)]
+    return {
+        "total": ends[-1] - _import_starts[0][1],
+        "modules": modules,
+        "lazy": list(_lazy_loads),
+    }
+
+class LazyModule:
+    """
+    A stand-in for a module which is only imported once one of its attributes
+    is accessed. Created by lazy_import.
+    """
+    def __init__(self, name):
+        self.__dict__["_lazy_name"] = name
+        self.__dict__["_lazy_module"] = None
+
+    def _lazy_load(self):
+        module = self._lazy_module
+        if module is None:
+            import importlib, sys
+            already_loaded = self._lazy_name in sys.modules
+            start = _perf_counter()
+            module = importlib.import_module(self._lazy_name)
+            if not already_loaded:
+                _lazy_loads.append((self._lazy_name, _perf_counter() - start))
+            self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, name):
+        return getattr(self._lazy_load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._lazy_load(), name, value)
+
+    def __dir__(self):
+        return dir(self._lazy_load())
+
+    def __repr__(self):
+        if self._lazy_module is None:
+            return f"<lazy module '{self._lazy_name}' (not yet loaded)>"
+        return repr(self._lazy_module)
+
+def lazy_import(name):
+    """
+    Returns a LazyModule for the module `name`, which is imported the first
+    time it is used. This keeps heavy optional dependencies out of the
+    startup time of `import zef`.
+
+    ---- Examples ----
+    >>> pd = lazy_import("pandas")
+    >>> pd.read_csv(...)            # pandas is imported here
+    """
+    return LazyModule(name)
+
 # This set of imports is to define the order. Later imports are the ones to
 # actually provide useful exports.
 from . import core
@@ -36,6 +115,7 @@ from . import ui
 from .core import *
 
 pyzef.internals.finished_loading_python_core()
+_import_finished = _perf_counter()
 
 ############################################
 # * Starting the butler
@@ -16,5 +16,16 @@
 
 from . import make_VT
 
-from pandas import DataFrame as DataFrame_
-make_VT('DataFrame', pytype=DataFrame_)
\ No newline at end of file
+# pandas is only imported once a DataFrame is constructed. Until it is
+# imported, no value can be a DataFrame.
+import sys
+
+def DataFrame_ctor(*args, **kwargs):
+    from pandas import DataFrame as DataFrame_
+    return DataFrame_(*args, **kwargs)
+
+def DataFrame_is_a(x, typ):
+    pd = sys.modules.get("pandas", None)
+    return pd is not None and isinstance(x, pd.DataFrame)
+
+make_VT('DataFrame', constructor_func=DataFrame_ctor, is_a_func=DataFrame_is_a)
\ No newline at end of file
@@ -91,6 +91,10 @@ class ValueType_:
                 'absorbed': absorbed,
                 'alias': None,
             }
+            # Both of these are filled in lazily. _d must not be changed after
+            # either has been set.
+            self._hash = None
+            self._compiled = None
 
             if constructor_func is not None:
                 assert type_name not in _value_type_constructor_funcs
@@ -198,7 +202,9 @@ class ValueType_:
 
     def __hash__(self):
         # return hash(self._d['type_name']) ^ hash(self._d['absorbed'])
-        return hash_frozen(self._d)
+        if self._hash is None:
+            self._hash = hash_frozen(self._d)
+        return self._hash
 
 
     def __or__(self, other):
@@ -279,6 +285,12 @@ def is_type_(typ):
 
 def is_a_(obj, typ):
     assert is_type_(typ), f"Can't do a is_a_ on a non-ValueType '{typ}'"
+    compiled = typ._compiled
+    if compiled is None:
+        compiled = compile_is_a(typ)
+    return compiled.check(obj)
+
+def is_a_uncompiled(obj, typ):
     if typ._d["type_name"] in _value_type_is_a_funcs:
         out = _value_type_is_a_funcs[typ._d["type_name"]](obj, typ)
         if out is not NotImplemented:
@@ -293,6 +305,143 @@ def is_a_(obj, typ):
     else:
         raise Exception(f"ValueType '{typ._d['type_name']}' has no is_a implementation")
 
+##############################
+# * Compiled membership tests
+#----------------------------
+# isinstance checks on ValueTypes are everywhere in hot code, so each
+# ValueType_ is compiled on first use into a CompiledIsA which is kept on the
+# object. When membership only depends on the python type of the instance
+# (plain python types and Union/Intersection/Complement/Any of them), the
+# decision is cached per python type. As such types contain no values, they
+# can safely share their decisions with any structurally equal ValueType, even
+# if that was freshly constructed.
+
+_is_a_stats = {"type_hits": 0, "type_misses": 0, "predicate": 0, "compiled": 0}
+_shared_type_decisions = {}
+
+def is_a_cache_stats():
+    """Returns the counters of the compiled is_a checks:
+    - type_hits/type_misses: checks decided by the python type of the instance
+    - predicate: checks that had to run a predicate on the instance
+    - compiled: the number of ValueTypes compiled"""
+    return dict(_is_a_stats)
+
+def reset_is_a_cache_stats():
+    for key in _is_a_stats:
+        _is_a_stats[key] = 0
+
+class CompiledIsA:
+    __slots__ = ("type_test", "decisions", "pred", "partial_type_test")
+
+    def __init__(self, type_test=None, decisions=None, pred=None, partial_type_test=None):
+        # type_test: python type -> bool, if membership only depends on the
+        # python type. Otherwise pred: instance -> bool, and optionally
+        # partial_type_test: python type -> True/False/None, where None means
+        # the instance itself needs to be checked.
+        self.type_test = type_test
+        self.decisions = decisions
+        self.pred = pred
+        self.partial_type_test = partial_type_test
+
+    def type_bound(self, cls):
+        """What can be decided about membership from the python type cls
+        alone: True/False, or None if it depends on the instance."""
+        if self.type_test is not None:
+            try:
+                return self.decisions[cls]
+            except KeyError:
+                out = bool(self.type_test(cls))
+                self.decisions[cls] = out
+                return out
+        if self.partial_type_test is not None:
+            return self.partial_type_test(cls)
+        return None
+
+    def check(self, obj):
+        if self.type_test is None:
+            _is_a_stats["predicate"] += 1
+            return self.pred(obj)
+        cls = type(obj)
+        try:
+            out = self.decisions[cls]
+            _is_a_stats["type_hits"] += 1
+        except KeyError:
+            out = bool(self.type_test(cls))
+            self.decisions[cls] = out
+            _is_a_stats["type_misses"] += 1
+        return out
+
+def _plain_pytype(typ):
+    # The python type which alone decides membership of typ, if any.
+    name = typ._d["type_name"]
+    if name in _value_type_is_a_funcs or name not in _value_type_pytypes:
+        return None
+    from .helpers import remove_names
+    if len(remove_names(typ._d["absorbed"])) > 0:
+        return None
+    pytype = _value_type_pytypes[name]
+    if not isinstance(pytype, type):
+        return None
+    # A custom __instancecheck__ can depend on more than the type
+    if type(pytype).__instancecheck__ is not type.__instancecheck__:
+        return None
+    return pytype
+
+def compile_is_a(typ):
+    name = typ._d["type_name"]
+    compiled = None
+    if name in ["Union", "Intersection"]:
+        from .sets import union_validation, intersection_validation, get_union_intersection_subtypes
+        assert (union_validation if name == "Union" else intersection_validation)(typ)
+        children = [x._compiled or compile_is_a(x) for x in get_union_intersection_subtypes(typ)]
+        combine = any if name == "Union" else all
+        if all(child.type_test is not None for child in children):
+            compiled = CompiledIsA(type_test=lambda cls: combine(child.type_test(cls) for child in children))
+        else:
+            # A single child decides a Union if True or an Intersection if False
+            decisive = name == "Union"
+            def partial_type_test(cls):
+                bounds = [child.type_bound(cls) for child in children]
+                if decisive in bounds:
+                    return decisive
+                if all(bound is not None for bound in bounds):
+                    return not decisive
+                return None
+            compiled = CompiledIsA(pred=lambda obj: combine(child.check(obj) for child in children),
+                                   partial_type_test=partial_type_test)
+    elif name == "Complement":
+        from .sets import complement_validation
+        from .helpers import remove_names
+        complement_validation(typ)
+        subtype = remove_names(typ._d["absorbed"])[0]
+        child = subtype._compiled or compile_is_a(subtype)
+        if child.type_test is not None:
+            compiled = CompiledIsA(type_test=lambda cls: not child.type_test(cls))
+        else:
+            def partial_type_test(cls):
+                bound = child.type_bound(cls)
+                return None if bound is None else not bound
+            compiled = CompiledIsA(pred=lambda obj: not child.check(obj),
+                                   partial_type_test=partial_type_test)
+    elif name == "Any" and len(typ._d["absorbed"]) == 0:
+        compiled = CompiledIsA(type_test=lambda cls: True)
+    else:
+        pytype = _plain_pytype(typ)
+        if pytype is not None:
+            compiled = CompiledIsA(type_test=lambda cls: issubclass(cls, pytype))
+        else:
+            compiled = CompiledIsA(pred=lambda obj: is_a_uncompiled(obj, typ))
+
+    if compiled.type_test is not None:
+        try:
+            compiled.decisions = _shared_type_decisions.setdefault(typ, {})
+        except TypeError:
+            compiled.decisions = {}
+
+    _is_a_stats["compiled"] += 1
+    typ._compiled = compiled
+    return compiled
+
 def is_subtype_(typ1, typ2):
     assert is_type_(typ1), f"is_subtype got a non-type: {typ1!r}"
     assert is_type_(typ2), f"is_subtype got a non-type: {typ2!r}"
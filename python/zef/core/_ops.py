@@ -16,7 +16,7 @@ from .. import report_import
 report_import("zef.core._ops")
 
 from .VT import RT
-from .op_structs import  evaluating, LazyValue, Awaitable, ZefOp, CollectingOp, SubscribingOp, ForEachingOp
+from .op_structs import  evaluating, LazyValue, Awaitable, ZefOp, CollectingOp, SubscribingOp, ForEachingOp, invalidate_compiled_op_chains
 from . import internals
 
 def register_zefop(rt, imp, tp):
@@ -30,6 +30,7 @@ def register_zefop(rt, imp, tp):
     op = ZefOp(((rt, ()),))
     globals()[op_name] = op
     _op_to_functions[rt] = (imp, tp)
+    invalidate_compiled_op_chains()
     return op
 
 
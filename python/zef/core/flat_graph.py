@@ -34,9 +34,18 @@ class FlatGraph_:
         edge_list: a list of blob indexes (integers). Positive for outgoing, negative for incoming
         origin_uid (optional)
     )
+
+    A FlatGraph can alternatively be backed by a FlatGraphColumns store, in
+    which case the blob tuples are only materialized when self.blobs is first
+    accessed. For a store opened from a file with FlatGraph.open, the
+    key_dict is also only decoded on first access and the blobs are
+    materialized one at a time.
     """
     def __init__(self, *args):
         from ._ops import insert, collect
+        self._columns = None
+        self._index = None
+        self._key_dict = None
         if args == ():
             self.key_dict = {}
             self.blobs = ()
@@ -46,11 +55,61 @@ class FlatGraph_:
             self.key_dict = new_fg.key_dict
             self.blobs = new_fg.blobs
         elif len(args) == 1 and isinstance(args[0], FlatRef_):
-            self.key_dict =  args[0].fg.key_dict
-            self.blobs = args[0].fg.blobs
+            if args[0].fg._blobs is None:
+                self._key_dict = args[0].fg._key_dict
+                self._blobs = None
+                self._columns = args[0].fg._columns
+            else:
+                self.key_dict =  args[0].fg.key_dict
+                self.blobs = args[0].fg.blobs
+            # The blobs are shared, so the index can be as well
+            self._index = args[0].fg.index()
+        elif len(args) == 1 and isinstance(args[0], FlatGraphColumns):
+            args[0].freeze()
+            # Taken from the columns on first access
+            self._key_dict = None
+            self._blobs = None
+            self._columns = args[0]
         else:
             raise NotImplementedError("FlatGraph with args")
 
+    @property
+    def key_dict(self):
+        if self._key_dict is None:
+            self._key_dict = self._columns.key_dict
+        return self._key_dict
+
+    @key_dict.setter
+    def key_dict(self, key_dict):
+        self._key_dict = key_dict
+
+    @property
+    def blobs(self):
+        if self._blobs is None:
+            self._blobs = self._columns.to_blobs()
+        return self._blobs
+
+    @blobs.setter
+    def blobs(self, blobs):
+        if self._key_dict is None and self._columns is not None:
+            self._key_dict = self._columns.key_dict
+        self._blobs = blobs
+        self._columns = None
+        self._index = None
+
+    def index(self):
+        """Returns the lazily built FlatGraphIndex of this FlatGraph."""
+        if self._index is None:
+            self._index = FlatGraphIndex(self)
+        return self._index
+
+    def to_columns(self):
+        """Returns the columnar representation of this FlatGraph."""
+        if self._columns is None:
+            self._columns = FlatGraphColumns.from_blobs(self.blobs, self.key_dict)
+            self._columns.freeze()
+        return self._columns
+
     def __repr__(self):
         kdict = "\n".join([f"({k}=>{v})" for k,v in self.key_dict.items()])
         blobs = "\n".join([str(e) for e in self.blobs])
@@ -75,7 +134,662 @@ class FlatGraph_:
         else:
             return key in self.key_dict
 
-FlatGraph = make_VT("FlatGraph", pytype=FlatGraph_)
+def FlatGraph_getattr(vt, name):
+    if name == "open":
+        return open_flatgraph
+    if name == "save":
+        return save_flatgraph
+    raise AttributeError(name)
+
+def FlatGraph_dir(vt):
+    return ["open", "save"]
+
+FlatGraph = make_VT("FlatGraph",
+                    pytype=FlatGraph_,
+                    attr_funcs=(FlatGraph_getattr, None, FlatGraph_dir))
+
+
+class FlatGraphIndex:
+    """
+    Lookup structures of a FlatGraph which are built lazily on first use:
+    1) the blob indices grouped by their exact blob type, used to answer
+       `all[selector]` by evaluating the selector once per distinct type
+    2) per blob, its relations grouped by direction and relation type, used
+       for traversals like `Outs[RT.X]`
+
+    A FlatGraph never mutates its blobs after construction (edge lists are
+    copied on write by add_blob_edge), so the index lives as long as the
+    blobs it was built from. It is only shared by FlatGraphs sharing those
+    same blobs, i.e. one made from a FlatRef with FlatGraph(ref). Graphs
+    that are merely equal, e.g. loaded twice or built by the same inserts,
+    each build their own index: keying a shared index by a hash of the
+    contents would cost a pass over all blobs, which is as much as building
+    the index in the first place.
+    """
+    def __init__(self, fg):
+        self.fg = fg
+        self._by_type = None
+        self._selections = {}
+        self._relations = {}
+
+    def by_type(self):
+        if self._by_type is None:
+            by_type = {}
+            cols = self.fg._columns
+            if cols is not None:
+                # Read the types from the columns, so that the blobs don't
+                # need to be materialized
+                type_table = cols.type_table
+                for idx,type_id in enumerate(cols.type_ids):
+                    if type_id < 0: continue
+                    by_type.setdefault(type_table[type_id], []).append(idx)
+            else:
+                for b in self.fg.blobs:
+                    if b is None: continue
+                    by_type.setdefault(b[1], []).append(b[0])
+            self._by_type = by_type
+        return self._by_type
+
+    def select(self, selector):
+        """The indices of all blobs whose type is a selector, in blob order."""
+        try:
+            return self._selections[selector]
+        except KeyError:
+            pass
+        except TypeError:
+            return self._select(selector)
+        res = self._select(selector)
+        self._selections[selector] = res
+        return res
+
+    def _select(self, selector):
+        from ._ops import is_a
+        try:
+            by_type = self.by_type()
+        except TypeError:
+            # An unhashable blob type, we can only do a linear scan
+            return tuple(b[0] for b in self.fg.blobs if b is not None and is_a(b[1], selector))
+        matching = [idxs for blob_type,idxs in by_type.items() if is_a(blob_type, selector)]
+        if len(matching) == 1:
+            return tuple(matching[0])
+        return tuple(sorted(idx for idxs in matching for idx in idxs))
+
+    def relations(self, idx, outgoing, rt):
+        """The indices of the relations of type rt going out of (or into) blob idx."""
+        grouped = self._relations.get(idx, None)
+        if grouped is None:
+            blobs = self.fg.blobs
+            grouped = {}
+            for edge in blobs[idx][2]:
+                rel_idx = abs(edge)
+                grouped.setdefault((edge > 0, blobs[rel_idx][1]), []).append(rel_idx)
+            self._relations[idx] = grouped
+        return grouped.get((outgoing, rt), [])
+
+
+def add_blob_edge(blobs, idx, edge, owned, check_present=True):
+    """
+    Appends edge to the edge list of blobs[idx] unless it is already present.
+    The blobs of a new FlatGraph start out as a shallow copy of those of
+    another FlatGraph, so edge lists are copied before their first write.
+    owned is the set of indices whose edge lists have already been copied.
+    """
+    b = blobs[idx]
+    if idx not in owned:
+        b = (b[0], b[1], [*b[2]], *b[3:])
+        blobs[idx] = b
+        owned.add(idx)
+    if not check_present or edge not in b[2]: b[2].append(edge)
+
+def remove_blob_edge(blobs, idx, edge, owned):
+    """The counterpart of add_blob_edge."""
+    b = blobs[idx]
+    if idx not in owned:
+        b = (b[0], b[1], [*b[2]], *b[3:])
+        blobs[idx] = b
+        owned.add(idx)
+    b[2].remove(edge)
+
+
+class FlatGraphBuilder:
+    """
+    Builds up a single FlatGraph from many inserts without copying the blobs
+    and key_dict on every insert, as happens with `fg | insert[...]`.
+
+    `insert` accepts anything that `insert[...]` does and produces exactly
+    the same blobs and keys as the equivalent sequence of inserts. The
+    `add_*` methods are fast paths for bulk loading which skip the type
+    dispatch of `insert` and return the index of the blob.
+
+    ---- Examples ----
+    >>> with FlatGraphBuilder() as builder:
+    >>>     p = builder.add_entity(ET.Person, name="p1")
+    >>>     builder.add_relation(p, RT.Name, builder.add_aet(AET.String, value="Fred"))
+    >>>     builder.insert((Any['p1'], RT.Age, 42))
+    >>> fg = builder.flatgraph
+    """
+    def __init__(self, fg=None):
+        self.base = FlatGraph_() if fg is None else fg
+        self.blobs = [*self.base.blobs]
+        self.key_dict = {**self.base.key_dict}
+        self.owned = set()
+        self.flatgraph = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.build()
+
+    def _check_not_built(self):
+        if self.flatgraph is not None:
+            raise Exception("Can't add to a FlatGraphBuilder after the FlatGraph has been built")
+
+    def insert(self, el):
+        from .op_implementations.flatgraph_implementations import fg_insert_into
+        self._check_not_built()
+        fg_insert_into(self.base, self.blobs, self.key_dict, el, self.owned)
+
+    def insert_many(self, els):
+        for el in els:
+            self.insert(el)
+
+    def add_entity(self, et, uid=None, name=None):
+        """Equivalent to inserting EntityRef({"type": et, "uid": uid}) or et[name]"""
+        self._check_not_built()
+        if uid is not None:
+            if uid in self.key_dict: return self.key_dict[uid]
+            name = uid
+        idx = len(self.blobs)
+        self.blobs.append((idx, et, [], uid))
+        self.owned.add(idx)
+        if name is not None: self.key_dict[name] = idx
+        return idx
+
+    def add_aet(self, aet, uid=None, name=None, value=None):
+        """Equivalent to inserting AttributeEntityRef({"type": aet, "uid": uid}) or aet[name] | assign[value]"""
+        self._check_not_built()
+        if uid is not None:
+            if uid in self.key_dict: return self.key_dict[uid]
+            name = uid
+        idx = len(self.blobs)
+        self.blobs.append((idx, aet, [], uid, value))
+        self.owned.add(idx)
+        if name is not None: self.key_dict[name] = idx
+        return idx
+
+    def add_value_node(self, value):
+        """Equivalent to inserting Val(value)"""
+        from ._ops import value_hash
+        self._check_not_built()
+        hash_vn = value_hash(value)
+        if hash_vn in self.key_dict: return self.key_dict[hash_vn]
+        idx = len(self.blobs)
+        self.key_dict[hash_vn] = idx
+        self.blobs.append((idx, BT.VALUE_NODE, [], value))
+        self.owned.add(idx)
+        return idx
+
+    def add_relation(self, src, rt, trgt, name=None):
+        """Equivalent to inserting (Any[src], rt[name], Any[trgt]). src and
+        trgt are either blob indices or keys of the key_dict."""
+        self._check_not_built()
+        src_idx = src if isinstance(src, int) else self.key_dict[src]
+        trgt_idx = trgt if isinstance(trgt, int) else self.key_dict[trgt]
+        idx = len(self.blobs)
+        if name is not None: self.key_dict[name] = idx
+        self.blobs.append((idx, rt, [], None, src_idx, trgt_idx))
+        self.owned.add(idx)
+        # A new relation can't be in an edge list yet, skip the check
+        add_blob_edge(self.blobs, src_idx, idx, self.owned, check_present=False)
+        add_blob_edge(self.blobs, trgt_idx, -idx, self.owned, check_present=False)
+        return idx
+
+    def add_delegate(self, delegate):
+        """Equivalent to inserting the delegate"""
+        self.insert(delegate)
+        return self.key_dict[delegate]
+
+    def build(self):
+        if self.flatgraph is None:
+            fg = FlatGraph_()
+            fg.key_dict = self.key_dict
+            fg.blobs = (*self.blobs,)
+            self.flatgraph = fg
+        return self.flatgraph
+
+
+# Shapes of the blob tuples in FlatGraph_.blobs
+_shape_node = 0          # (idx, type, edges, origin_uid)
+_shape_aet = 1           # (idx, type, edges, origin_uid, value)
+_shape_relation = 2      # (idx, type, edges, origin_uid, src_idx, trgt_idx)
+_shape_value_node = 3    # (idx, BT.VALUE_NODE, edges, value)
+_shape_removed = 4       # None
+
+class FlatGraphColumns:
+    """
+    Columnar storage for the blobs of a FlatGraph. Appending a blob is O(1)
+    amortized, in contrast to inserting into a FlatGraph_, which copies the
+    blobs and the key_dict.
+
+    Layout, one entry per blob index:
+    1) shapes: which kind of blob tuple the index corresponds to
+    2) type_ids: index into type_table, the interned blob types
+    3) uids / values: the origin uid and the value (for AETs and value nodes)
+    4) sources / targets: blob indices for relations, -1 otherwise
+
+    The edge lists are kept in CSR form (edge_offsets and edge_data) which is
+    built lazily from the log of appended edges. The order of the edges of a
+    blob is the order in which they were appended.
+
+    Once wrapped in a FlatGraph the store is frozen and can't be appended to.
+    """
+    def __init__(self):
+        from array import array
+        self.key_dict = {}
+        self.type_table = []
+        self._type_ids = {}
+        self.shapes = array('b')
+        self.type_ids = array('l')
+        self.uids = []
+        self.values = []
+        self.sources = array('q')
+        self.targets = array('q')
+        self._edge_owners = array('q')
+        self._edge_data = array('q')
+        self._csr = None
+        self._frozen = False
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def __repr__(self):
+        return f"<FlatGraphColumns blobs={len(self)} edges={len(self._edge_data)} types={len(self.type_table)}>"
+
+    def freeze(self):
+        self._frozen = True
+
+    def intern_type(self, blob_type):
+        type_id = self._type_ids.get(blob_type, None)
+        if type_id is None:
+            type_id = len(self.type_table)
+            self.type_table.append(blob_type)
+            self._type_ids[blob_type] = type_id
+        return type_id
+
+    def _append(self, shape, blob_type, uid, value, src, trgt):
+        if self._frozen:
+            raise Exception("Can't append to FlatGraphColumns that have been frozen")
+        idx = len(self.shapes)
+        self.shapes.append(shape)
+        self.type_ids.append(self.intern_type(blob_type) if shape != _shape_removed else -1)
+        self.uids.append(uid)
+        self.values.append(value)
+        self.sources.append(src)
+        self.targets.append(trgt)
+        return idx
+
+    def append_node(self, blob_type, uid=None, key=None):
+        idx = self._append(_shape_node, blob_type, uid, None, -1, -1)
+        if key is not None: self.key_dict[key] = idx
+        return idx
+
+    def append_aet(self, aet, uid=None, value=None, key=None):
+        idx = self._append(_shape_aet, aet, uid, value, -1, -1)
+        if key is not None: self.key_dict[key] = idx
+        return idx
+
+    def append_value_node(self, value, key=None):
+        from .VT import BT
+        idx = self._append(_shape_value_node, BT.VALUE_NODE, None, value, -1, -1)
+        if key is not None: self.key_dict[key] = idx
+        return idx
+
+    def append_relation(self, rt, src, trgt, uid=None, key=None):
+        idx = self._append(_shape_relation, rt, uid, None, src, trgt)
+        self.add_edge(src, idx)
+        self.add_edge(trgt, -idx)
+        if key is not None: self.key_dict[key] = idx
+        return idx
+
+    def append_removed(self):
+        return self._append(_shape_removed, None, None, None, -1, -1)
+
+    def add_edge(self, idx, edge):
+        if self._frozen:
+            raise Exception("Can't append to FlatGraphColumns that have been frozen")
+        self._edge_owners.append(idx)
+        self._edge_data.append(edge)
+        self._csr = None
+
+    def set_value(self, idx, value):
+        if self._frozen:
+            raise Exception("Can't assign in FlatGraphColumns that have been frozen")
+        assert self.shapes[idx] == _shape_aet, "Can only assign a value to an AET"
+        self.values[idx] = value
+
+    def _edge_csr(self):
+        if self._csr is None:
+            from array import array
+            n = len(self.shapes)
+            offsets = array('q', bytes(8 * (n+1)))
+            for owner in self._edge_owners:
+                offsets[owner+1] += 1
+            for i in range(n):
+                offsets[i+1] += offsets[i]
+            data = array('q', bytes(8 * len(self._edge_data)))
+            fill = offsets[:-1]
+            for owner,edge in zip(self._edge_owners, self._edge_data):
+                data[fill[owner]] = edge
+                fill[owner] += 1
+            self._csr = (offsets, data)
+        return self._csr
+
+    def edges(self, idx):
+        offsets, data = self._edge_csr()
+        return list(data[offsets[idx]:offsets[idx+1]])
+
+    def blob_type(self, idx):
+        return self.type_table[self.type_ids[idx]]
+
+    def blob(self, idx):
+        shape = self.shapes[idx]
+        if shape == _shape_removed:
+            return None
+        offsets, data = self._edge_csr()
+        edges = list(data[offsets[idx]:offsets[idx+1]])
+        blob_type = self.type_table[self.type_ids[idx]]
+        if shape == _shape_node:
+            return (idx, blob_type, edges, self.uids[idx])
+        elif shape == _shape_aet:
+            return (idx, blob_type, edges, self.uids[idx], self.values[idx])
+        elif shape == _shape_relation:
+            return (idx, blob_type, edges, self.uids[idx], self.sources[idx], self.targets[idx])
+        else:
+            return (idx, blob_type, edges, self.values[idx])
+
+    def to_blobs(self):
+        return tuple(self.blob(idx) for idx in range(len(self.shapes)))
+
+    @staticmethod
+    def from_blobs(blobs, key_dict):
+        from .VT import BT
+        cols = FlatGraphColumns()
+        for b in blobs:
+            if b is None:
+                cols.append_removed()
+            elif len(b) == 6:
+                cols._append(_shape_relation, b[1], b[3], None, b[4], b[5])
+            elif len(b) == 5:
+                cols._append(_shape_aet, b[1], b[3], b[4], -1, -1)
+            elif b[1] == BT.VALUE_NODE:
+                cols._append(_shape_value_node, b[1], None, b[3], -1, -1)
+            else:
+                cols._append(_shape_node, b[1], b[3], None, -1, -1)
+        for b in blobs:
+            if b is None: continue
+            for edge in b[2]:
+                cols.add_edge(b[0], edge)
+        cols.key_dict = {**key_dict}
+        return cols
+
+
+##############################
+# * On-disk format
+#----------------------------
+# A FlatGraphColumns store written to a single file, which can be opened
+# without decoding it. The fixed width columns are stored as native arrays
+# which are used in place. The origin uids and values of the blobs are each
+# stored in the binary serialization format, with an array of their offsets,
+# so that they can be decoded one at a time. The key_dict is stored in the
+# binary serialization format as a whole. The type table has its own encoding,
+# see encode_blob_type, as BT tokens can't go through the serialization.
+#
+# Layout: a header of the magic, the version, the byte order of the arrays,
+# the number of blobs and the (offset, length) of each section, followed by
+# the sections in order, each aligned to 8 bytes.
+
+import struct as _struct
+
+_mapped_magic = b"ZEFFGCOL"
+_mapped_version = 2
+_mapped_sections = ("shapes", "type_ids", "sources", "targets",
+                    "edge_offsets", "edge_data",
+                    "uid_offsets", "uid_data", "value_offsets", "value_data",
+                    "type_table", "key_dict")
+_mapped_header = _struct.Struct("<8sQQQ" + "QQ" * len(_mapped_sections))
+
+
+def encode_blob_type(blob_type):
+    """
+    The entry for blob_type in the type table of a FlatGraph file: a tuple
+    (kind, name) for ET/RT/AET/BT tokens, which are rebuilt by name, or
+    ("Serialized", data) for any other type (e.g. delegates).
+    """
+    from .VT.rae_types import RAET_get_token
+    from .serialization import serialize_binary
+    if isinstance(blob_type, ValueType) and blob_type._d["type_name"] in _token_kinds:
+        token = RAET_get_token(blob_type, convert_complex=False)
+        name = getattr(token, "name", None)
+        if isinstance(name, str):
+            entry = (blob_type._d["type_name"], name)
+            # Only rely on the name when it gives back the same type, which
+            # e.g. isn't the case for AET[<complex type>].
+            try:
+                if decode_blob_type(entry) == blob_type:
+                    return entry
+            except Exception:
+                pass
+    return ("Serialized", serialize_binary(blob_type))
+
+def decode_blob_type(entry):
+    kind, data = entry
+    if kind == "Serialized":
+        from .serialization import deserialize_binary
+        return deserialize_binary(data)
+    out = _token_kinds[kind]
+    for part in data.split("."):
+        out = getattr(out, part)
+    return out
+
+_token_kinds = {"ET": ET, "RT": RT, "AET": AET, "BT": BT}
+
+
+class MappedObjects:
+    """The uids or values column of a MappedFlatGraphColumns, decoding each item on access."""
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, idx):
+        from .serialization import BinaryDecoder
+        return BinaryDecoder(self.data, self.offsets[idx]).value()
+
+    def __iter__(self):
+        return (self[idx] for idx in range(len(self)))
+
+
+class MappedBlobs:
+    """
+    The blobs of a FlatGraph backed by MappedFlatGraphColumns. Behaves like
+    the tuple of blobs, but each blob is only materialized when it is first
+    accessed.
+    """
+    def __init__(self, cols):
+        self.cols = cols
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.cols)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return tuple(self[i] for i in range(*idx.indices(len(self))))
+        if idx < 0:
+            idx += len(self)
+        try:
+            return self._cache[idx]
+        except KeyError:
+            pass
+        if not 0 <= idx < len(self):
+            raise IndexError("blob index out of range")
+        b = self.cols.blob(idx)
+        self._cache[idx] = b
+        return b
+
+    def __iter__(self):
+        return (self[idx] for idx in range(len(self)))
+
+    def uncached(self):
+        """Iterates over the blobs without keeping those not yet materialized."""
+        cache = self._cache
+        for idx in range(len(self)):
+            b = cache.get(idx, None)
+            yield b if b is not None else self.cols.blob(idx)
+
+    def __repr__(self):
+        return f"<MappedBlobs len={len(self)} materialized={len(self._cache)}>"
+
+
+class MappedFlatGraphColumns(FlatGraphColumns):
+    """
+    A frozen FlatGraphColumns store read from a file written by
+    save_flatgraph. The columns are views onto the file data, so a memory
+    mapped file is only read as it is accessed and its pages are shared by
+    all processes that open it.
+    """
+    def __init__(self, data, path=None):
+        import sys
+        self.path = path
+        self._data = data
+        view = memoryview(data)
+        if len(view) < _mapped_header.size:
+            raise Exception(f"Not a FlatGraph file: {path}")
+        magic, version, byteorder, n, *spans = _mapped_header.unpack_from(view, 0)
+        if magic != _mapped_magic:
+            raise Exception(f"Not a FlatGraph file: {path}")
+        if version != _mapped_version:
+            raise Exception(f"Don't understand FlatGraph file version '{version}'")
+        if byteorder != (sys.byteorder == "little"):
+            raise Exception("FlatGraph file was written on a machine with a different byte order")
+
+        sections = {}
+        for i,name in enumerate(_mapped_sections):
+            offset, length = spans[2*i], spans[2*i+1]
+            sections[name] = view[offset:offset+length]
+
+        from .serialization import deserialize_binary
+        self.type_table = [decode_blob_type(entry) for entry in deserialize_binary(sections["type_table"])]
+        self._type_ids = None
+        self.shapes = sections["shapes"].cast('b')
+        self.type_ids = sections["type_ids"].cast('q')
+        self.sources = sections["sources"].cast('q')
+        self.targets = sections["targets"].cast('q')
+        self.uids = MappedObjects(sections["uid_offsets"].cast('q'), sections["uid_data"])
+        self.values = MappedObjects(sections["value_offsets"].cast('q'), sections["value_data"])
+        self._edge_owners = None
+        self._edge_data = sections["edge_data"].cast('q')
+        self._csr = (sections["edge_offsets"].cast('q'), self._edge_data)
+        self._key_dict_data = sections["key_dict"]
+        self._key_dict = None
+        self._frozen = True
+        assert len(self.shapes) == n
+
+    @property
+    def key_dict(self):
+        if self._key_dict is None:
+            from .serialization import deserialize_binary
+            self._key_dict = deserialize_binary(self._key_dict_data)
+        return self._key_dict
+
+    def intern_type(self, blob_type):
+        raise Exception("Can't append to FlatGraphColumns read from a file")
+
+    def to_blobs(self):
+        return MappedBlobs(self)
+
+
+def save_flatgraph(fg, path):
+    """
+    Writes the FlatGraph fg to a file at path, in the format read by
+    FlatGraph.open.
+    """
+    from array import array
+    from .serialization import serialize_binary, BinaryEncoder
+    import sys
+
+    cols = fg.to_columns()
+
+    def as_int64(col):
+        if getattr(col, "typecode", None) == 'q' or getattr(col, "format", None) == 'q':
+            return col
+        return array('q', col)
+
+    def encode_each(items):
+        offsets = array('q')
+        enc = BinaryEncoder()
+        for item in items:
+            offsets.append(len(enc.out))
+            # Each item has to be decodable on its own
+            enc.interned = {}
+            enc.value(item)
+        return offsets, enc.out
+
+    edge_offsets, edge_data = cols._edge_csr()
+    uid_offsets, uid_data = encode_each(cols.uids)
+    value_offsets, value_data = encode_each(cols.values)
+    sections = [
+        cols.shapes,
+        as_int64(cols.type_ids),
+        as_int64(cols.sources),
+        as_int64(cols.targets),
+        as_int64(edge_offsets),
+        as_int64(edge_data),
+        uid_offsets,
+        uid_data,
+        value_offsets,
+        value_data,
+        serialize_binary([encode_blob_type(t) for t in cols.type_table]),
+        serialize_binary(cols.key_dict),
+    ]
+
+    spans = []
+    pos = _mapped_header.size
+    for section in sections:
+        pos += -pos % 8
+        length = memoryview(section).nbytes
+        spans += [pos, length]
+        pos += length
+
+    with open(path, "wb") as f:
+        f.write(_mapped_header.pack(_mapped_magic, _mapped_version, sys.byteorder == "little", len(cols), *spans))
+        for i,section in enumerate(sections):
+            f.write(bytes(spans[2*i] - f.tell()))
+            f.write(section)
+
+def open_flatgraph(path, mmap=True):
+    """
+    Opens a FlatGraph written by FlatGraph.save. With mmap=True, the file is
+    memory mapped rather than read, so that opening is independent of its
+    size. In both cases, the blobs, origin uids, values and key_dict are only
+    decoded when they are accessed.
+
+    ---- Examples ----
+    >>> FlatGraph.save(fg, "snapshot.zfg")
+    >>> fg = FlatGraph.open("snapshot.zfg")
+    """
+    with open(path, "rb") as f:
+        if mmap:
+            import mmap as mmap_module
+            data = mmap_module.mmap(f.fileno(), 0, access=mmap_module.ACCESS_READ)
+        else:
+            data = f.read()
+    return FlatGraph_(MappedFlatGraphColumns(data, path))
+
 
 
 class FlatRef_:
@@ -36,7 +36,7 @@ def create_eff_to_process_graph_wish(eff: Dict) -> 'FX':
 
 
 def create_http_server(eff: Dict, server_zr: ZefRef) -> Dict:
-    from ...core.fx.http import OurHTTPServer, Handler, _effects_processes
+    from ...core.fx.http import OurHTTPServer, AsyncHTTPServer, Handler, _effects_processes
     from ...core.logger import log
     from ...core.op_structs import Awaitable
     import threading
@@ -60,16 +60,31 @@ def create_http_server(eff: Dict, server_zr: ZefRef) -> Dict:
         port = eff.get('port', 5000)
         bind_address = eff.get('bind_address', "localhost")
         do_logging = eff.get('logging', True)
+        # "threading" serves each connection on its own thread, "asyncio" serves
+        # all connections from an event loop
+        engine = eff.get('engine', "threading")
+        request_timeout = eff.get('request_timeout', 15.0)
 
         # Create the context for this server
         zef_locals = {
             "open_requests": open_requests,
             "stream" : pushable_stream,
             "server_uuid": server_uuid,
-            "port": port
+            "port": port,
+            "request_timeout": request_timeout,
+            "stream_request_body": eff.get('stream_request_body', False),
         }
         # Instantiate HTTP server
-        server = OurHTTPServer((bind_address, port), Handler, do_logging=do_logging)
+        if engine == "threading":
+            server = OurHTTPServer((bind_address, port), Handler, do_logging=do_logging)
+        elif engine == "asyncio":
+            server = AsyncHTTPServer((bind_address, port),
+                                     do_logging=do_logging,
+                                     request_timeout=request_timeout,
+                                     workers=eff.get('workers', 32),
+                                     stream_request_body=zef_locals["stream_request_body"])
+        else:
+            raise ValueError(f"Unknown HTTP server engine '{engine}'")
 
         # Set Zef local variables
         zef_locals["server"] = server
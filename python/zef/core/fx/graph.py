@@ -56,7 +56,12 @@ def graph_transaction_handler(eff: dict):
         target_ref = eff["target_glike"]
         if isinstance(target_ref, GraphRef):
             target_ref = now(Graph(target_ref))
-        lvl1_cmds = generate_level1_commands(eff["level2_commands"]["cmds"], target_ref)
+        if "level1_commands" in eff:
+            # A prepared wish that has already been translated and ordered
+            from ..graph_additions.prepared import level1_info_for
+            lvl1_cmds = level1_info_for(eff["level1_commands"], target_ref)
+        else:
+            lvl1_cmds = generate_level1_commands(eff["level2_commands"]["cmds"], target_ref)
 
         if isinstance(target_ref, GraphSlice):
             from ..graph_additions.low_level import perform_level1_commands
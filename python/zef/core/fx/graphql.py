@@ -17,9 +17,10 @@
 from .fx_types import Effect, FX
 from .._ops import *
 from .http import send_response, permit_cors, middleware, middleware_worker, fallback_not_found
-from ariadne import graphql_sync
+from ... import lazy_import
 import os
 import json
+ariadne = lazy_import("ariadne")
 
 from ..logger import log
 
@@ -77,7 +78,7 @@ def graphql_start_server_handler(eff: Effect):
             body = body.replace("ZEF_GQL_PATH", gql_path)
             req["response_body"] = body
         elif req["path"] == gql_path:
-            success, result = graphql_sync(schema, json.loads(req["request_body"]))
+            success, result = ariadne.graphql_sync(schema, json.loads(req["request_body"]))
             req["response_body"] = json.dumps(result)
             req["response_headers"]["Content-Type"] = "application/json"
             req["response_headers"]["Access-Control-Allow-Origin"] = "*"
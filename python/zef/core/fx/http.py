@@ -22,7 +22,7 @@ from .._ops import *
 
 from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 import threading
-from concurrent.futures import Future, TimeoutError
+from concurrent.futures import Future, TimeoutError, ThreadPoolExecutor, InvalidStateError
 
 from ..logger import log
 
@@ -50,8 +50,14 @@ class Handler(BaseHTTPRequestHandler):
         try:
             future = Future()
             length = int(self.headers.get("content-length", "0"))
+            chunked = self.headers.get("transfer-encoding", "").lower() == "chunked"
 
-            body = self.rfile.read(length)
+            if self.server.zef.get("stream_request_body", False):
+                body = RequestBody(read_body_chunks(self.rfile, length, chunked))
+            elif chunked:
+                body = b"".join(read_body_chunks(self.rfile, length, chunked))
+            else:
+                body = self.rfile.read(length)
 
             request_id = str(uuid4())
             self.server.zef["open_requests"][request_id] = future
@@ -71,28 +77,40 @@ class Handler(BaseHTTPRequestHandler):
             }
             d | push[self.server.zef["stream"]] | run
             try:
-                result = future.result(timeout=15.0)
+                result = future.result(timeout=self.server.zef.get("request_timeout", 15.0))
             except TimeoutError:
                 log.error("Timed out handling REST request")
                 self.reply_with_error("Internal timeout")
                 return
             finally:
-                # TODO: Cleanup from open_requests here
-                pass
+                self.server.zef["open_requests"].pop(request_id, None)
 
             # TODO: This needs improving to allow sending content with non-200.
             # The only choice is when to put msg in content or in header-line
             # response.
             status,headers,msg = result
-            if status != 200 and msg is not None:
-                msg = msg.decode('utf-8')
+            streamed = is_streamed_body(msg)
+            chunked = is_chunked(headers)
+            if chunked:
+                if self.request_version == "HTTP/1.0":
+                    # Send the body as is, ended by closing the connection
+                    headers = {k: v for k,v in headers.items() if k.lower() != "transfer-encoding"}
+                    chunked = False
+                else:
+                    self.protocol_version = "HTTP/1.1"
+                headers = {**headers, "Connection": "close"}
+
+            if status != 200 and msg is not None and not streamed:
+                msg = bytes(msg).decode('utf-8')
                 self.send_response(status, msg)
             else:
                 self.send_response(status)
             for key,val in headers.items():
                 self.send_header(key, val)
             self.end_headers()
-            if status == 200 and msg is not None:
+            if streamed:
+                write_streamed_body(self.wfile.write, msg, chunked)
+            elif status == 200 and msg is not None:
                 self.wfile.write(msg)
         except BrokenPipeError:
             log.error("Connection aborted unexpectedly")
@@ -110,6 +128,544 @@ class Handler(BaseHTTPRequestHandler):
             super().log_message(*args, **kwds)
 
 
+##############################
+# * Streamed bodies
+#----------------------------
+# The response of an FX.HTTP.SendResponse can be a file-like object or an
+# iterable of bytes (e.g. from serialize_iter) instead of str/bytes. It is then
+# sent in chunks as it is read, using chunked transfer encoding unless a
+# Content-Length header is given.
+#
+# With "stream_request_body": True in FX.HTTP.StartServer, the request_body is
+# a RequestBody which reads the body from the connection as it is iterated
+# over, instead of bytes. Request bodies can use chunked transfer encoding with
+# either setting.
+
+body_chunk_size = 1 << 16
+
+class RequestBody:
+    """
+    The body of a request on a server started with "stream_request_body".
+    Iterating over it gives the body in chunks of bytes, read from the
+    connection on demand. It can only be read once.
+    """
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    def __iter__(self):
+        return self._chunks
+
+    def read(self):
+        """Reads the remainder of the body into one bytes object."""
+        return b"".join(self._chunks)
+
+    def __repr__(self):
+        return "<RequestBody>"
+
+def parse_chunk_size(line):
+    # Chunk extensions after ';' are ignored
+    try:
+        return int(line.split(b";", 1)[0].strip(), 16)
+    except ValueError:
+        raise ValueError(f"Bad chunk size line ({line!r})")
+
+def read_body_chunks(rfile, length, chunked):
+    """Generates the body of a request from a blocking file-like rfile."""
+    if not chunked:
+        remaining = length
+        while remaining > 0:
+            data = rfile.read(min(remaining, body_chunk_size))
+            if not data:
+                raise ConnectionError("Connection closed in the middle of a request body")
+            remaining -= len(data)
+            yield data
+        return
+
+    while True:
+        size = parse_chunk_size(rfile.readline(65537))
+        if size == 0:
+            # Skip any trailers
+            while rfile.readline(65537) not in (b"\r\n", b"\n", b""):
+                pass
+            return
+        yield from read_body_chunks(rfile, size, False)
+        rfile.readline(65537)
+
+def is_streamed_body(msg):
+    return msg is not None and not isinstance(msg, (str, bytes, bytearray, memoryview))
+
+def is_chunked(headers):
+    return any(k.lower() == "transfer-encoding" and v.lower() == "chunked" for k,v in headers.items())
+
+def iter_body_chunks(msg):
+    """The non-empty bytes chunks of a streamed response body."""
+    if hasattr(msg, "read"):
+        while True:
+            chunk = msg.read(body_chunk_size)
+            if not chunk:
+                return
+            yield chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+    else:
+        for chunk in msg:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            if len(chunk) > 0:
+                yield chunk
+
+def chunk_header(chunk):
+    return b"%x\r\n" % memoryview(chunk).nbytes
+
+def close_body(msg):
+    # Files are closed and generators stopped once sent or when the
+    # connection fails
+    close = getattr(msg, "close", None)
+    if close is not None:
+        close()
+
+def write_streamed_body(write, msg, chunked):
+    try:
+        for chunk in iter_body_chunks(msg):
+            if chunked:
+                write(chunk_header(chunk))
+                write(chunk)
+                write(b"\r\n")
+            else:
+                write(chunk)
+        if chunked:
+            write(b"0\r\n\r\n")
+    finally:
+        close_body(msg)
+
+
+class AsyncHTTPServer:
+    """
+    An asyncio based alternative to OurHTTPServer, selected with
+    `"engine": "asyncio"` in the FX.HTTP.StartServer effect. Connections are
+    served by coroutines on a single event loop thread, rather than by a
+    thread each, so idle keep-alive connections and requests waiting on their
+    response don't hold on to any threads.
+
+    Speaks HTTP/1.1 with keep-alive and pipelining: the requests on a
+    connection are handled concurrently and their responses are written in
+    order. Requests are passed on through the same `open_requests` and
+    FX.HTTP.SendResponse protocol as OurHTTPServer. As the subscribers of the
+    stream run synchronously on push, the push happens on a bounded pool of
+    worker threads.
+
+    Has the serve_forever/shutdown/server_close interface of socketserver.
+    """
+    server_version = "ZefHTTP/0.1"
+    supported_methods = ("GET", "POST", "OPTIONS")
+    max_pipelined = 16
+    max_headers = 100
+
+    def __init__(self, server_address, *, do_logging, request_timeout=15.0, keep_alive_timeout=75.0, workers=32, stream_request_body=False):
+        import socket
+        self.server_address = server_address
+        self.do_logging = do_logging
+        self.stream_request_body = stream_request_body
+        self.request_timeout = request_timeout
+        self.keep_alive_timeout = keep_alive_timeout
+
+        host, port = server_address
+        family, _, _, _, sockaddr = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.socket.bind(sockaddr)
+            self.socket.listen(1024)
+        except:
+            self.socket.close()
+            raise
+
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="zef_http")
+        self.loop = None
+        self._tasks = set()
+        self._started = threading.Event()
+        self._stopped = threading.Event()
+
+    def serve_forever(self):
+        import asyncio
+        loop = asyncio.new_event_loop()
+        self.loop = loop
+        try:
+            loop.run_until_complete(self._serve())
+        finally:
+            loop.close()
+            self._stopped.set()
+            self._started.set()
+
+    def shutdown(self):
+        self._started.wait()
+        if not self._stopped.is_set():
+            try:
+                self.loop.call_soon_threadsafe(self._stop.set)
+            except RuntimeError:
+                # The loop has already closed
+                pass
+        self._stopped.wait()
+
+    def server_close(self):
+        self.socket.close()
+        self.executor.shutdown(wait=False)
+
+    async def _serve(self):
+        import asyncio
+        self._stop = asyncio.Event()
+        server = await asyncio.start_server(self._handle_connection, sock=self.socket)
+        self._started.set()
+        try:
+            await self._stop.wait()
+        finally:
+            server.close()
+            tasks = list(self._tasks)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await server.wait_closed()
+
+    def _spawn(self, coro):
+        # Tracked so that they can be cancelled on shutdown
+        import asyncio
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _handle_connection(self, reader, writer):
+        import asyncio
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        peer = writer.get_extra_info("peername")
+        # The responses in request order, as futures
+        responses = asyncio.Queue(self.max_pipelined)
+        read_task = self._spawn(self._read_requests(reader, responses))
+        try:
+            while True:
+                response = await responses.get()
+                if response is None:
+                    break
+                request_line, keep_alive, (status, headers, msg) = await response
+                streamed = is_streamed_body(msg)
+                chunked = is_chunked(headers)
+                if chunked and request_line.endswith("HTTP/1.0"):
+                    # Send the body as is, ended by closing the connection
+                    headers = {k: v for k,v in headers.items() if k.lower() != "transfer-encoding"}
+                    chunked = False
+                    keep_alive = False
+                elif streamed and not chunked and not any(k.lower() == "content-length" for k in headers):
+                    keep_alive = False
+                head, body = self._format_response(status, headers, msg, keep_alive)
+                writer.write(head)
+                if streamed:
+                    await self._write_streamed_body(writer, msg, chunked)
+                elif len(body) > 0:
+                    writer.write(body)
+                await writer.drain()
+                if self.do_logging:
+                    self.log_request(peer, request_line, status)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        except Exception as exc:
+            log.error("Some problem in handling HTTP connection", exc_info=exc)
+        finally:
+            read_task.cancel()
+            # Any requests still waiting for their response are abandoned
+            while not responses.empty():
+                response = responses.get_nowait()
+                if response is not None:
+                    response.cancel()
+            writer.close()
+            self._tasks.discard(task)
+
+    async def _read_requests(self, reader, responses):
+        import asyncio
+        while True:
+            try:
+                request = await self._read_request(reader)
+            except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                break
+            except ValueError as exc:
+                await responses.put(self._completed("-", False, (400, {}, str(exc).encode("utf-8"))))
+                break
+            except Exception as exc:
+                log.error("Some problem in reading HTTP request", exc_info=exc)
+                break
+            if request is None:
+                break
+            if request["method"] not in self.supported_methods:
+                response = self._completed(request["request_line"], request["keep_alive"],
+                                           (501, {}, f"Unsupported method ({request['method']!r})".encode("utf-8")))
+            else:
+                response = self._spawn(self._respond(request))
+            await responses.put(response)
+            body = request["body"]
+            if isinstance(body, AsyncBodyReader):
+                # The next request only starts after this body. Whatever the
+                # handler doesn't read by the time it responds is skipped.
+                finished = asyncio.ensure_future(body.finished.wait())
+                await asyncio.wait([finished, response], return_when=asyncio.FIRST_COMPLETED)
+                finished.cancel()
+                try:
+                    await body.drain()
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, ValueError):
+                    break
+            if not request["keep_alive"]:
+                break
+        await responses.put(None)
+
+    async def _read_request(self, reader):
+        # Returns None if the connection was closed between requests
+        import asyncio
+        line = await asyncio.wait_for(reader.readline(), self.keep_alive_timeout)
+        # Empty lines are allowed before a request
+        while line in (b"\r\n", b"\n"):
+            line = await asyncio.wait_for(reader.readline(), self.keep_alive_timeout)
+        if not line:
+            return None
+        request_line = line.decode("latin-1").rstrip("\r\n")
+        parts = request_line.split()
+        if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+            raise ValueError(f"Bad request line ({request_line!r})")
+        method, target, version = parts
+
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), self.request_timeout)
+            if line in (b"\r\n", b"\n"):
+                break
+            if not line:
+                raise ConnectionError("Connection closed in the middle of a request")
+            if len(headers) >= self.max_headers:
+                raise ValueError("Too many headers")
+            key, sep, val = line.decode("latin-1").partition(":")
+            if not sep:
+                raise ValueError(f"Bad header line ({line!r})")
+            headers[key.strip()] = val.strip()
+        lower = {key.lower(): val for key,val in headers.items()}
+
+        transfer_encoding = lower.get("transfer-encoding", "").lower()
+        if transfer_encoding not in ("", "chunked"):
+            raise ValueError(f"Unsupported transfer encoding ({transfer_encoding!r})")
+        try:
+            length = int(lower.get("content-length", "0"))
+        except ValueError:
+            raise ValueError("Bad content-length")
+        body = AsyncBodyReader(reader, length, transfer_encoding == "chunked", self.request_timeout)
+        if not self.stream_request_body:
+            body = await body.read_all()
+
+        connection = lower.get("connection", "").lower()
+        if version == "HTTP/1.0":
+            keep_alive = "keep-alive" in connection
+        else:
+            keep_alive = "close" not in connection
+
+        return {
+            "request_line": request_line,
+            "method": method,
+            "target": target,
+            "headers": headers,
+            "body": body,
+            "keep_alive": keep_alive,
+        }
+
+    async def _respond(self, request):
+        import asyncio
+        future = Future()
+        request_id = str(uuid4())
+        open_requests = self.zef["open_requests"]
+        open_requests[request_id] = future
+
+        loop = asyncio.get_event_loop()
+        body = request["body"]
+        if isinstance(body, AsyncBodyReader):
+            body = RequestBody(body.chunks_from_thread(loop))
+
+        path, _, params = request["target"].partition("?")
+        d = {
+            "request_id": request_id,
+            "server_uuid": self.zef["server_uuid"],
+            "method": request["method"],
+            "path": path,
+            "params": params,
+            "request_body": body,
+            "request_headers": request["headers"],
+        }
+        try:
+            await loop.run_in_executor(self.executor, _push_request, d, self.zef["stream"])
+            result = await asyncio.wait_for(asyncio.wrap_future(future), self.request_timeout)
+        except asyncio.TimeoutError:
+            log.error("Timed out handling REST request")
+            result = (500, {}, b"Internal timeout")
+        except Exception as exc:
+            log.error("Some problem in handling HTTP request", exc_info=exc)
+            result = (500, {}, None)
+        finally:
+            open_requests.pop(request_id, None)
+        return request["request_line"], request["keep_alive"], result
+
+    @staticmethod
+    def _completed(request_line, keep_alive, result):
+        import asyncio
+        future = asyncio.get_event_loop().create_future()
+        future.set_result((request_line, keep_alive, result))
+        return future
+
+    async def _write_streamed_body(self, writer, msg, chunked):
+        # The body is produced on the worker threads, as reading it may block
+        import asyncio
+        loop = asyncio.get_event_loop()
+        chunks = iter_body_chunks(msg)
+        try:
+            while True:
+                chunk = await loop.run_in_executor(self.executor, next, chunks, None)
+                if chunk is None:
+                    break
+                if chunked:
+                    writer.write(chunk_header(chunk))
+                    writer.write(chunk)
+                    writer.write(b"\r\n")
+                else:
+                    writer.write(chunk)
+                # Only read ahead as fast as the client takes the data
+                await writer.drain()
+            if chunked:
+                writer.write(b"0\r\n\r\n")
+        finally:
+            await loop.run_in_executor(self.executor, close_body, msg)
+
+    def _format_response(self, status, headers, msg, keep_alive):
+        # The same interpretation of the response as in Handler. Returns the
+        # head and, unless msg is streamed, the body.
+        from http import HTTPStatus
+        from email.utils import formatdate
+        streamed = is_streamed_body(msg)
+        if status != 200 and msg is not None and not streamed:
+            reason = bytes(msg).decode("utf-8").replace("\r", " ").replace("\n", " ")
+            body = b""
+        else:
+            try:
+                reason = HTTPStatus(status).phrase
+            except ValueError:
+                reason = ""
+            body = msg if msg is not None and not streamed else b""
+
+        lines = [f"HTTP/1.1 {status} {reason}",
+                 f"Server: {self.server_version}",
+                 f"Date: {formatdate(usegmt=True)}"]
+        names = set()
+        for key,val in headers.items():
+            lines.append(f"{key}: {val}")
+            names.add(key.lower())
+        if ("content-length" not in names and "transfer-encoding" not in names and not streamed
+            and not (100 <= status < 200 or status in (204, 304))):
+            lines.append(f"Content-Length: {memoryview(body).nbytes}")
+        if not keep_alive:
+            lines.append("Connection: close")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"), body
+
+    def log_request(self, peer, request_line, status):
+        import sys, time
+        host = peer[0] if isinstance(peer, tuple) else peer
+        sys.stderr.write(f'{host} - - [{time.strftime("%d/%b/%Y %H:%M:%S")}] "{request_line}" {status} -\n')
+
+
+def _push_request(d, stream):
+    d | push[stream] | run
+
+
+class AsyncBodyReader:
+    """
+    Reads the body of a request from an asyncio StreamReader, either of the
+    given length or with chunked transfer encoding. Each read gives up after
+    timeout seconds, after which the rest of the body can't be read.
+    """
+    def __init__(self, reader, length, chunked, timeout=None):
+        import asyncio
+        self.reader = reader
+        self.chunked = chunked
+        self.timeout = timeout
+        # For chunked bodies, the remainder of the current chunk
+        self.remaining = 0 if chunked else length
+        self.lock = asyncio.Lock()
+        self.finished = asyncio.Event()
+        self.failed = False
+
+    async def _read(self, coro):
+        import asyncio
+        return await asyncio.wait_for(coro, self.timeout)
+
+    async def read_chunk(self):
+        """The next part of the body, or b"" at the end of it."""
+        import asyncio
+        async with self.lock:
+            if self.finished.is_set():
+                return b""
+            if self.failed:
+                raise ConnectionError("The rest of the request body was abandoned")
+            try:
+                return await self._read_chunk()
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                # We may have stopped in the middle of the chunk framing
+                self.failed = True
+                raise
+
+    async def _read_chunk(self):
+        reader = self.reader
+        if self.remaining == 0:
+            if not self.chunked:
+                self.finished.set()
+                return b""
+            self.remaining = parse_chunk_size(await self._read(reader.readline()))
+            if self.remaining == 0:
+                # Skip any trailers
+                while (await self._read(reader.readline())) not in (b"\r\n", b"\n", b""):
+                    pass
+                self.finished.set()
+                return b""
+        data = await self._read(reader.read(min(self.remaining, body_chunk_size)))
+        if not data:
+            raise ConnectionError("Connection closed in the middle of a request body")
+        self.remaining -= len(data)
+        if self.chunked and self.remaining == 0:
+            await self._read(reader.readline())
+        return data
+
+    async def read_all(self):
+        if not self.chunked:
+            data = await self._read(self.reader.readexactly(self.remaining)) if self.remaining > 0 else b""
+            self.remaining = 0
+            self.finished.set()
+            return data
+        chunks = []
+        while True:
+            chunk = await self.read_chunk()
+            if not chunk:
+                return b"".join(chunks)
+            chunks.append(chunk)
+
+    async def drain(self):
+        while await self.read_chunk():
+            pass
+
+    def chunks_from_thread(self, loop):
+        # For iterating over the body from a thread other than the loop's
+        import asyncio
+        while True:
+            future = asyncio.run_coroutine_threadsafe(self.read_chunk(), loop)
+            try:
+                chunk = future.result(timeout=self.timeout)
+            except TimeoutError:
+                future.cancel()
+                raise TimeoutError("Timed out reading the request body")
+            if not chunk:
+                return
+            yield chunk
+
+
 
 def http_stop_server_handler(eff: dict):
     d = _effects_processes[eff["server_uuid"]]
@@ -152,12 +708,17 @@ def http_send_response_handler(eff: Effect):
         return Error(f"An FX.HTTP.SendResponse event must contain a 'server_uuid' field. This was not the case for eff={eff}")
 
     d = _effects_processes[eff["server_uuid"]]
-    future = d["open_requests"][eff["request_id"]]
+    future = d["open_requests"].get(eff["request_id"], None)
+    if future is None:
+        return Error(f"No open request with id {eff['request_id']}. It may have timed out.")
 
     # if "response" not in eff:
     #     print(f"Warning: FX.HTTP.SendResponse wish did not contain 'response' field. This is probably an error. Received wish: {eff}")
+    # The response can also be a file-like object or an iterable of bytes,
+    # which is streamed (see Streamed bodies above)
     msg = eff.get("response", None)
-    assert msg is None or isinstance(msg, str) or isinstance(msg, bytes)
+    assert (msg is None or isinstance(msg, (str, bytes, bytearray, memoryview))
+            or hasattr(msg, "read") or hasattr(msg, "__iter__"))
     if isinstance(msg, str):
         msg = msg.encode("utf-8")
 
@@ -167,15 +728,27 @@ def http_send_response_handler(eff: Effect):
     headers = copy.deepcopy(headers)
 
     header_names = set(k.lower() for k in headers)
-    if msg is not None and status == 200:
+    if is_streamed_body(msg):
+        if "content-length" not in header_names and "transfer-encoding" not in header_names:
+            headers["Transfer-Encoding"] = "chunked"
+        if "content-type" not in header_names:
+            headers["Content-Type"] = "text/html; charset=UTF-8"
+    elif msg is not None and status == 200:
         if "content-length" not in header_names:
-            headers["Content-Length"] = str(len(msg))
+            headers["Content-Length"] = str(memoryview(msg).nbytes)
         if "content-type" not in header_names:
             headers["Content-Type"] = "text/html; charset=UTF-8"
 
     response = (status,headers,msg)
     # log.debug("Trying to attach response to future", response=response)
-    future.set_result(response)
+    # The asyncio server cancels the future on a timeout, which can also
+    # happen between the check and set_result
+    if future.done():
+        return Error(f"The request with id {eff['request_id']} has already timed out.")
+    try:
+        future.set_result(response)
+    except InvalidStateError:
+        return Error(f"The request with id {eff['request_id']} has already timed out.")
     return {}
     
     
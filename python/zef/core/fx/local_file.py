@@ -15,11 +15,12 @@
 from .fx_types import Effect
 from ..VT import Error, Image
 from .. import internals
-import yaml 
+from ... import lazy_import
 import json 
-import toml
-import pandas as pd
 import io
+yaml = lazy_import("yaml")
+toml = lazy_import("toml")
+pd = lazy_import("pandas")
 
 #TODO Docstring!
 
@@ -210,29 +211,38 @@ def system_open_with_handler(eff: Effect):
 
 
 
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
-class ZefEventHandler(FileSystemEventHandler):
-    def __init__(self, created = None, modified = None, moved = None, deleted = None):
-        super().__init__()
-        self.created = created
-        self.modified = modified
-        self.moved = moved
-        self.deleted = deleted
-    def on_created(self, event):
-        super().on_created(event)
-        if self.created: self.created(event)
+_ZefEventHandler = None
+def zef_event_handler_class():
+    # watchdog is only imported once a path is monitored
+    global _ZefEventHandler
+    if _ZefEventHandler is not None:
+        return _ZefEventHandler
+
+    from watchdog.events import FileSystemEventHandler
+    class ZefEventHandler(FileSystemEventHandler):
+        def __init__(self, created = None, modified = None, moved = None, deleted = None):
+            super().__init__()
+            self.created = created
+            self.modified = modified
+            self.moved = moved
+            self.deleted = deleted
+        def on_created(self, event):
+            super().on_created(event)
+            if self.created: self.created(event)
+            
+        def on_modified(self, event):
+            super().on_modified(event)
+            if self.modified: self.modified(event)
+        def on_moved(self, event):
+            super().on_moved(event)
+            if self.moved: self.moved(event)
         
-    def on_modified(self, event):
-        super().on_modified(event)
-        if self.modified: self.modified(event)
-    def on_moved(self, event):
-        super().on_moved(event)
-        if self.moved: self.moved(event)
-    
-    def on_deleted(self, event):
-        super().on_deleted(event)
-        if self.deleted: self.deleted(event)
+        def on_deleted(self, event):
+            super().on_deleted(event)
+            if self.deleted: self.deleted(event)
+
+    _ZefEventHandler = ZefEventHandler
+    return _ZefEventHandler
 
 def monitor_path_handler(eff: Effect):
     """
@@ -263,6 +273,8 @@ def monitor_path_handler(eff: Effect):
     moved_handler = eff.get("moved_handler", None)
     deleted_handler = eff.get("deleted_handler", None)
 
+    from watchdog.observers import Observer
+    ZefEventHandler = zef_event_handler_class()
     event_handler = ZefEventHandler(created = created_handler, modified = modified_handler, moved = moved_handler, deleted = deleted_handler)
 
     observer = Observer()
@@ -16,4 +16,6 @@ from ... import report_import
 report_import("zef.core.graph_additions")
 
 from . import transact
-from . import shorthand
\ No newline at end of file
+from . import shorthand
+from . import prepared
+
@@ -17,92 +17,109 @@ report_import("zef.core.graph_additions.command_ordering")
 
 from .common import *
 
+from collections import deque, defaultdict
+import os
+# Checking the ordering repeats the whole dependency extraction, so it is only
+# done when debugging.
+verify_ordering = (len(os.environ.get("ZEF_DEBUG_COMMAND_ORDERING", "")) > 0
+                   or len(os.environ.get("ZEF_DEBUG_GRAPH_WISH_LVL1", "")) > 0)
+
 def order_level1_commands(commands: List[PleaseCommandLevel1], gs: GraphSlice):
     # Form dependency graph using WishIDs and Refs
     #
     # Take partial ordering from graph, using order of original commands to decide ties.
 
+    atom_keys = {}
     def simple_key(cmd):
-        if isinstance(cmd, PleaseInstantiate):
-            if isinstance(cmd.atom, PleaseInstantiateEntity | PleaseInstantiateAttributeEntity):
-                return 0
-            elif isinstance(cmd.atom, PleaseInstantiateRelation):
-                return 1
-        elif isinstance(cmd, PleaseAssign):
+        type_id = getattr(cmd, "_user_type_id", None)
+        if type_id == PleaseInstantiate._d["user_type_id"]:
+            atom = cmd._value["atom"]
+            try:
+                key = atom_keys.get(atom, None)
+            except TypeError:
+                # Relation atoms are plain dicts
+                return 1 if isinstance(atom, PleaseInstantiateRelation) else 999
+            if key is None:
+                if isinstance(atom, PleaseInstantiateEntity | PleaseInstantiateAttributeEntity):
+                    key = 0
+                elif isinstance(atom, PleaseInstantiateRelation):
+                    key = 1
+                else:
+                    key = 999
+                atom_keys[atom] = key
+            return key
+        elif type_id == PleaseAssign._d["user_type_id"]:
             return 10
         return 999
 
-    commands = commands | sort[simple_key] | collect
+    commands = sorted(commands, key=simple_key)
+
+    new_commands = []
 
+    cmd_mapping = {}
+    ready_cmds = deque()
+    # Number of dependencies still outstanding for each command. Duplicated
+    # dependencies are counted (and released) once per occurrence.
+    remaining = {}
+    dependents = defaultdict(list)
 
-    # TODO: Build a dependency graph
-    if True:
-        new_commands = []
+    # Build graph
+    for cmd in commands:
+        name,deps = command_dependencies(cmd, gs)
 
-        from collections import defaultdict
-        cmd_mapping = {}
-        ready_cmds = []
-        dependencies = {}
-        dependents = defaultdict(lambda: [])
+        # Special case for no id - can't have any dependents
+        if name is None:
+            assert len(deps) == 0
+            new_commands.append(cmd)
+            continue
 
-        # Build graph
+        cmd_mapping[name] = cmd
+
+        if len(deps) == 0:
+            ready_cmds.append(name)
+        else:
+            remaining[name] = len(deps)
+            for dep in deps:
+                dependents[dep].append(name)
+
+    # Work through commands that have their deps done
+    while ready_cmds:
+        name = ready_cmds.popleft()
+        new_commands.append(cmd_mapping[name])
+
+        # Free up other commands that dependended on this one
+        for other in dependents.get(name, ()):
+            remaining[other] -= 1
+            if remaining[other] == 0:
+                ready_cmds.append(other)
+
+    # We only went through all "ready" commands. There might have been some
+    # that never became ready in an invalid wish case.
+    if len(new_commands) != len(commands):
+        reverse_mapping = {id(b): a for a,b in cmd_mapping.items()}
+        done = {id(cmd) for cmd in new_commands}
+        done_names = {reverse_mapping[i] for i in done if i in reverse_mapping}
+        print()
+        print("======")
         for cmd in commands:
-            name,deps = (cmd,gs) | match_rules[[
-                *command_dep_rules,
-                (Any, not_implemented_error["Command unknown for dependency ordering"]),
-            ]] | collect
-
-            # Special case for no id - can't have any dependents
-            if name is None:
-                assert len(deps) == 0
-                new_commands += [cmd]
+            if id(cmd) in done:
                 continue
-
-            cmd_mapping[name] = cmd
-
-            if len(deps) == 0:
-                ready_cmds += [name]
-            else:
-                dependencies[name] = deps
-                for dep in deps:
-                    dependents[dep] += [name]
-
-        # Work through commands that have their deps done
-        while len(ready_cmds) > 0:
-            name = ready_cmds.pop(0)
-            new_commands += [cmd_mapping[name]]
-
-            # Free up other commands that dependended on this one
-            for other in dependents[name]:
-                dependencies[other].remove(name)
-                if len(dependencies[other]) == 0:
-                    ready_cmds += [other]
-
-        # We only went through all "ready" commands. There might have been some
-        # that never became ready in an invalid wish case.
-        if len(new_commands) != len(commands):
-            reverse_mapping = {b:a for a,b in cmd_mapping.items()}
-            print()
-            print("======")
-            for cmd in commands:
-                if cmd in new_commands:
-                    continue
-                name = reverse_mapping[cmd]
-                print("----")
-                print(name)
-                print(cmd)
-                print("--")
-                for dep in dependencies[name]:
+            name = reverse_mapping[id(cmd)]
+            print("----")
+            print(name)
+            print(cmd)
+            print("--")
+            _,deps = command_dependencies(cmd, gs)
+            for dep in deps:
+                if dep not in done_names:
                     print(dep)
-                
-            print()
-            raise Exception("Unable to order all commands")
 
-        commands = new_commands
-            
-    assert are_commands_ordered(commands, gs)
-    # TODO: Temporary for testing
-    return commands
+        print()
+        raise Exception("Unable to order all commands")
+
+    if verify_ordering:
+        assert are_commands_ordered(new_commands, gs)
+    return new_commands
 
 def are_commands_ordered(commands: List[PleaseCommandLevel1], gs: GraphSlice):
     # Instead of generating a list, this should really just check that the
@@ -113,10 +130,7 @@ def are_commands_ordered(commands: List[PleaseCommandLevel1], gs: GraphSlice):
     dependencies = {}
 
     for ind,cmd in enumerate(commands):
-        name,deps = (cmd,gs) | match_rules[[
-            *command_dep_rules,
-            (Any, not_implemented_error["Command unknown for dependency ordering"]),
-        ]] | collect
+        name,deps = command_dependencies(cmd, gs)
 
         # Special case for no id - can't have any dependents
         if name is None:
@@ -135,6 +149,18 @@ def are_commands_ordered(commands: List[PleaseCommandLevel1], gs: GraphSlice):
 
     return True
 
+def command_dependencies(cmd, gs):
+    """Returns (name, deps) of the level 1 command cmd. Dispatches on the user
+    type of the command directly rather than going through match_rules, which
+    dominates for large numbers of commands."""
+    dep_func = command_dep_dispatch().get(getattr(cmd, "_user_type_id", None), None)
+    if dep_func is None:
+        return (cmd,gs) | match_rules[[
+            *command_dep_rules,
+            (Any, not_implemented_error["Command unknown for dependency ordering"]),
+        ]] | collect
+    return dep_func(cmd, gs)
+
 
 
 
@@ -182,4 +208,17 @@ command_dep_rules = [
     (PleaseTerminate, deps_terminate),
     (PleaseAssignJustValue, deps_assign),
     (PleaseTagJustTag, deps_tag),
-]
\ No newline at end of file
+]
+_command_dep_dispatch = None
+def command_dep_dispatch():
+    # Level 1 assign and tag commands only ever refer to existing ids, so the
+    # JustValue/JustTag refinements of command_dep_rules don't need rechecking.
+    global _command_dep_dispatch
+    if _command_dep_dispatch is None:
+        _command_dep_dispatch = {
+            PleaseInstantiate._d["user_type_id"]: deps_instantiate,
+            PleaseTerminate._d["user_type_id"]: deps_terminate,
+            PleaseAssign._d["user_type_id"]: deps_assign,
+            PleaseTag._d["user_type_id"]: deps_tag,
+        }
+    return _command_dep_dispatch
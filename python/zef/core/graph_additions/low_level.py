@@ -15,9 +15,10 @@
 from ... import report_import
 report_import("zef.core.graph_additions.low_level")
 
+import builtins
 from ..VT import *
 from .._ops import *
-from ..internals import Transaction
+from ..internals import Transaction, VRT
 from ... import pyzef
 from ..VT.rae_types import RAET_get_token
 
@@ -85,92 +86,134 @@ def perform_level1_commands(command_struct: Level1CommandInfo, keep_internal_ids
             raise Exception("Shouldn't get here")
 
 
+    # AETs of the AEs created by batches in this transaction, by id
+    aet_of_ids = {}
+
+    def record_instantiation(cmd, z, aet_token=None):
+        # The batched equivalent of the end of the instantiate branch of
+        # perform_single.
+        if "internal_ids" in cmd:
+            for id in cmd.internal_ids:
+                record_id(id, z)
+                if aet_token is not None and _hashable(id):
+                    aet_of_ids[id] = aet_token
+
+    def perform_single(cmd):
+        # print("Doing cmd", cmd)
+        if isinstance(cmd, PleaseInstantiate):
+            # If is a brand-new item (no origin_uid) then create
+            # Otherwise, merge in, referencing the original via lineage
+
+            # z will be the object created/merged
+            z = None
+            if "origin_uid" in cmd:
+                assert isinstance(cmd.origin_uid, EternalUID)
+                assert cmd.origin_uid not in gs
+
+                if cmd.origin_uid in g:
+                    # In this branch, the foreign RAE already exists and we
+                    # need to link it back up. This could have happened with
+                    # an instance that was created and terminated.
+                    raise NotImplementedError("TODO: reviving a terminated instance")
+                else:
+                    if isinstance(cmd["atom"], PleaseInstantiateEntity):
+                        z = internals.merge_entity_(g, RAET_get_token(cmd.atom), cmd.origin_uid.blob_uid, cmd.origin_uid.graph_uid)
+                        z = now(z)
+                    elif isinstance(cmd["atom"], PleaseInstantiateAttributeEntity):
+                        z = internals.merge_atomic_entity_(g, RAET_get_token(cmd.atom), cmd.origin_uid.blob_uid, cmd.origin_uid.graph_uid)
+                        z = now(z)
+                    elif isinstance(cmd["atom"], PleaseInstantiateRelation):
+                        z_src = find_id(cmd["atom"]["source"])
+                        z_trg = find_id(cmd["atom"]["target"])
+                        z = internals.merge_relation_(g, RAET_get_token(cmd.atom["rt"]),
+                                                      to_ezefref(z_src), to_ezefref(z_trg),
+                                                      cmd.origin_uid.blob_uid, cmd.origin_uid.graph_uid)
+                        z = now(z)
+                    else:
+                        raise NotImplementedError(f"TODO cmd.atom for merge: {cmd['atom']}")
+
+                euid_mapping[cmd.origin_uid] = z
+            else:
+                if isinstance(cmd.atom, PleaseInstantiateEntity | PleaseInstantiateAttributeEntity):
+                    raet = RAET_get_token(cmd.atom)
+                    z = pyzef.main.instantiate(RAET_get_token(cmd.atom), g)
+                elif isinstance(cmd.atom, PleaseInstantiateRelation):
+                    z_source = find_id(cmd.atom["source"])
+                    z_target = find_id(cmd.atom["target"])
+                    z = pyzef.main.instantiate(z_source, RAET_get_token(cmd.atom["rt"]), z_target, g)
+                elif isinstance(cmd.atom, PleaseInstantiateDelegate):
+                    z = to_delegate(cmd.atom, now(g), True)
+                    # Special case for recording an id
+                    record_id(cmd.atom, z)
+                elif isinstance(cmd.atom, PleaseInstantiateValueNode):
+                    val = internals.val_as_serialized_if_necessary(cmd.atom)
+                    z = pyzef.main.instantiate_value_node(val, Graph(gs))
+                    # Special case for recording an id
+                    record_id(cmd.atom, z)
+                else:
+                    raise NotImplementedError("TODO cmd.atom")
+
+            # TODO: This should really be a "to ref" which would just be a
+            # normal ZefRef in the future. For now, we'll do it this way,
+            # but have the final processing of the receipt to turn these
+            # into ZefRefs, just like the old graph delta.
+            if "internal_ids" in cmd:
+                # print("About to record", z)
+                for id in cmd.internal_ids:
+                    record_id(id, z)
+        elif isinstance(cmd, PleaseAssign):
+            z = find_id(cmd.target)
+            internals.assign_value_imp(z, cmd.value.arg)
+        elif isinstance(cmd, PleaseTerminate):
+            z = find_id(cmd.target)
+            # Note: if we don't find a z here, it could be that this is a
+            # relation which was terminated by its source/target
+            # disappearing. Ideally we should order the commands so this is
+            # fine, but it is otherwise a pain in the neck, so just ignore
+            # it here.
+            if z is not None:
+                pyzef.zefops.terminate(z)
+        elif isinstance(cmd, PleaseTag):
+            z = find_id(cmd.target)
+            pyzef.main.tag(z, cmd.tag)
+        else:
+            raise NotImplementedError(f"TODO cmd: {cmd}")
+
     with Transaction(g) as ctx:
         # Note: we might have a transaction open around us so check both now and
         # the previous graph slices.
         if gs != now(g) and gs != now(g) | time_travel[-1] | collect:
             raise Exception("Can't perform level 1 commands onto a different graph slice from which they were constructed: {now(g)=}, {gs=}")
 
-        for cmd in command_struct.cmds:
-            # print("Doing cmd", cmd)
-            if isinstance(cmd, PleaseInstantiate):
-                # If is a brand-new item (no origin_uid) then create
-                # Otherwise, merge in, referencing the original via lineage
-
-                # z will be the object created/merged
-                z = None
-                if "origin_uid" in cmd:
-                    assert isinstance(cmd.origin_uid, EternalUID)
-                    assert cmd.origin_uid not in gs
-
-                    if cmd.origin_uid in g:
-                        # In this branch, the foreign RAE already exists and we
-                        # need to link it back up. This could have happened with
-                        # an instance that was created and terminated.
-                        raise NotImplementedError("TODO: reviving a terminated instance")
+        for step in compile_level1_commands(command_struct.cmds):
+            kind = step[0]
+            if kind == "single":
+                perform_single(step[1])
+            elif kind == "instantiate_many":
+                _,token,cmds,is_aet = step
+                zs = pyzef.main.instantiate_many(token, len(cmds), g)
+                for cmd,z in zip(cmds, zs):
+                    record_instantiation(cmd, z, token if is_aet else None)
+            elif kind == "instantiate_relations":
+                _,token,cmds = step
+                srcs = [find_id(cmd.atom["source"]) for cmd in cmds]
+                trgs = [find_id(cmd.atom["target"]) for cmd in cmds]
+                zs = pyzef.main.instantiate_many(srcs, token, trgs, g)
+                for cmd,z in zip(cmds, zs):
+                    record_instantiation(cmd, z)
+            elif kind == "assign_many":
+                for cmd in step[1]:
+                    z = find_id(cmd.target)
+                    value = cmd.value.arg
+                    token = aet_of_ids.get(cmd.target, None) if _hashable(cmd.target) else None
+                    if token is not None and type(value) in _direct_assign_types and token.rep_type != VRT.Serialized:
+                        # We created this AE in this transaction, so the
+                        # checks in assign_value_imp can be skipped.
+                        pyzef.zefops.assign_value(z, value)
                     else:
-                        if isinstance(cmd["atom"], PleaseInstantiateEntity):
-                            z = internals.merge_entity_(g, RAET_get_token(cmd.atom), cmd.origin_uid.blob_uid, cmd.origin_uid.graph_uid)
-                            z = now(z)
-                        elif isinstance(cmd["atom"], PleaseInstantiateAttributeEntity):
-                            z = internals.merge_atomic_entity_(g, RAET_get_token(cmd.atom), cmd.origin_uid.blob_uid, cmd.origin_uid.graph_uid)
-                            z = now(z)
-                        elif isinstance(cmd["atom"], PleaseInstantiateRelation):
-                            z_src = find_id(cmd["atom"]["source"])
-                            z_trg = find_id(cmd["atom"]["target"])
-                            z = internals.merge_relation_(g, RAET_get_token(cmd.atom["rt"]),
-                                                          to_ezefref(z_src), to_ezefref(z_trg),
-                                                          cmd.origin_uid.blob_uid, cmd.origin_uid.graph_uid)
-                            z = now(z)
-                        else:
-                            raise NotImplementedError(f"TODO cmd.atom for merge: {cmd['atom']}")
-
-                    euid_mapping[cmd.origin_uid] = z
-                else:
-                    if isinstance(cmd.atom, PleaseInstantiateEntity | PleaseInstantiateAttributeEntity):
-                        raet = RAET_get_token(cmd.atom)
-                        z = pyzef.main.instantiate(RAET_get_token(cmd.atom), g)
-                    elif isinstance(cmd.atom, PleaseInstantiateRelation):
-                        z_source = find_id(cmd.atom["source"])
-                        z_target = find_id(cmd.atom["target"])
-                        z = pyzef.main.instantiate(z_source, RAET_get_token(cmd.atom["rt"]), z_target, g)
-                    elif isinstance(cmd.atom, PleaseInstantiateDelegate):
-                        z = to_delegate(cmd.atom, now(g), True)
-                        # Special case for recording an id
-                        record_id(cmd.atom, z)
-                    elif isinstance(cmd.atom, PleaseInstantiateValueNode):
-                        val = internals.val_as_serialized_if_necessary(cmd.atom)
-                        z = pyzef.main.instantiate_value_node(val, Graph(gs))
-                        # Special case for recording an id
-                        record_id(cmd.atom, z)
-                    else:
-                        raise NotImplementedError("TODO cmd.atom")
-
-                # TODO: This should really be a "to ref" which would just be a
-                # normal ZefRef in the future. For now, we'll do it this way,
-                # but have the final processing of the receipt to turn these
-                # into ZefRefs, just like the old graph delta.
-                if "internal_ids" in cmd:
-                    # print("About to record", z)
-                    for id in cmd.internal_ids:
-                        record_id(id, z)
-            elif isinstance(cmd, PleaseAssign):
-                z = find_id(cmd.target)
-                internals.assign_value_imp(z, cmd.value.arg)
-            elif isinstance(cmd, PleaseTerminate):
-                z = find_id(cmd.target)
-                # Note: if we don't find a z here, it could be that this is a
-                # relation which was terminated by its source/target
-                # disappearing. Ideally we should order the commands so this is
-                # fine, but it is otherwise a pain in the neck, so just ignore
-                # it here.
-                if z is not None:
-                    pyzef.zefops.terminate(z)
-            elif isinstance(cmd, PleaseTag):
-                z = find_id(cmd.target)
-                pyzef.main.tag(z, cmd.tag)
+                        internals.assign_value_imp(z, value)
             else:
-                raise NotImplementedError(f"TODO cmd: {cmd}")
+                raise Exception(f"Unknown step kind: {kind}")
 
     # We keep track of the exact GraphSlice resulting from this transaction
     gs_updated = GraphSlice(ctx)
@@ -188,3 +231,132 @@ def perform_level1_commands(command_struct: Level1CommandInfo, keep_internal_ids
     receipt = maybe_unwrap_variables_in_receipt(receipt)
      
     return gs_updated, receipt
+
+
+
+##############################
+# * Batching
+#----------------------------
+# Commands are grouped into steps so that runs of similar commands can be
+# performed with a single call into pyzef. Only runs of commands which can't
+# depend on each other are grouped:
+#
+# - instantiations of entities and AEs without an origin_uid have no
+#   dependencies, so a run of these is grouped by type.
+# - relation instantiations are grouped by type, with the run ending before
+#   any relation that refers to an id created within the run, or to a value
+#   node or delegate (which are EZefRefs, not accepted by instantiate_many).
+# - value assignments are kept in order, but skip some checks when the AE was
+#   created by a batch.
+
+_direct_assign_types = {int, float, str, bool}
+_unbatchable_endpoint = WrappedValue | DelegateRef
+
+def _hashable(x):
+    try:
+        hash(x)
+        return True
+    except TypeError:
+        return False
+
+def _classify_command(cmd, atom_kinds):
+    # Avoids the isinstance checks on ValueTypes, which are expensive for
+    # large numbers of commands. Returns "E", "A" or "R" for an instantiation
+    # that can be batched, "V" for an assignment and None otherwise.
+    type_id = getattr(cmd, "_user_type_id", None)
+    if type_id == PleaseAssign._d["user_type_id"]:
+        return "V"
+    if type_id != PleaseInstantiate._d["user_type_id"] or "origin_uid" in cmd:
+        return None
+    atom = cmd._value["atom"]
+    if type(atom) is dict:
+        return "R"
+    if not _hashable(atom):
+        return None
+    kind = atom_kinds.get(atom, False)
+    if kind is False:
+        if isinstance(atom, PleaseInstantiateEntity):
+            kind = "E"
+        elif isinstance(atom, PleaseInstantiateAttributeEntity):
+            kind = "A"
+        else:
+            kind = None
+        atom_kinds[atom] = kind
+    return kind
+
+def compile_level1_commands(cmds):
+    """Returns the steps to perform the ordered commands cmds, as tuples of:
+    ("single", cmd), ("instantiate_many", token, cmds, is_aet),
+    ("instantiate_relations", token, cmds) or ("assign_many", cmds)."""
+    if not hasattr(pyzef.main, "instantiate_many"):
+        return [("single", cmd) for cmd in cmds]
+
+    steps = []
+    atom_kinds = {}
+    tokens = {}
+    def token_of(raet):
+        try:
+            token = tokens.get(raet, None)
+        except TypeError:
+            return RAET_get_token(raet)
+        if token is None:
+            token = tokens[raet] = RAET_get_token(raet)
+        return token
+
+    i = 0
+    n = len(cmds)
+    while i < n:
+        kind = _classify_command(cmds[i], atom_kinds)
+        if kind is None:
+            steps.append(("single", cmds[i]))
+            i += 1
+            continue
+
+        # Only contiguous runs of the same type are batched, so that blobs
+        # and TX events are created in the same order as one at a time.
+        j = i
+        if kind in ["E", "A"]:
+            atom = cmds[i]._value["atom"]
+            while (j < n
+                   and _classify_command(cmds[j], atom_kinds) == kind
+                   and cmds[j]._value["atom"] == atom):
+                j += 1
+            if j - i == 1:
+                steps.append(("single", cmds[i]))
+            else:
+                steps.append(("instantiate_many", token_of(atom), cmds[i:j], kind == "A"))
+        elif kind == "R":
+            rt = cmds[i]._value["atom"]["rt"]
+            pending = set()
+            while j < n:
+                cmd = cmds[j]
+                if _classify_command(cmd, atom_kinds) != "R":
+                    break
+                atom = cmd._value["atom"]
+                src,trg = atom["source"], atom["target"]
+                if not (_hashable(src) and _hashable(trg) and _hashable(atom["rt"])):
+                    break
+                if atom["rt"] != rt:
+                    break
+                if src in pending or trg in pending:
+                    break
+                if isinstance(src, _unbatchable_endpoint) or isinstance(trg, _unbatchable_endpoint):
+                    break
+                internal_ids = cmd._value.get("internal_ids", [])
+                if not builtins.all(_hashable(id) for id in internal_ids):
+                    break
+                pending.update(internal_ids)
+                j += 1
+            if j - i <= 1:
+                # The first relation can't be grouped
+                steps.append(("single", cmds[i]))
+                j = i + 1
+            else:
+                steps.append(("instantiate_relations", token_of(rt), cmds[i:j]))
+        else:
+            while j < n and _classify_command(cmds[j], atom_kinds) == "V":
+                j += 1
+            steps.append(("assign_many", cmds[i:j]))
+        i = j
+
+    return steps
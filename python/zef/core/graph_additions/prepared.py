@@ -0,0 +1,206 @@
+# Copyright 2022 Synchronous Technologies Pte Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from ... import report_import
+report_import("zef.core.graph_additions.prepared")
+
+# Prepared wishes are for sending many structurally identical wishes, where
+# only the values of some AttributeEntities change. The wish is interpreted
+# once, with placeholders for those values, and each submission only
+# substitutes the values into the commands.
+#
+# The level 2 commands are always reused. The level 1 commands (i.e. after
+# translation and ordering) are only reused when the wish can't depend on the
+# graph slice it is applied to, which is the case when it only refers to new
+# items through wish ids.
+#
+# Example:
+#
+#   prepared = prepare_wish([
+#       ET.Person["p"],
+#       (Z["p"], RT.Name, wish_param("name", AET.String)),
+#       (Z["p"], RT.Age, wish_param("age", AET.Int)),
+#   ])
+#   for name,age in people:
+#       prepared.transact(g, name=name, age=age) | run
+
+from .common import *
+from ..user_value_type import UserValueInstance_
+
+WishParam = UserValueType("WishParam",
+                          Dict,
+                          Pattern[{"name": String,
+                                   "aet": AET}])
+
+def wish_param(name: String, aet: AET):
+    """A placeholder for a value in a wish given to prepare_wish. It stands
+    for a new AttributeEntity of type aet, assigned the value bound to name."""
+    return PleaseAssign({"target": aet,
+                         "value": Val(WishParam(name=name, aet=aet))})
+
+
+class PreparedWish:
+    def __init__(self, wish, interpretation_rules=None):
+        if not isinstance(wish, GraphWishInput | List[GraphWishInput]):
+            raise TypeError(f"The following is not a valid GraphWishInput: {wish}")
+        if isinstance(wish, GraphWishInput):
+            wish = [wish]
+
+        if interpretation_rules is None:
+            from .wish_interpretation import default_interpretation_rules
+            interpretation_rules = default_interpretation_rules
+
+        from .wish_interpretation import generate_level2_commands
+        lvl2 = generate_level2_commands(wish, interpretation_rules)
+        self.lvl2_cmds = lvl2["cmds"]
+        self.custom = lvl2.get("custom", None)
+        self.lvl2_slots = param_slots(self.lvl2_cmds)
+
+        self.params = {}
+        for _,param in self.lvl2_slots:
+            name = param.name
+            if name in self.params and self.params[name] != param.aet:
+                raise Exception(f"Wish parameter {name} is used with different types: {self.params[name]} and {param.aet}")
+            self.params[name] = param.aet
+
+        self.slice_independent = all(is_slice_independent(cmd) for cmd in self.lvl2_cmds)
+
+        import threading
+        self._lock = threading.Lock()
+        self._lvl1 = None
+
+    def __repr__(self):
+        return f"PreparedWish(params={self.params}, n_cmds={len(self.lvl2_cmds)}, slice_independent={self.slice_independent})"
+
+    def transact(self, g, **values):
+        """Returns the transaction effect for this wish with the given parameter
+        values onto g, equivalent to `wish | transact[g]`."""
+        check_param_values(self.params, values)
+
+        if isinstance(g, Graph | GraphRef):
+            target_ref = GraphRef(g)
+        elif isinstance(g, FlatGraph):
+            target_ref = g
+        else:
+            raise Exception("Unknown target for a transaction")
+
+        lvl2 = {"cmds": bind_params(self.lvl2_cmds, self.lvl2_slots, values)}
+        if self.custom is not None:
+            lvl2["custom"] = self.custom
+
+        from ..fx import FX
+        eff = {
+            "type": FX.Graph.Transact,
+            "target_glike": target_ref,
+            "level2_commands": lvl2,
+            "translation_rules": "default",
+            "post_transact_rule": None,
+        }
+        if self.slice_independent:
+            cmds,slots,resolved_variables = self.level1_template(target_ref)
+            eff["level1_commands"] = {"cmds": bind_params(cmds, slots, values),
+                                      "resolved_variables": resolved_variables}
+        return eff
+
+    def level1_template(self, target_ref):
+        with self._lock:
+            if self._lvl1 is None:
+                from .wish_translation2 import generate_level1_commands
+                if isinstance(target_ref, GraphRef):
+                    gs = now(Graph(target_ref))
+                else:
+                    gs = target_ref
+                info = generate_level1_commands(self.lvl2_cmds, gs)
+                cmds = list(info.cmds)
+                self._lvl1 = (cmds, param_slots(cmds), info.resolved_variables)
+            return self._lvl1
+
+def prepare_wish(wish, interpretation_rules=None) -> PreparedWish:
+    return PreparedWish(wish, interpretation_rules)
+
+
+def level1_info_for(prepared_lvl1, gs):
+    # The commands were validated when the template was first translated, and
+    # only the assigned values have changed since, so skip the checks of the
+    # Level1CommandInfo constructor.
+    return UserValueInstance_(Level1CommandInfo._d["user_type_id"],
+                              {"gs": gs,
+                               "cmds": prepared_lvl1["cmds"],
+                               "resolved_variables": prepared_lvl1["resolved_variables"]})
+
+
+##############################
+# * Internals
+#----------------------------
+
+def param_slots(cmds):
+    # The positions of the assign commands whose value is a WishParam
+    slots = []
+    assign_id = PleaseAssign._d["user_type_id"]
+    for i,cmd in enumerate(cmds):
+        if getattr(cmd, "_user_type_id", None) != assign_id:
+            continue
+        val = cmd._value["value"]
+        if isinstance(val.arg, WishParam):
+            slots.append((i, val.arg))
+    return slots
+
+def bind_params(cmds, slots, values):
+    bound = list(cmds)
+    for i,param in slots:
+        cmd = cmds[i]
+        d = dict(cmd._value)
+        d["value"] = Val(values[param.name])
+        # The replaced value has already been checked against the parameter
+        # type, so there's no need to go through the PleaseAssign constructor.
+        bound[i] = UserValueInstance_(cmd._user_type_id, d)
+    return bound
+
+_aet_of_py_type = {}
+def check_param_values(params, values):
+    if set(values) != set(params):
+        missing = set(params) - set(values)
+        extra = set(values) - set(params)
+        raise TypeError(f"Wrong wish parameters given. Missing: {missing}, unknown: {extra}")
+    for name,aet in params.items():
+        val = values[name]
+        # Plain python types always map to the same AET
+        if type(val) in (int, float, str, bool):
+            val_aet = _aet_of_py_type.get(type(val), None)
+            if val_aet is None:
+                val_aet = map_scalar_to_aet(val)
+                _aet_of_py_type[type(val)] = val_aet
+        else:
+            val_aet = map_scalar_to_aet(val)
+        if val_aet != aet:
+            raise TypeError(f"Wish parameter {name} expects a value for {aet} but got {val!r}")
+
+def is_slice_independent(cmd):
+    # Whether the translation of the level 2 command cmd can be affected by
+    # the graph slice. Only commands that solely refer to wish ids qualify.
+    type_id = getattr(cmd, "_user_type_id", None)
+    if type_id == PleaseInstantiate._d["user_type_id"]:
+        if "origin_uid" in cmd:
+            return False
+        atom = cmd.atom
+        if isinstance(atom, PleaseInstantiateRelation):
+            return isinstance(atom["source"], WishID) and isinstance(atom["target"], WishID)
+        return isinstance(atom, PleaseInstantiateEntity | PleaseInstantiateAttributeEntity)
+    if type_id in (PleaseAssign._d["user_type_id"],
+                   PleaseTag._d["user_type_id"],
+                   PleaseMustLive._d["user_type_id"]):
+        return isinstance(cmd.target, WishID)
+    if type_id == PleaseAlias._d["user_type_id"]:
+        return all(isinstance(x, WishID) for x in cmd.ids)
+    return False
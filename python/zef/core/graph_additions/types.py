@@ -258,9 +258,12 @@ PleaseCommandLevel1 = _alias(PleaseInstantiate
 
 
 
-# An import delay
+# An import delay. The ordering is established by order_level1_commands, so
+# this is only rechecked when debugging.
 def are_commands_ordered(info):
-    from .command_ordering import are_commands_ordered
+    from .command_ordering import are_commands_ordered, verify_ordering
+    if not verify_ordering:
+        return True
     return are_commands_ordered(info["cmds"], info["gs"])
 OrderedCommands = Is[are_commands_ordered]
 # When prepared, a list of commands must be in the context of a graph slice
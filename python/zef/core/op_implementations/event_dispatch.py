@@ -0,0 +1,213 @@
+# Copyright 2022 Synchronous Technologies Pte Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# The listeners created by `g | on[...]` all share a single subscription on
+# the graph, through a GraphEventDispatcher. It decodes the events of each
+# transaction once, and routes them to the streams of the listeners through
+# indices, rather than every listener walking over every event:
+#
+# 1) by the blob index of a specific ZefRef: on[terminated[z]], on[assigned[z]]
+# 2) by the RAE type of the event target: on[instantiated[ET.Foo]],
+#    on[assigned[AET.String]]. As the listened for types can be any
+#    ValueType, the streams are found by testing each selector once per
+#    concrete type, and then cached.
+# 3) by the relation type of a triple: on[instantiated[(z, RT.Foo, ET.Bar)]],
+#    after which the source and target of the relation are tested per listener.
+#
+# Events of a kind which no listener is interested in are not decoded at all.
+#
+# Once the last stream of a graph is removed with remove_stream, the
+# dispatcher unsubscribes and is dropped. The registry is keyed by the uid
+# of the graph, so that it holds no reference to the graph itself.
+
+from .. import *
+from .._ops import *
+from .._core import index
+from ...pyzef import zefops as pyzefops
+from ..logger import log
+import builtins
+import threading
+
+_dispatchers = {}
+_dispatchers_lock = threading.Lock()
+
+def dispatcher_for(g):
+    """The GraphEventDispatcher of g, created and subscribed on first use."""
+    key = g.uid
+    with _dispatchers_lock:
+        dispatcher = _dispatchers.get(key, None)
+        if dispatcher is not None and dispatcher.graph_id != hash(g):
+            # The graph was unloaded and loaded again, which ended the old
+            # subscription
+            dispatcher = None
+        if dispatcher is None:
+            dispatcher = GraphEventDispatcher(g)
+            _dispatchers[key] = dispatcher
+        return dispatcher
+
+def remove_stream(g, stream):
+    """Stops pushing the events of g to stream. The subscription on g is
+    ended once no streams are left."""
+    key = g.uid
+    with _dispatchers_lock:
+        dispatcher = _dispatchers.get(key, None)
+        if dispatcher is None or dispatcher.graph_id != hash(g):
+            return
+        if dispatcher.remove(stream) == 0:
+            dispatcher.sub.unsubscribe()
+            del _dispatchers[key]
+
+
+def _kind_id(op_kind):
+    return op_kind._d["user_type_id"]
+
+class GraphEventDispatcher:
+    def __init__(self, g):
+        from .implementation_typing_functions import tx_events
+        self._tx_events = tx_events
+        self.lock = threading.Lock()
+        self.n_listeners = 0
+        kinds = [_kind_id(Instantiated), _kind_id(Assigned), _kind_id(Terminated)]
+        # kind -> blob index -> [stream]
+        self.by_index = {kind: {} for kind in kinds}
+        # kind -> [(selector, stream)]
+        self.by_type = {kind: [] for kind in kinds}
+        # kind -> concrete type -> [stream], derived from by_type
+        self.type_cache = {kind: {} for kind in kinds}
+        # kind -> RT -> [(src, trgt, stream)]
+        self.by_rt = {kind: {} for kind in kinds}
+
+        # Distinguishes a reloaded graph with the same uid, without keeping
+        # a reference to the graph
+        self.graph_id = hash(g)
+        sub_decl = pyzefops.subscribe[pyzefops.keep_alive[True]][self.on_tx]
+        self.sub = g | sub_decl
+
+    def __repr__(self):
+        return f"<GraphEventDispatcher listeners={self.n_listeners}>"
+
+    ##############################
+    # * Registration
+    #----------------------------
+
+    def add_specific(self, op_kind, z, stream):
+        kind = _kind_id(op_kind)
+        with self.lock:
+            self.by_index[kind].setdefault(index(to_ezefref(z)), []).append(stream)
+            self.n_listeners += 1
+
+    def add_type(self, op_kind, selector, stream):
+        kind = _kind_id(op_kind)
+        with self.lock:
+            self.by_type[kind].append((selector, stream))
+            self.type_cache[kind] = {}
+            self.n_listeners += 1
+
+    def add_triple(self, op_kind, src, rt, trgt, stream):
+        for x in (src, trgt):
+            if not isinstance(x, ZefRef | ValueType):
+                raise ValueError(f"Expected source or target filters to be ZefRef, RaeType, or ValueType but got {type(x)} instead.")
+        kind = _kind_id(op_kind)
+        with self.lock:
+            self.by_rt[kind].setdefault(rt, []).append((src, trgt, stream))
+            self.n_listeners += 1
+
+    def remove(self, stream):
+        """Removes all registrations of stream, returning the number of
+        listeners left."""
+        z_stream = stream.stream_ezefref
+        def keep(other):
+            return other.stream_ezefref != z_stream
+        with self.lock:
+            n_after = 0
+            for kind in self.by_index:
+                for idx,streams in builtins.list(self.by_index[kind].items()):
+                    streams[:] = [x for x in streams if keep(x)]
+                    n_after += len(streams)
+                    if not streams:
+                        del self.by_index[kind][idx]
+                self.by_type[kind] = [(selector,x) for selector,x in self.by_type[kind] if keep(x)]
+                n_after += len(self.by_type[kind])
+                self.type_cache[kind] = {}
+                for rt,triples in builtins.list(self.by_rt[kind].items()):
+                    triples[:] = [(src,trgt,x) for src,trgt,x in triples if keep(x)]
+                    n_after += len(triples)
+                    if not triples:
+                        del self.by_rt[kind][rt]
+            self.n_listeners = n_after
+            return n_after
+
+    ##############################
+    # * Dispatch
+    #----------------------------
+
+    def on_tx(self, root_node):
+        if self.n_listeners == 0:
+            return
+        wanted = {kind for kind in self.by_index
+                  if self.by_index[kind] or self.by_type[kind] or self.by_rt[kind]}
+        evs = self._tx_events(root_node | frame | to_tx | collect,
+                              instantiated=_kind_id(Instantiated) in wanted,
+                              assigned=_kind_id(Assigned) in wanted,
+                              terminated=_kind_id(Terminated) in wanted)
+        for ev in evs:
+            for stream in self.streams_for(ev):
+                # A failing listener must not stop the events reaching the
+                # other listeners, nor the later events of this transaction.
+                try:
+                    LazyValue(ev) | push[stream] | run
+                except Exception as exc:
+                    log.error("Error pushing a graph event to a subscriber", exc_info=exc)
+
+    def streams_for(self, ev):
+        kind = ev._user_type_id
+        z = ev.target
+        streams = []
+        with self.lock:
+            by_index = self.by_index[kind]
+            if by_index:
+                streams += by_index.get(index(to_ezefref(z)), ())
+
+            if self.by_type[kind]:
+                streams += self.type_streams(kind, rae_type(z))
+
+            by_rt = self.by_rt[kind]
+            if by_rt:
+                for src,trgt,stream in by_rt.get(rae_type(z), ()):
+                    if _end_matches(source(z), src) and _end_matches(target(z), trgt):
+                        streams.append(stream)
+        return streams
+
+    def type_streams(self, kind, typ):
+        # Called with the lock held
+        cache = self.type_cache[kind]
+        try:
+            return cache[typ]
+        except KeyError:
+            pass
+        except TypeError:
+            return _matching_streams(self.by_type[kind], typ)
+        streams = _matching_streams(self.by_type[kind], typ)
+        cache[typ] = streams
+        return streams
+
+
+def _matching_streams(selectors, typ):
+    return [stream for selector,stream in selectors
+            if typ == selector or is_a(typ, selector)]
+
+def _end_matches(rae, rae_filter):
+    if isinstance(rae_filter, ZefRef):
+        return to_ezefref(rae) == to_ezefref(rae_filter)
+    return is_a(rae, rae_filter)
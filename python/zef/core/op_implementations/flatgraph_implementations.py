@@ -16,7 +16,6 @@ import builtins
 from typing import Generator, Iterable, Iterator
 
 
-from rx import operators as rxops
 from ..VT.value_type import ValueType_
 
 # This is the only submodule that is allowed to do this. It can assume that everything else has been made available so that it functions as a "user" of the core module.
@@ -27,10 +26,30 @@ from ...pyzef import zefops as pyzefops, main as pymain
 from .. import internals
 from typing import Generator, Iterable, Iterator
 from ..atom import Atom_
+from ..flat_graph import add_blob_edge, remove_blob_edge
 
 
 #-----------------------------FlatGraph Implementations-----------------------------------
 def fg_insert_imp(fg, new_el):
+    assert is_a(fg, FlatGraph)
+    new_blobs, new_key_dict = [*fg.blobs], {**fg.key_dict}
+    fg_insert_into(fg, new_blobs, new_key_dict, new_el)
+
+    new_fg = FlatGraph()
+    new_fg.key_dict = new_key_dict
+    new_fg.blobs = (*new_blobs,)
+    return new_fg
+
+def fg_insert_into(fg, new_blobs, new_key_dict, new_el, owned=None):
+    """
+    Performs the insert of new_el by mutating new_blobs and new_key_dict in
+    place. These start out as (copies of) the blobs and key_dict of fg, which
+    is the FlatGraph that FlatRefs in new_el are compared against.
+
+    owned is the set of blob indices whose edge lists are no longer shared
+    with fg, see add_blob_edge.
+    """
+    if owned is None: owned = set()
     from ..graph_additions.types import PrimitiveValue, PleaseAssign
     from ..graph_additions.common import map_scalar_to_aet
     from ...pyzef.internals import DelegateRelationTriple
@@ -55,9 +74,6 @@ def fg_insert_imp(fg, new_el):
             raise Exception(f"Need to implement code for type {rae}")
         return names[0] if names else None
 
-    assert is_a(fg, FlatGraph)
-    new_fg = FlatGraph()
-    new_blobs, new_key_dict = [*fg.blobs], {**fg.key_dict}
     def idx_generator(n):
         def next_idx():
             nonlocal n
@@ -65,7 +81,7 @@ def fg_insert_imp(fg, new_el):
             return n
         return next_idx
 
-    next_idx = idx_generator(length(fg.blobs) - 1)
+    next_idx = idx_generator(len(new_blobs) - 1)
 
     def inner_zefop_type(zefop, rt):
         return peel(zefop)[0][0] == rt
@@ -114,8 +130,8 @@ def fg_insert_imp(fg, new_el):
                 idx = next_idx()
                 new_blobs.append((idx, rt, [], rt_uid, src_idx, trgt_idx))
                 new_key_dict[rt_uid] = idx
-                if idx not in new_blobs[src_idx][2]: new_blobs[src_idx][2].append(idx)
-                if idx not in new_blobs[trgt_idx][2]: new_blobs[trgt_idx][2].append(-idx)
+                add_blob_edge(new_blobs, src_idx, idx, owned)
+                add_blob_edge(new_blobs, trgt_idx, -idx, owned)
             # elif _get_ref_pointer(new_el):
             #     idx = common_logic(_get_ref_pointer(new_el))
             else:
@@ -142,8 +158,8 @@ def fg_insert_imp(fg, new_el):
                     idx = next_idx()
 
                     new_blobs.append((idx, new_el, [], None, src_idx, trgt_idx))
-                    if idx not in new_blobs[src_idx][2]: new_blobs[src_idx][2].append(idx)
-                    if idx not in new_blobs[trgt_idx][2]: new_blobs[trgt_idx][2].append(-idx)
+                    add_blob_edge(new_blobs, src_idx, idx, owned)
+                    add_blob_edge(new_blobs, trgt_idx, -idx, owned)
                     new_key_dict[new_el] = idx
             else:
                 internal_id = internal_name(new_el)
@@ -271,7 +287,7 @@ def fg_insert_imp(fg, new_el):
             else:
                 # If the flatgraphs are different then merge the FlatGraph in and return the
                 # new index of the blob originally in the other FlatGraph
-                idx = fr_merge_and_retrieve_idx(new_blobs, new_key_dict,next_idx, new_el)
+                idx = fr_merge_and_retrieve_idx(new_blobs, new_key_dict,next_idx, new_el, owned)
         else:
             idx = None
         return idx
@@ -313,8 +329,8 @@ def fg_insert_imp(fg, new_el):
                 raise ValueError(f"Cannot reference an internal element to be used as a Relation. {rt}")
 
             new_blobs.append((idx, rt, [], None, src_idx, trgt_idx))
-            if idx not in new_blobs[src_idx][2]: new_blobs[src_idx][2].append(idx)
-            if idx not in new_blobs[trgt_idx][2]: new_blobs[trgt_idx][2].append(-idx)
+            add_blob_edge(new_blobs, src_idx, idx, owned)
+            add_blob_edge(new_blobs, trgt_idx, -idx, owned)
         elif is_a(new_el, RelationRef):
             rt = new_el.d['type']
             rt_uid = new_el.d["uid"]
@@ -332,8 +348,8 @@ def fg_insert_imp(fg, new_el):
             idx = next_idx()
             new_blobs.append((idx, rt, [], rt_uid, src_idx, trgt_idx))
             new_key_dict[rt_uid] = idx
-            if idx not in new_blobs[src_idx][2]: new_blobs[src_idx][2].append(idx)
-            if idx not in new_blobs[trgt_idx][2]: new_blobs[trgt_idx][2].append(-idx)
+            add_blob_edge(new_blobs, src_idx, idx, owned)
+            add_blob_edge(new_blobs, trgt_idx, -idx, owned)
         elif is_a(new_el, Dict): 
                 _insert_dict(new_el)
         else: 
@@ -354,12 +370,8 @@ def fg_insert_imp(fg, new_el):
         _insert_dict(new_el)
     else: 
         _insert_single(new_el)
-        
-    new_fg.key_dict = new_key_dict
-    new_fg.blobs = (*new_blobs,)
-    return new_fg
 
-def fr_merge_and_retrieve_idx(blobs, k_dict, next_idx, fr):
+def fr_merge_and_retrieve_idx(blobs, k_dict, next_idx, fr, owned):
     fr_idx = fr.idx
     fg2 = fr.fg
 
@@ -390,9 +402,9 @@ def fr_merge_and_retrieve_idx(blobs, k_dict, next_idx, fr):
         
         idx = next_idx()
         rt_b = (idx, b[1], [], None, src_b[0], trgt_b[0])
-        src_b[2].append(idx)
-        trgt_b[2].append(-idx)
         blobs.append(rt_b)
+        add_blob_edge(blobs, src_b[0], idx, owned)
+        add_blob_edge(blobs, trgt_b[0], -idx, owned)
         old_to_new[b[0]] = idx
 
             
@@ -442,6 +454,7 @@ def fg_remove_imp(fg, key):
     idx_key = {idx:key for key,idx in kdict.items()}
     kdict   = {**fg.key_dict}
     blobs   = [*fg.blobs]
+    owned   = set()
 
     def remove_blob(idx, key = None):
         blob  = blobs[idx]
@@ -455,8 +468,8 @@ def fg_remove_imp(fg, key):
             else: del(kdict[key])
             if issubclass(blob_type, RT):
                 src_idx, trgt_idx = blob[4:]
-                if blobs[src_idx] and idx in blobs[src_idx][2]: blobs[src_idx][2].remove(idx)
-                if blobs[trgt_idx] and -idx in blobs[trgt_idx][2]: blobs[trgt_idx][2].remove(-idx)
+                if blobs[src_idx] and idx in blobs[src_idx][2]: remove_blob_edge(blobs, src_idx, idx, owned)
+                if blobs[trgt_idx] and -idx in blobs[trgt_idx][2]: remove_blob_edge(blobs, trgt_idx, -idx, owned)
             ins_outs | map[abs] | for_each[remove_blob]
     remove_blob(idx, key)
 
@@ -565,9 +578,8 @@ def traverse_flatref_imp(fr, rt, direction, traverse_type):
         "in": "in_rel",
     }
     assert isinstance(rt, RT), f"Passed Argument to traverse should be of type RelationType but got {rt}"
-    blob = fr.fg.blobs[fr.idx]
-    specific = blob[2] | filter[greater_than[0] if direction in {"out", "outout"} else less_than[0]] | collect
-    specific_blobs = specific | map[lambda idx: fr.fg.blobs[abs(idx)]] | filter[lambda b: b[1] == rt] | collect
+    specific = fr.fg.index().relations(fr.idx, direction in {"out", "outout"}, rt)
+    specific_blobs = [fr.fg.blobs[idx] for idx in specific]
     if traverse_type == "single" and len(specific_blobs) != 1: return Error.ValueError(f"There isn't exactly one {translation_dict[direction]} RT.{rt} Relation. Did you mean {translation_dict[direction]}s[RT.{rt}]?")
     
     if direction == "inin": idx = 4
@@ -597,25 +609,40 @@ def fr_ins_and_outs_imp(fr):
 def fg_all_imp(fg, selector=None):
     assert is_a(fg, FlatGraph)
     if selector:
-        selected_blobs = fg.blobs | filter[lambda b: is_a(b[1], selector)] | collect
-    else:
-        selected_blobs = fg.blobs 
-    return FlatRefs(fg, [b[0] for b in selected_blobs])
+        return FlatRefs(fg, list(fg.index().select(selector)))
+    return FlatRefs(fg, [b[0] for b in fg.blobs])
 
 
 # ------------------------------Merging FlatGraphs----------------------------------
 def fg_merge_imp(fg1, fg2 = None):
-    if isinstance(fg1, list): return fg1[1:] | reduce[fg_merge_imp][fg1[0]] | collect
+    """
+    Merges FlatGraphs: either fg1 and fg2, or all FlatGraphs in the list fg1.
+    The result is the same as merging the FlatGraphs pairwise from left to
+    right, but the blobs and key_dict are only copied once in total rather
+    than once per pair.
+    """
+    fgs = fg1 if isinstance(fg1, list) else [fg1, fg2]
+    if len(fgs) == 0: return FlatGraph()
+
+    blobs, k_dict = [*fgs[0].blobs], {**fgs[0].key_dict}
+    owned = set()
+    for fg in fgs[1:]:
+        fg_merge_into(blobs, k_dict, owned, fg)
 
-    def idx_generator(n):
-        def next_idx():
-            nonlocal n
-            n = n + 1
-            return n
-        return next_idx
+    new_fg = FlatGraph()
+    new_fg.blobs = blobs
+    new_fg.key_dict = k_dict
+    return new_fg
 
-    blobs, k_dict = [*fg1.blobs], {**fg1.key_dict}
-    next_idx = idx_generator(length(blobs) - 1)
+_uid_pytypes = (internals.BaseUID, internals.EternalUID, internals.ZefRefUID)
+
+def fg_merge_into(blobs, k_dict, owned, fg2):
+    """
+    Merges fg2 into blobs and k_dict, mutating them in place. owned is the
+    set of blob indices whose edge lists are no longer shared with the
+    FlatGraph the blobs were copied from, see add_blob_edge.
+    """
+    next_idx = idx_generator(len(blobs) - 1)
 
     idx_key_2 = {i:k for k,i in fg2.key_dict.items()}
     old_to_new = {}
@@ -627,7 +654,7 @@ def fg_merge_imp(fg1, fg2 = None):
         if old_idx in old_to_new:
             idx = old_to_new[old_idx]
             new_b = blobs[idx]
-        elif (new_b[1] == BT.VALUE_NODE or is_a(new_b[3], UID)) and key in k_dict:
+        elif (new_b[1] == BT.VALUE_NODE or isinstance(new_b[3], _uid_pytypes)) and key in k_dict:
             new_b = blobs[k_dict[key]]
             idx = new_b[0]
         else:
@@ -635,32 +662,31 @@ def fg_merge_imp(fg1, fg2 = None):
             if key: k_dict[key] = idx
             new_b = (idx, new_b[1], [], *new_b[3:])
             blobs.append(new_b)
+            owned.add(idx)
         old_to_new[old_idx] = idx
         return new_b
 
-    for b in fg2.blobs | filter[lambda b: isinstance(b[1], RT)] | sort[lambda b: -len(b[2])]:
+    fg2_blobs = fg2.blobs
+    is_rt = [b is not None and isinstance(b[1], RT) for b in fg2_blobs]
+    for b in sorted((b for b,rt in builtins.zip(fg2_blobs, is_rt) if rt), key=lambda b: -len(b[2])):
         rt_key = idx_key_2.get(b[0], None)
 
-        src_b, trgt_b = fg2.blobs[b[4]], fg2.blobs[b[5]]
+        src_b, trgt_b = fg2_blobs[b[4]], fg2_blobs[b[5]]
         src_b  = retrieve_or_insert_blob(src_b)
         trgt_b = retrieve_or_insert_blob(trgt_b)
         
         idx = next_idx()
         rt_b = (idx, b[1], [], None, src_b[0], trgt_b[0])
-        src_b[2].append(idx)
-        trgt_b[2].append(-idx)
         if rt_key: k_dict[rt_key] = idx
         blobs.append(rt_b)
+        owned.add(idx)
+        # A new relation can't be in an edge list yet, skip the check
+        add_blob_edge(blobs, src_b[0], idx, owned, check_present=False)
+        add_blob_edge(blobs, trgt_b[0], -idx, owned, check_present=False)
         old_to_new[b[0]] = idx
 
-            
-    for b in fg2.blobs | filter[lambda b: not isinstance(b[1], RT)]:
-        if b[0] not in old_to_new: retrieve_or_insert_blob(b)
-
-    new_fg = FlatGraph()
-    new_fg.blobs = blobs
-    new_fg.key_dict = k_dict
-    return new_fg
+    for b,rt in builtins.zip(fg2_blobs, is_rt):
+        if not rt and b is not None and b[0] not in old_to_new: retrieve_or_insert_blob(b)
 
 
 
@@ -668,6 +694,7 @@ def fg_merge_imp(fg1, fg2 = None):
 def fg_remove_imp2(kdict, blobs, idx, key):
     kdict   = {**kdict}
     blobs   = [*blobs]
+    owned   = set()
     idx_key = {idx:key for key,idx in kdict.items()}
 
     def remove_blob(idx, key = None):
@@ -682,8 +709,8 @@ def fg_remove_imp2(kdict, blobs, idx, key):
             else: del(kdict[key])
             if issubclass(blob_type, RT):
                 src_idx, trgt_idx = blob[4:]
-                if blobs[src_idx] and idx in blobs[src_idx][2]: blobs[src_idx][2].remove(idx)
-                if blobs[trgt_idx] and -idx in blobs[trgt_idx][2]: blobs[trgt_idx][2].remove(-idx)
+                if blobs[src_idx] and idx in blobs[src_idx][2]: remove_blob_edge(blobs, src_idx, idx, owned)
+                if blobs[trgt_idx] and -idx in blobs[trgt_idx][2]: remove_blob_edge(blobs, trgt_idx, -idx, owned)
             ins_outs | map[abs] | for_each[remove_blob]
     remove_blob(idx, key)
 
@@ -746,6 +773,7 @@ def fg_transaction_implementation(cmds, fg):
     new_fg = FlatGraph()
     new_blobs = [*fg.blobs]
     new_key_dict =  {**fg.key_dict}
+    owned = set()
     _wish_ids = {}
     next_idx = idx_generator(length(fg.blobs) - 1)
 
@@ -809,8 +837,8 @@ def fg_transaction_implementation(cmds, fg):
                 idx = next_idx()
 
                 new_blobs.append((idx, rt, [], None, src_idx, trgt_idx))
-                if idx not in new_blobs[src_idx][2]: new_blobs[src_idx][2].append(idx)
-                if idx not in new_blobs[trgt_idx][2]: new_blobs[trgt_idx][2].append(-idx)
+                add_blob_edge(new_blobs, src_idx, idx, owned)
+                add_blob_edge(new_blobs, trgt_idx, -idx, owned)
                 _add_internal_id(internal_ids, idx)
 
             elif is_a(atom, Val):
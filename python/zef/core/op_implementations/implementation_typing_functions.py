@@ -16,12 +16,14 @@ import builtins
 from typing import Generator, Iterable, Iterator
 
 
-from rx import operators as rxops
+from ... import lazy_import
+rxops = lazy_import("rx.operators")
 from ..VT.value_type import ValueType_, is_a_
 
 # This is the only submodule that is allowed to do this. It can assume that everything else has been made available so that it functions as a "user" of the core module.
 from .. import *
 from ..op_structs import _call_0_args_translation, type_spec
+from ..generators import ZefGenerator_
 from .._ops import *
 from ..abstract_raes import abstract_rae_from_rae_type_and_uid
 from .flatgraph_implementations import *
@@ -137,19 +139,26 @@ def call_wrap_errors_as_unexpected(func, *args, maybe_context=None, **kwargs):
     except Error_ as e:
         wrap_error_raising(e, maybe_context)
     except Exception as e:
-        # We are overwriting this frame information to add the func name
-        # because without doing it shows call_wrap_errors_as_unexpected as the func_name
-        # however we are unable to figure out the line_no information
-        import inspect
-        py_e,frames = convert_python_exception(e)
-        e = Error.UnexpectedError()
-        e.nested = py_e
-        frames[0]['func_name'] = func.__name__
-        frames[0]['filename'] =  inspect.getfile(func)
-        frames[0]['lineno'] =  ""
-        inspect.getlineno
-        e = add_error_context(e, {"frames": frames})
+        wrap_error_as_unexpected(e, func, maybe_context)
+
+def wrap_error_as_unexpected(e, func, maybe_context=None):
+    # Split out of call_wrap_errors_as_unexpected so that hot loops can call
+    # func directly and only pay for the wrapping when an exception occurs.
+    from ..op_structs import EvalEngineCoreError
+    if isinstance(e, (EvalEngineCoreError, ExceptionWrapper, Error_)):
         wrap_error_raising(e, maybe_context)
+    # We are overwriting this frame information to add the func name
+    # because without doing it shows call_wrap_errors_as_unexpected as the func_name
+    # however we are unable to figure out the line_no information
+    import inspect
+    py_e,frames = convert_python_exception(e)
+    e = Error.UnexpectedError()
+    e.nested = py_e
+    frames[0]['func_name'] = func.__name__
+    frames[0]['filename'] =  inspect.getfile(func)
+    frames[0]['lineno'] =  ""
+    e = add_error_context(e, {"frames": frames})
+    wrap_error_raising(e, maybe_context)
 
 
 ####################################################
@@ -257,6 +266,9 @@ def on_implementation(g, op):
     dataflow graph once an impure functions subscribes at 
     the very end.
 
+    The stream keeps receiving events until it is passed to
+    event_dispatch.remove_stream(g, stream).
+
     ---- Examples ----
     >>> g | on[assigned[AET.String]]                    # assigned[z3]['hello!']      c.f. with action: assign[z3]['hello!']
     >>> g | on[terminated[z2]]                          # terminated[z2], followed by completion_event
@@ -283,81 +295,50 @@ def on_implementation(g, op):
     """
     assert isinstance(op, ValueType)
     assert len(absorbed(op)) == 1
-    from ...pyzef import zefops as internal
     from ..fx import FX, Effect
+    from .event_dispatch import dispatcher_for
+
+    if not isinstance(g, Graph):
+        raise TypeError(f"The first argument passed should be a Graph. A {type(g)} was passed instead.")
 
     stream_d =  FX.Stream.CreatePushableStream() | run
     stream = stream_d['stream']
-    sub_decl = internal.subscribe[internal.keep_alive[True]]
-    
-    if isinstance(g, Graph):
-        op_kind = without_absorbed(op)
-        op_args = absorbed(op)      
-        if op_kind in {Instantiated, Terminated}:
-            
-            if not isinstance(op_args[0], tuple):
-                rae_or_zr = op_args[0]
-                # Type 1: a specific entity i.e on[terminated[zr]]  !! Cannot be on[instantiated[zr]] because doesnt logically make sense !!
-                if isinstance(rae_or_zr, ZefRef): 
-                    assert op_kind == Terminated, "Cannot listen for a specfic ZefRef to be instantiated! Doesn't make sense."
-                    def filter_func(root_node): 
-                        # TODO in the filter step change it once UVT shape is consistent
-                        root_node | frame | to_tx | events[op_kind] | filter[lambda event: to_ezefref(event.target) == to_ezefref(rae_or_zr)] |  for_each[lambda x: LazyValue(x) | push[stream] | run ] 
-                    sub_decl = sub_decl[filter_func]
-                    sub = g | sub_decl                
-                # Type 2: any RAE  i.e on[terminated[ET.Dog]] or on[instantiated[RT.owns]] 
-                elif is_a(rae_or_zr, RAET):
-                    def filter_func(root_node): 
-                        # TODO in the filter step change it once UVT shape is consistent
-                        root_node | frame | to_tx | events[op_kind] | filter[lambda event: rae_type(event.target) == rae_or_zr or is_a(rae_type(event.target), rae_or_zr)] |  for_each[lambda x: LazyValue(x) | push[stream] | run ] 
-                    sub_decl = sub_decl[filter_func]
-                    sub = g | sub_decl
-                else:
-                    raise Exception(f"Unhandled type in on[{op_kind}] where the input was {rae_or_zr}")
-
-            # Type 3: An instantiated or terminated relation outgoing or incoming from a specific zr 
-            elif len(op_args[0]) == 3: 
-                src, rt, trgt = op_args[0] 
-                # sub_decl = sub_decl[selected_types[0][internal.outgoing][rt]][lambda x: LazyValue(selected_types[1][x]) | push[stream] | run] # TODO: is it always outgoing?
-                # sub = src | sub_decl         
-                def triple_filter(z):    
-                    def src_or_trgt_filter(rae, rae_filter):
-                        if isinstance(rae_filter, ZefRef):
-                            return to_ezefref(rae) == to_ezefref(rae_filter)
-                        elif isinstance(rae_filter, ValueType):
-                            return is_a(rae, rae_filter)
-                        else:
-                            raise ValueError(f"Expected source or target filters to be ZefRef, RaeType, or ValueType but got {type(rae_filter)} instead.")
-
-                    if rae_type(z) != rt: return False
-                    # Checks on both source and target
-                    return src_or_trgt_filter(source(z), src) and src_or_trgt_filter(target(z), trgt)
-
-                def filter_func(root_node): 
-                    # TODO in the filter step change it once UVT shape is consistent
-                    root_node | frame | to_tx | events[op_kind] | filter[lambda event: triple_filter(event.target)] | for_each[lambda x: run(LazyValue(x) | push[stream]) ]  
-                sub_decl = sub_decl[filter_func]
-                sub = g | sub_decl              
+    # All listeners on a graph share one subscription, see event_dispatch
+    dispatcher = dispatcher_for(g)
+
+    op_kind = without_absorbed(op)
+    op_args = absorbed(op)
+    if op_kind in {Instantiated, Terminated}:
+        if not isinstance(op_args[0], tuple):
+            rae_or_zr = op_args[0]
+            # Type 1: a specific entity i.e on[terminated[zr]]  !! Cannot be on[instantiated[zr]] because doesnt logically make sense !!
+            if isinstance(rae_or_zr, ZefRef):
+                assert op_kind == Terminated, "Cannot listen for a specfic ZefRef to be instantiated! Doesn't make sense."
+                dispatcher.add_specific(op_kind, rae_or_zr, stream)
+            # Type 2: any RAE  i.e on[terminated[ET.Dog]] or on[instantiated[RT.owns]]
+            elif is_a(rae_or_zr, RAET):
+                dispatcher.add_type(op_kind, rae_or_zr, stream)
             else:
-                raise Exception(f"Unhandled type in on[{op_kind}] where the curried args were {op_args}")
-        elif op_kind == Assigned:
-            assert len(op_args) == 1
-            aet_or_zr = op_args[0]
-            # Type 1: a specific zefref to an AET i.e on[assigned[zr_to_aet]]
-            # TODO in the filter step change it once UVT shape is consistent
-            if isinstance(aet_or_zr, BlobPtr): 
-                def filter_func(root_node): root_node | frame | to_tx | events[Assigned] | filter[lambda event: to_ezefref(event.target) == to_ezefref(aet_or_zr)] |  for_each[lambda x: run(LazyValue(x) | push[stream]) ]  
-                sub_decl = sub_decl[filter_func]
-                sub = g | sub_decl
-            # Type 2: any AET.* i.e on[assigned[AET.String]]
-            elif isinstance(aet_or_zr, AET): 
-                def filter_func(root_node): root_node | frame | to_tx | events[Assigned] | filter[lambda event: rae_type(event.target) == aet_or_zr or is_a(rae_type(event.target), aet_or_zr)] |  for_each[lambda x: run(LazyValue(x) | push[stream]) ]  
-                sub_decl = sub_decl[filter_func]
-                sub = g | sub_decl        
+                raise Exception(f"Unhandled type in on[{op_kind}] where the input was {rae_or_zr}")
+
+        # Type 3: An instantiated or terminated relation outgoing or incoming from a specific zr
+        elif len(op_args[0]) == 3:
+            src, rt, trgt = op_args[0]
+            dispatcher.add_triple(op_kind, src, rt, trgt, stream)
         else:
-            raise Exception(f"on subscription only allow Terminated/Instantiated/ValueAssigned subscriptions. {op_kind} was passed!")        
-        return stream
-    raise TypeError(f"The first argument passed should be a Graph. A {type(g)} was passed instead.")
+            raise Exception(f"Unhandled type in on[{op_kind}] where the curried args were {op_args}")
+    elif op_kind == Assigned:
+        assert len(op_args) == 1
+        aet_or_zr = op_args[0]
+        # Type 1: a specific zefref to an AET i.e on[assigned[zr_to_aet]]
+        if isinstance(aet_or_zr, BlobPtr):
+            dispatcher.add_specific(Assigned, aet_or_zr, stream)
+        # Type 2: any AET.* i.e on[assigned[AET.String]]
+        elif isinstance(aet_or_zr, AET):
+            dispatcher.add_type(Assigned, aet_or_zr, stream)
+    else:
+        raise Exception(f"on subscription only allow Terminated/Instantiated/ValueAssigned subscriptions. {op_kind} was passed!")
+    return stream
 
 
 #---------------------------------------- transpose -----------------------------------------------
@@ -442,6 +423,87 @@ def match_tp(op, curr_type):
     return VT.Any
 
 
+class CompiledMatch:
+    """
+    A precompiled version of the patterns of a match, for dispatching in hot
+    op implementations. The patterns are checked in order exactly as for
+    `match`, but for each concrete python type of the item, the patterns that
+    can't match based on the type alone are dropped once, and the search
+    stops at the first pattern that always matches for that type. If that is
+    the first remaining pattern, dispatching is a dict lookup.
+
+    Sets and non-ValueType patterns are always checked on the item itself.
+    """
+    def __init__(self, patterns):
+        from ..VT.value_type import compile_is_a
+        self.patterns = list(patterns)
+        self.tests = []
+        for tp,_ in self.patterns:
+            if isinstance(tp, set):
+                self.tests.append((None, lambda item, tp=tp: item in tp))
+            elif type(tp) is ValueType_:
+                compiled = tp._compiled or compile_is_a(tp)
+                self.tests.append((compiled, compiled.check))
+            else:
+                self.tests.append((None, lambda item, tp=tp: is_a(item, tp)))
+        self.plans = {}
+
+    def plan(self, cls):
+        # Tuple of (index, check), where check is None if the pattern always
+        # matches items of type cls.
+        plan = []
+        for i,(compiled,check) in builtins.enumerate(self.tests):
+            bound = None if compiled is None else compiled.type_bound(cls)
+            if bound is False:
+                continue
+            if bound is True:
+                plan.append((i, None))
+                break
+            plan.append((i, check))
+        plan = tuple(plan)
+        self.plans[cls] = plan
+        return plan
+
+    def select_index(self, item):
+        cls = type(item)
+        plan = self.plans.get(cls, None)
+        if plan is None:
+            plan = self.plan(cls)
+        for i,check in plan:
+            if check is None:
+                return i
+            try:
+                if check(item):
+                    return i
+            except Error_ as e:
+                tp,f_to_apply = self.patterns[i]
+                e = add_error_context(e, {"metadata": {"match_case": tp, "func": f_to_apply, "input": item}})
+                raise e from None
+        raise Error.MatchError("No case matched", item)
+
+    def select(self, item):
+        """Returns the output of the first pattern matching item, without
+        applying it."""
+        return self.patterns[self.select_index(item)][1]
+
+    def apply(self, item, *args):
+        """Dispatches on item and calls the chosen function with args."""
+        i = self.select_index(item)
+        tp,f_to_apply = self.patterns[i]
+        try:
+            return call_wrap_errors_as_unexpected(f_to_apply, *args)
+        except Error_ as e:
+            e = add_error_context(e, {"metadata": {"match_case": tp, "func": f_to_apply, "input": item}})
+            raise e from None
+
+    def __call__(self, item):
+        # Equivalent to item | match[patterns]
+        return self.apply(item, item)
+
+def compile_match(patterns) -> CompiledMatch:
+    return CompiledMatch(patterns)
+
+
 #---------------------------------------- match_on -----------------------------------------------
 def match_on_imp(item, f_preprocess, patterns: List):
     """
@@ -2007,17 +2069,19 @@ def all_imp(*args):
     ---- Tags ----
     - used for: predicate
     """
-    subject = args[0]
-
-    return match[
-        (FlatGraph, lambda _: fg_all_imp(*args)),
-        (AtomWithRef, lambda x: Atom_unpack_and_rewrap(all_imp, is_list=True)(*args)),
-        (ZefRef & ET.ZEF_List, lambda _: zef_list_all_imp(*args)),
-        (GraphSlice, lambda _: graphslice_all_imp(*args)),
-        (Graph, lambda _: graph_all_imp(*args)),
-        (ZefRef, lambda _: delegate_zefref_all_imp(subject)),
-        (Any, lambda _: other_all_imp(*args)),
-    ](subject)
+    global _all_dispatch
+    if _all_dispatch is None:
+        _all_dispatch = compile_match([
+            (FlatGraph, fg_all_imp),
+            (AtomWithRef, lambda *args: Atom_unpack_and_rewrap(all_imp, is_list=True)(*args)),
+            (ZefRef & ET.ZEF_List, zef_list_all_imp),
+            (GraphSlice, graphslice_all_imp),
+            (Graph, graph_all_imp),
+            (ZefRef, lambda subject, *args: delegate_zefref_all_imp(subject)),
+            (Any, other_all_imp),
+        ])
+    return _all_dispatch.apply(args[0], *args)
+_all_dispatch = None
 
 
 def other_all_imp(*args):
@@ -3547,8 +3611,9 @@ def skip_imp(v, n: int):
     if n>=0:
         def wrapper():
             it = iter(v)
-            for _ in range(n):
-                next(it)
+            # Skipping past the end gives nothing, rather than an error
+            for _ in builtins.zip(range(n), it):
+                pass
             yield from it
         return ZefGenerator(wrapper)    
     # n<0
@@ -5161,6 +5226,30 @@ def preceding_events_imp(x, filter_on=None):
     return full_list
 
 
+def tx_events(z_tx, instantiated=True, assigned=True, terminated=True):
+    """
+    The events of a TX, as returned by `z_tx | events`, only constructing
+    those of the requested kinds.
+    """
+    from zef.pyzef import zefops as pyzefops
+    zr = to_ezefref(z_tx)
+    gs = zr | to_graph_slice | collect
+
+    def make_val_as_for_aet(aet):
+        aet_at_frame = pyzefops.to_frame(aet, zr)
+        try:
+            prev_tx  = zr | previous_tx | collect                                  # Will fail if tx is already first TX
+            prev_val = pyzefops.to_frame(aet, prev_tx) | value | collect   # Will fail if aet didn't exist at prev_tx
+        except Exception:
+            prev_val = None
+        return Assigned(target = aet_at_frame, prev = prev_val, current = value(aet_at_frame))
+
+    insts        = zr | pyzefops.instantiated   | map[lambda zz: Instantiated(target =pyzefops.to_frame(zz, gs.tx))] | collect if instantiated else []
+    val_assigns  = zr | pyzefops.value_assigned | map[make_val_as_for_aet] | collect if assigned else []
+    terminations = zr | pyzefops.terminated     | map[lambda zz: Terminated(target = pyzefops.to_frame(zz, gs.tx, True) )] | collect if terminated else []
+    return insts+val_assigns+terminations
+
+
 
 
 # ----------------------------------------- events --------------------------------------------
@@ -5208,22 +5297,7 @@ def events_imp(z_tx_or_rae, filter_on=None):
         full_list = insts+retirements
 
     elif BT(z_tx_or_rae) == BT.TX_EVENT_NODE:
-        zr = to_ezefref(z_tx_or_rae)
-        gs = zr | to_graph_slice | collect
-
-        def make_val_as_for_aet(aet):
-            aet_at_frame = pyzefops.to_frame(aet, zr)
-            try:
-                prev_tx  = zr | previous_tx | collect                                  # Will fail if tx is already first TX
-                prev_val = pyzefops.to_frame(aet, prev_tx) | value | collect   # Will fail if aet didn't exist at prev_tx
-            except Exception:
-                prev_val = None
-            return Assigned(target = aet_at_frame, prev = prev_val, current = value(aet_at_frame))
-
-        insts        = zr | pyzefops.instantiated   | map[lambda zz: Instantiated(target =pyzefops.to_frame(zz, gs.tx))] | collect
-        val_assigns  = zr | pyzefops.value_assigned | map[make_val_as_for_aet] | collect
-        terminations = zr | pyzefops.terminated     | map[lambda zz: Terminated(target = pyzefops.to_frame(zz, gs.tx, True) )] | collect
-        full_list = insts+val_assigns+terminations
+        full_list = tx_events(z_tx_or_rae)
     else:
         print(f"🥱🥱🥱🥱🥱🥱 Change: The `events` ZefOp can only be used on (E)ZefRef to TXs. To look at the past of any RAE from a given frame, use `preceding_events`. ")
         raise Exception()
@@ -5833,6 +5907,118 @@ def map_implementation(v, f):
     return ZefGenerator(wrapper)
 
 
+# -------------------------------- fused elementwise ops -------------------------------------------------
+# Consecutive elementwise ops in a chain, e.g. `map[f] | filter[p] | take[n]`,
+# are merged into a single step by the compiler in op_structs. The fused step
+# runs all stages in one loop instead of one nested generator per op.
+_fusible_elementwise_ops = {
+    internals.RT.Map,
+    internals.RT.Filter,
+    internals.RT.TakeWhile,
+    internals.RT.Skip,
+    internals.RT.Take,
+}
+_fusible_input_types = {list, tuple, range, set}
+
+_stage_map, _stage_filter, _stage_take_while, _stage_skip, _stage_take = range(5)
+
+def can_fuse_elementwise(v, stage_ops):
+    """
+    The fused loop only reproduces the plain iterable behaviour of the ops.
+    Dicts, strings, streams and ZefRefs as well as the non-lazy variants
+    (negative counts, map over a list of functions) have to go through the
+    individual implementations.
+    """
+    if type(v) not in _fusible_input_types and not isinstance(v, ZefGenerator_):
+        return False
+    for rt,args in stage_ops:
+        if len(args) != 1:
+            return False
+        if rt == internals.RT.Map:
+            if type(args[0]) in (list, tuple): return False
+        elif rt == internals.RT.Skip or rt == internals.RT.Take:
+            if type(args[0]) != int or args[0] < 0: return False
+    return True
+
+def fused_elementwise_imp(v, stage_ops, chain=None, first_op_i=None):
+    """
+    Runs a sequence of map / filter / take_while / skip / take stages over an
+    iterable in a single generator. Only to be used on inputs for which
+    `can_fuse_elementwise` holds.
+
+    The generator stands in for that of the last op, so the caller gives it
+    the context of that op. An error in an earlier stage also gets the
+    contexts of the ops from the failing one onwards, as with the individual
+    ops. These refer to the ops of `chain`, which start at first_op_i.
+    """
+    stages = []
+    for rt,(arg,) in stage_ops:
+        if rt == internals.RT.Map:         stages.append((_stage_map, arg))
+        elif rt == internals.RT.Filter:    stages.append((_stage_filter, make_predicate(arg)))
+        elif rt == internals.RT.TakeWhile: stages.append((_stage_take_while, make_predicate(arg)))
+        elif rt == internals.RT.Skip:      stages.append((_stage_skip, arg))
+        elif rt == internals.RT.Take:      stages.append((_stage_take, arg))
+        else:
+            raise Exception(f"Op {rt} can't be fused")
+    stages = tuple(stages)
+
+    def stage_failed(exc, i, el):
+        kind,arg = stages[i]
+        if kind == _stage_map:
+            try:
+                wrap_error_as_unexpected(exc, arg)
+            except Error_ as err:
+                exc = add_error_context(err, {"metadata": {"last_input": el}})
+        contexts = []
+        if chain is not None:
+            for j in range(len(stages) - 2, i - 1, -1):
+                context = {"chain": chain, "op_i": first_op_i + j, "op": stage_ops[j]}
+                if j == 0:
+                    context["input"] = v
+                contexts.append(context)
+        wrap_error_raising(exc, contexts)
+
+    def wrapper():
+        counters = [arg if kind in (_stage_skip, _stage_take) else None for kind,arg in stages]
+        if builtins.any(kind == _stage_take and n == 0 for (kind,_),n in builtins.zip(stages, counters)):
+            return
+        for el in v:
+            keep = True
+            exhausted = False
+            try:
+                for i,(kind,arg) in builtins.enumerate(stages):
+                    if kind == _stage_map:
+                        el = arg(el)
+                    elif kind == _stage_filter:
+                        if not arg(el):
+                            keep = False
+                            break
+                    elif kind == _stage_take_while:
+                        if not arg(el):
+                            return
+                    elif kind == _stage_skip:
+                        if counters[i] > 0:
+                            counters[i] -= 1
+                            keep = False
+                            break
+                    else:
+                        counters[i] -= 1
+                        # Upstream must not be pulled again once a take is
+                        # satisfied, but this element still passes through.
+                        if counters[i] == 0:
+                            exhausted = True
+            except Exception as exc:
+                if not custom_error_handling_activated():
+                    raise
+                stage_failed(exc, i, el)
+            if keep:
+                yield el
+            if exhausted:
+                return
+
+    return ZefGenerator(wrapper)
+
+
 # -------------------------------- reduce -------------------------------------------------
  
 
@@ -6356,7 +6542,7 @@ def Outs_imp(z, rt=None, target_filter = None):
     - related zefop: In
     - related zefop: ins_and_outs
     """
-    return out_rels_imp(z, rt, target_filter) | map[target] | collect
+    return [target_implementation(rel) for rel in out_rels_imp(z, rt, target_filter)]
 
 
 #---------------------------------------- In -----------------------------------------------
@@ -6539,7 +6725,7 @@ def out_rels_imp(z, rt_or_bt=None, target_filter=None):
         return Atom_unpack_and_rewrap(out_rels_imp, is_list=True)(z, rt_or_bt, target_filter)
 
     assert isinstance(z, (ZefRef, EZefRef, FlatRef))
-    if is_a(z, FlatRef): return traverse_flatref_imp(z, rt_or_bt, "out", "multi")
+    if isinstance(z, FlatRef): return traverse_flatref_imp(z, rt_or_bt, "out", "multi")
     if rt_or_bt == RT or rt_or_bt is None: res = pyzefops.outs(z) | filter[is_a[BT.RELATION_EDGE]] | collect
     elif rt_or_bt == BT: res =  pyzefops.outs(z | to_ezefref | collect)
     else:
@@ -6685,7 +6871,7 @@ def target_implementation(zr):
     if check_Atom_with_ref(zr):
         return Atom_unpack_and_rewrap(target_implementation)(zr)
 
-    if is_a(zr, Entity):
+    if isinstance(zr, Entity):
         raise Exception(f"Can't take the target of an entity (have {zr}), only relations have sources/targets")
     if isinstance(zr, FlatRef):
         return fr_target_imp(zr)
@@ -6699,13 +6885,23 @@ def target_implementation(zr):
     return pyzefops.target(zr)
 
 def value_implementation(zr, maybe_tx=None):
-    if check_Atom_with_ref(zr):
-        return value_implementation(_get_ref_pointer(zr), maybe_tx)
-    if check_Atom_with_ref(maybe_tx):
-        return value_implementation(zr, _get_ref_pointer(maybe_tx))
-
-    if isinstance(zr, FlatRef):
-        return fr_value_imp(zr)
+    global _value_dispatch
+    if _value_dispatch is None:
+        _value_dispatch = compile_match([
+            (AtomClass, value_atom_imp),
+            (FlatRef, lambda zr, maybe_tx: fr_value_imp(zr)),
+            (Any, value_ref_imp),
+        ])
+    if maybe_tx is not None and check_Atom_with_ref(maybe_tx):
+        maybe_tx = _get_ref_pointer(maybe_tx)
+    return _value_dispatch.select(zr)(zr, maybe_tx)
+_value_dispatch = None
+
+def value_atom_imp(zr, maybe_tx):
+    check_Atom_with_ref(zr)
+    return value_implementation(_get_ref_pointer(zr), maybe_tx)
+
+def value_ref_imp(zr, maybe_tx):
     if maybe_tx is None:
         val = pyzefops.value(zr)
     elif isinstance(maybe_tx, GraphSlice):
@@ -6749,41 +6945,48 @@ def termination_tx_implementation(z):
 
     
 def uid_implementation(arg):
-    if isinstance(arg, String):
-        return to_uid(arg)
-    if isinstance(arg, AtomRef):
-        return arg.d["uid"]
-    if is_a(arg, UID):
-        return arg
-    if isinstance(arg, AtomClass):
-        # This is so messy! We have to look for uids in each of the names of the
-        # atom. If we don't find any, we can fall back to the included ref
-        # pointer.
+    global _uid_dispatch
+    if _uid_dispatch is None:
+        _uid_dispatch = compile_match([
+            (String, to_uid),
+            (AtomRef, lambda arg: arg.d["uid"]),
+            (UID, lambda arg: arg),
+            (AtomClass, atom_uid_implementation),
+            (Any, blob_uid_implementation),
+        ])
+    return _uid_dispatch.select(arg)(arg)
+_uid_dispatch = None
+
+def atom_uid_implementation(arg):
+    # This is so messy! We have to look for uids in each of the names of the
+    # atom. If we don't find any, we can fall back to the included ref
+    # pointer.
+    #
+    # Allowed uid names - a direct EternalUID struct, or a string beginning with "db-"
+    atom_id = _get_atom_id(arg)
+    if "frame_uid" in atom_id:
+        # In the case that the global_id graph and the graph_uid are the same, then we know what to do.
         #
-        # Allowed uid names - a direct EternalUID struct, or a string beginning with "db-"
-        atom_id = _get_atom_id(arg)
-        if "frame_uid" in atom_id:
-            # In the case that the global_id graph and the graph_uid are the same, then we know what to do.
-            #
-            # In other cases, we have to handle this differently.
-            #
-            # Maybe suggests that "uid" only ever returns the global id and "frame" is the only way to query the tx.
-
-            if "delegate" in atom_id:
-                raise NotImplementedError("NEED TO HANDLE DELGATE!")
-            if atom_id["global_uid"].graph_uid != atom_id["frame_uid"].graph_uid:
-                raise NotImplementedError("Need to understand Atoms and new Eternal+TX+Graph")
-
-            # TODO: Change this back to a DBStateUID
-            return ZefRefUID(atom_id["global_uid"].blob_uid, atom_id["frame_uid"].tx_uid, atom_id["frame_uid"].graph_uid)
-        elif "global_uid" in atom_id:
-            return atom_id["global_uid"]
-        elif "delegate" in atom_id:
+        # In other cases, we have to handle this differently.
+        #
+        # Maybe suggests that "uid" only ever returns the global id and "frame" is the only way to query the tx.
+
+        if "delegate" in atom_id:
             raise NotImplementedError("NEED TO HANDLE DELGATE!")
-        else:
-            # Should we fail here or should we return None?
-            raise Exception("No UID in Atom")
+        if atom_id["global_uid"].graph_uid != atom_id["frame_uid"].graph_uid:
+            raise NotImplementedError("Need to understand Atoms and new Eternal+TX+Graph")
+
+        # TODO: Change this back to a DBStateUID
+        return ZefRefUID(atom_id["global_uid"].blob_uid, atom_id["frame_uid"].tx_uid, atom_id["frame_uid"].graph_uid)
+    elif "global_uid" in atom_id:
+        return atom_id["global_uid"]
+    elif "delegate" in atom_id:
+        raise NotImplementedError("NEED TO HANDLE DELGATE!")
+    else:
+        # Should we fail here or should we return None?
+        raise Exception("No UID in Atom")
 
+def blob_uid_implementation(arg):
     if isinstance(arg, BlobPtr) and internals.is_delegate(arg):
         raise NotImplementedError("NEED TO HANDLE DELGATE!")
 
@@ -15,11 +15,12 @@
 from typing import Tuple
 from .._ops import *
 from datetime import datetime, timezone, timedelta
-from functional import seq
+from ... import lazy_import
 from ..internals import is_delegate, root_node_blob_index, BlobType
 from .._core import *
 from .. import internals
 from ..VT import *
+functional = lazy_import("functional")
 
 def index_imp(x):
     if isinstance(x, AtomClass):
@@ -118,16 +119,16 @@ def tx_view(zr_or_uzr) -> str:
     def value_assigned_string_view(lst):
         def get_aet_values(x):
             return f"    {fill_str_to_length(value_previous_of_aet(x, uzr), 25)} ({uid(x)})        {value_of_aet_at_tx(x, uzr)}"
-        return f"{len(lst)}x:     {zr_type(lst[0])}\n" + "\n".join(seq(lst).map(get_aet_values)) + "\n\n"
+        return f"{len(lst)}x:     {zr_type(lst[0])}\n" + "\n".join(functional.seq(lst).map(get_aet_values)) + "\n\n"
 
     def instantiated_or_terminated_string_view(lst):
         return (f"{len(lst)}x:     ({zr_type(lst[0])})\n"
-                + "\n".join(seq(lst).map(lambda x: f"    ({uid_or_value_hash(x)})"))
+                + "\n".join(functional.seq(lst).map(lambda x: f"    ({uid_or_value_hash(x)})"))
                 + "\n\n")
 
     def tx_block_view(uzrs, fn):
         return ("".join(
-                seq(uzrs)
+                functional.seq(uzrs)
                 .group_by(lambda z: zr_type(z))
                 .map(lambda x: x[1])
                 .map(fn)))
@@ -288,7 +289,7 @@ def relations_view(zr_or_uzr) -> str:
         | collect
         )                     
 
-    list_of_and_and_outs = (seq(edges_to_show)
+    list_of_and_and_outs = (functional.seq(edges_to_show)
                             .group_by(lambda rel: compose_triple_name(rel, zr_or_uzr))
                             .sorted(lambda rel_group: len(rel_group[1])))  # the second element is the list of zefrefs
 
@@ -175,6 +175,7 @@ my_op = map[f1] | filter[f2]
 
 # TODO fix repr for L op
 # TODO make repr for ZefOp better
+import sys
 import warnings
 from inspect import isfunction, getfullargspec
 from types import LambdaType
@@ -245,11 +246,17 @@ def is_valid_LorO_op(other) -> bool:
         )
 
 # TODO Merge all ValueTypes checks together into a single function
-def is_supported_stream(o):
+def rx_stream_types():
+    # Streams are created through rx, so nothing can be one until rx has been
+    # imported. This avoids importing rx just to check.
+    if "rx" not in sys.modules:
+        return ()
     from rx.subject import Subject
     from rx.core import Observable
-    if type(o) in {Subject, Observable}: return True
-    return False
+    return (Subject, Observable)
+
+def is_supported_stream(o):
+    return type(o) in rx_stream_types()
 
 def is_python_scalar_type(o):
     return type(o) in {str, bytes, int, bool, float, type(None)}
@@ -1050,6 +1057,43 @@ class LazyValue_:
         raise Exception("Shouldn't cast LazyValue to bool (this may change in the future to automatic evaluation)")
 
     def evaluate(self, unpack_generator = True):
+        # Chains are executed from a cached plan where possible. Chains that
+        # can't be compiled (e.g. those containing `run`) go through the
+        # interpreted path.
+        plan = compile_op_chain(self.el_ops.el_ops)
+        if plan is None:
+            return self.evaluate_interpreted(unpack_generator)
+
+        ops = self.el_ops.el_ops
+        curr_op = None
+        curr_value = self.initial_val
+
+        try:
+            for op_i,to_call_func,fused_steps in plan:
+                if fused_steps is None:
+                    curr_op = ops[op_i]
+                    curr_value = apply_compiled_step(self, op_i, curr_op, to_call_func, curr_op[1], curr_value)
+                    continue
+
+                stage_ops = tuple(ops[step_i] for step_i,_ in fused_steps)
+                if _can_fuse_elementwise(curr_value, stage_ops):
+                    # The fused generator stands in for that of the last op
+                    last_i = fused_steps[-1][0]
+                    curr_op = ops[last_i]
+                    curr_value = apply_compiled_step(self, last_i, curr_op, to_call_func, (stage_ops, self, op_i), curr_value)
+                else:
+                    for step_i,step_func in fused_steps:
+                        curr_op = ops[step_i]
+                        curr_value = apply_compiled_step(self, step_i, curr_op, step_func, curr_op[1], curr_value)
+
+            if unpack_generator:
+                return unpack_evaluated_value(self, curr_value)
+            return curr_value
+
+        except Exception as exc:
+            reraise_evaluation_exception(self, exc, curr_value, curr_op)
+
+    def evaluate_interpreted(self, unpack_generator = True):
         from .op_implementations.dispatch_dictionary import _op_to_functions
         from .op_implementations.implementation_typing_functions import ZefGenerator
         from ..core._error import Error_
@@ -1063,12 +1107,7 @@ class LazyValue_:
             for op_i,op in enumerate(self.el_ops.el_ops): 
                 
                 curr_op = op
-                cur_context = {
-                    "chain": self,
-                    "op_i": op_i,
-                    "input": curr_value,
-                    "op": curr_op,
-                }
+                cur_context = op_context(self, op_i, curr_op, curr_value)
 
                 if op[0] == internals.RT.Collect: continue
 
@@ -1119,48 +1158,10 @@ class LazyValue_:
                 except Exception as e:
                     if not custom_error_handling_activated():
                         raise
-
-                    if isinstance(e, EvalEngineCoreError):
-                        # This is definitely a panic - but we want to attach the
-                        # current evaluation information along with this.
-                        # Probably want to add in python traceback here
-                        e = EvalEngineCoreError(e)
-                        got_error = add_error_context(e, cur_context)
-                    elif isinstance(e, ExceptionWrapper):
-                        # Continue the panic, attaching more tb info
-                        tb = e.__traceback__
-                        from ._error import process_python_tb
-                        frames = process_python_tb(tb)
-                        got_error = add_error_context(e.wrapped, {"frames": frames})
-                        got_error = add_error_context(got_error, type_checking_context(op, to_call_func, curr_value))
-                
-                    elif isinstance(e, Error_):
-                        got_error = e
-                        got_error = add_error_context(got_error, type_checking_context(op, to_call_func, curr_value))
-                        # print("2")
-                
-                    else:
-                        # print("3")
-                        py_e,frames = convert_python_exception(e)
-                        got_error = Error.Panic()
-                        got_error.nested = py_e
-                        got_error = add_error_context(got_error, {"frames": frames})
-                        got_error = add_error_context(got_error, type_checking_context(op, to_call_func, curr_value))
+                    got_error = error_from_op_exception(e, op, to_call_func, curr_value, cur_context)
                 else:
                     if isinstance(new_value, Error_):
-                        # Here we have a choice - depends on what the caller expects, an Error or an exception
-                        # Could also pass this down the line
-                        # Need to distinguish between a caller wanting an error or wanting an exception
-
-                        # Build details here
-                        # if user_wants_exception:
-                        # TODO Can we add context about frame here?
-                        if True:
-                            new_value.nested = {"type": new_value.name, "args": new_value.args}
-                            got_error = new_value
-                            got_error = add_error_context(got_error, type_checking_context(op, to_call_func, curr_value))
-                        else:
-                            pass
+                        got_error = error_from_op_output(new_value, op, to_call_func, curr_value)
                     elif isinstance(new_value, ZefGenerator_):
                         new_value = new_value.add_context(cur_context)
                     
@@ -1179,90 +1180,252 @@ class LazyValue_:
                 curr_value = new_value
 
             if unpack_generator:
-                if isinstance(curr_value, Iterator) or isinstance(curr_value, Generator):
-                    # This branch should be eliminated if possible
-                    print("NEED TO GET RID OF THIS")
-                    print("With type:", type(curr_value))
-                    print("NEED TO GET RID OF THIS")
-
-                    return_list = []
-
-                    it = iter(curr_value)
-                    i = 0
-                    while True:
-                        cur_context = {
-                            "chain": self,
-                            "state": "collecting",
-                            "val_i": i,
-                        }
-                        try:
-                            val = next(it)
-                        except StopIteration:
-                            break
-                        except Exception as e:
-                            if not custom_error_handling_activated():
-                                raise
-                                
-                            if isinstance(e, EvalEngineCoreError):
-                                raise add_error_context(e, cur_context)
-                            elif isinstance(e, ExceptionWrapper):
-                                raise add_error_context(e.wrapped, cur_context) from None
-                            elif isinstance(e, Error_):
-                                raise add_error_context(e, cur_context) from None
-                            else:
-                                py_e,frames = convert_python_exception(e)
-                                e = Error.Panic()
-                                e.nested = py_e
-                                e = add_error_context(e, {"frames": frames})
-                                e = add_error_context(e, cur_context)
-                                raise e from None
-
-                        if isinstance(val, Error_):
-                            if not custom_error_handling_activated():
-                                raise val
-                            else:
-                                raise add_error_context(val, cur_context) from None
-
-                        return_list.append(val)
-                    return return_list
-                elif isinstance(curr_value, ZefGenerator_):
-                    # ZefGenerator handles its own context and error raising
-                    # TODO: We could bring the error handling into here?
-                    return [i for i in curr_value]
+                return unpack_evaluated_value(self, curr_value)
 
             return curr_value
 
         except Exception as exc:
-            if not custom_error_handling_activated():
-                raise
-            if isinstance(exc, EvalEngineCoreError):
-                # print("7")
-                raise
-        
-            elif isinstance(exc, ExceptionWrapper):
-                # print("8")
-                raise exc from None
-
-            elif isinstance(exc, Error_):
-                # print("9")
-                if getattr(exc, "keep_traceback", None):
-                    wrapper = ExceptionWrapper(exc)
-                    wrapper.keep_traceback = True
-                    wrapper.__traceback__ = exc.__traceback__
-                    raise wrapper
-                raise ExceptionWrapper(exc) from None
+            reraise_evaluation_exception(self, exc, curr_value, curr_op)
+
+
+# ---- Compiled op chains -----
+# Compiled plans are keyed by the sequence of op kinds only. The curried
+# arguments are read from the chain being evaluated, so two chains that only
+# differ in their arguments share the same plan.
+_compiled_plans = {}
+_compiled_plans_max_size = 4096
+_not_compilable = object()
+
+def compile_op_chain(el_ops):
+    """
+    Turn the elementary ops of a chain into a tuple of steps with Collect ops
+    removed. Each step is (op_i, dispatch_function, fused_steps), where
+    fused_steps is None for a single op. Runs of elementwise ops are fused
+    into one step, see fuse_elementwise_steps.
+
+    Returns None if the chain has to go through the interpreted path, i.e. it
+    contains a `run` or an op which can't be found in the dispatch dictionary.
+    """
+    key = tuple(op[0] for op in el_ops)
+    plan = _compiled_plans.get(key, None)
+    if plan is not None:
+        return None if plan is _not_compilable else plan
+
+    if internals.RT.Run in key:
+        plan = _not_compilable
+    else:
+        from .op_implementations.dispatch_dictionary import _op_to_functions
+        steps = []
+        for op_i,rt in enumerate(key):
+            if rt == internals.RT.Collect: continue
+            entry = _op_to_functions.get(rt, None)
+            # The op may be registered later on, so don't remember this
+            if entry is None: return None
+            steps.append((op_i, entry[0]))
+        plan = fuse_elementwise_steps(key, steps)
+
+    if len(_compiled_plans) >= _compiled_plans_max_size:
+        _compiled_plans.clear()
+    _compiled_plans[key] = plan
+    return None if plan is _not_compilable else plan
+
+def fuse_elementwise_steps(key, steps):
+    """
+    Optimizer pass over the compiled steps: consecutive map / filter /
+    take_while / skip / take ops are replaced by a single step running
+    fused_elementwise_imp. The individual steps are kept alongside, as the
+    fused step can only be used for plain iterable inputs, which is decided
+    at evaluation time.
+    """
+    from .op_implementations.implementation_typing_functions import _fusible_elementwise_ops, fused_elementwise_imp
+    def is_fusible(step):
+        return key[step[0]] in _fusible_elementwise_ops
+
+    out = []
+    pending = []
+    def flush():
+        if len(pending) > 1:
+            out.append((pending[0][0], fused_elementwise_imp, tuple(pending)))
+        else:
+            out.extend((op_i, func, None) for op_i,func in pending)
+        pending.clear()
+
+    for step in steps:
+        if is_fusible(step) and (len(pending) == 0 or step[0] == pending[-1][0] + 1):
+            pending.append(step)
+            continue
+        flush()
+        if is_fusible(step):
+            pending.append(step)
+        else:
+            out.append((*step, None))
+    flush()
+    return tuple(out)
+
+def invalidate_compiled_op_chains():
+    _compiled_plans.clear()
+
+# The op implementations import this module, so can_fuse_elementwise is only
+# looked up on first use rather than on every evaluation.
+_can_fuse_elementwise_imp = None
+def _can_fuse_elementwise(curr_value, stage_ops):
+    global _can_fuse_elementwise_imp
+    if _can_fuse_elementwise_imp is None:
+        from .op_implementations.implementation_typing_functions import can_fuse_elementwise
+        _can_fuse_elementwise_imp = can_fuse_elementwise
+    return _can_fuse_elementwise_imp(curr_value, stage_ops)
+
+
+def apply_compiled_step(chain, op_i, op, to_call_func, args, curr_value):
+    from ..core._error import Error_
+    try:
+        new_value = to_call_func(curr_value, *args)
+    except Exception as e:
+        if not custom_error_handling_activated():
+            raise
+        cur_context = op_context(chain, op_i, op, curr_value)
+        got_error = error_from_op_exception(e, op, to_call_func, curr_value, cur_context)
+        raise add_error_context(got_error, cur_context) from None
+
+    if isinstance(new_value, ZefGenerator_):
+        return new_value.add_context(op_context(chain, op_i, op, curr_value))
+    elif isinstance(new_value, Error_):
+        got_error = error_from_op_output(new_value, op, to_call_func, curr_value)
+        if not custom_error_handling_activated():
+            raise Exception(got_error)
+        raise add_error_context(got_error, op_context(chain, op_i, op, curr_value)) from None
+    elif isinstance(new_value, (Generator, Iterator)):
+        print("Operator produced a raw generator or iterator")
+        print(type(new_value))
+        print(op)
+    return new_value
+
+def op_context(chain, op_i, op, inp):
+    return {
+        "chain": chain,
+        "op_i": op_i,
+        "input": inp,
+        "op": op,
+    }
+
+def error_from_op_exception(e, op, to_call_func, curr_value, cur_context):
+    from ..core._error import Error_
+    if isinstance(e, EvalEngineCoreError):
+        # This is definitely a panic - but we want to attach the
+        # current evaluation information along with this.
+        # Probably want to add in python traceback here
+        e = EvalEngineCoreError(e)
+        return add_error_context(e, cur_context)
+    elif isinstance(e, ExceptionWrapper):
+        # Continue the panic, attaching more tb info
+        tb = e.__traceback__
+        from ._error import process_python_tb
+        frames = process_python_tb(tb)
+        got_error = add_error_context(e.wrapped, {"frames": frames})
+        return add_error_context(got_error, type_checking_context(op, to_call_func, curr_value))
+    elif isinstance(e, Error_):
+        return add_error_context(e, type_checking_context(op, to_call_func, curr_value))
+    else:
+        py_e,frames = convert_python_exception(e)
+        got_error = Error.Panic()
+        got_error.nested = py_e
+        got_error = add_error_context(got_error, {"frames": frames})
+        return add_error_context(got_error, type_checking_context(op, to_call_func, curr_value))
+
+def error_from_op_output(new_value, op, to_call_func, curr_value):
+    # Here we have a choice - depends on what the caller expects, an Error or an exception
+    # Could also pass this down the line
+    # Need to distinguish between a caller wanting an error or wanting an exception
+    # TODO Can we add context about frame here?
+    new_value.nested = {"type": new_value.name, "args": new_value.args}
+    return add_error_context(new_value, type_checking_context(op, to_call_func, curr_value))
+
+def unpack_evaluated_value(chain, curr_value):
+    from ..core._error import Error_
+    if isinstance(curr_value, Iterator) or isinstance(curr_value, Generator):
+        # This branch should be eliminated if possible
+        print("NEED TO GET RID OF THIS")
+        print("With type:", type(curr_value))
+        print("NEED TO GET RID OF THIS")
+
+        return_list = []
+
+        it = iter(curr_value)
+        i = 0
+        while True:
+            cur_context = {
+                "chain": chain,
+                "state": "collecting",
+                "val_i": i,
+            }
+            try:
+                val = next(it)
+            except StopIteration:
+                break
+            except Exception as e:
+                if not custom_error_handling_activated():
+                    raise
+                    
+                if isinstance(e, EvalEngineCoreError):
+                    raise add_error_context(e, cur_context)
+                elif isinstance(e, ExceptionWrapper):
+                    raise add_error_context(e.wrapped, cur_context) from None
+                elif isinstance(e, Error_):
+                    raise add_error_context(e, cur_context) from None
+                else:
+                    py_e,frames = convert_python_exception(e)
+                    e = Error.Panic()
+                    e.nested = py_e
+                    e = add_error_context(e, {"frames": frames})
+                    e = add_error_context(e, cur_context)
+                    raise e from None
+
+            if isinstance(val, Error_):
+                if not custom_error_handling_activated():
+                    raise val
+                else:
+                    raise add_error_context(val, cur_context) from None
+
+            return_list.append(val)
+        return return_list
+    elif isinstance(curr_value, ZefGenerator_):
+        # ZefGenerator handles its own context and error raising
+        # TODO: We could bring the error handling into here?
+        return [i for i in curr_value]
+    return curr_value
+
+def reraise_evaluation_exception(chain, exc, curr_value, curr_op):
+    from ..core._error import Error_
+    if not custom_error_handling_activated():
+        raise exc
+    if isinstance(exc, EvalEngineCoreError):
+        # print("7")
+        raise exc
+
+    elif isinstance(exc, ExceptionWrapper):
+        # print("8")
+        raise exc from None
+
+    elif isinstance(exc, Error_):
+        # print("9")
+        if getattr(exc, "keep_traceback", None):
+            wrapper = ExceptionWrapper(exc)
+            wrapper.keep_traceback = True
+            wrapper.__traceback__ = exc.__traceback__
+            raise wrapper
+        raise ExceptionWrapper(exc) from None
 
-            else:
-                # print("10")
-                e = EvalEngineCoreError(exc)
-                e = add_error_context(e, {
-                    "chain": self,
-                    "op_i": 0,
-                    "input": curr_value,
-                    "op": curr_op,}
-                )
-                e = add_error_context(e, {"frames": e.frames,} )
-                raise e 
+    else:
+        # print("10")
+        e = EvalEngineCoreError(exc)
+        e = add_error_context(e, {
+            "chain": chain,
+            "op_i": 0,
+            "input": curr_value,
+            "op": curr_op,}
+        )
+        e = add_error_context(e, {"frames": e.frames,} )
+        raise e 
 
 def lazyvalue_is_a(x, typ):
     # TODO: Proper version
@@ -1450,8 +1613,6 @@ def type_spec_tuple(obj):
 def type_spec(obj, no_type_casting = False):
     from .VT import ValueType_
     from . import GraphSlice
-    from rx.subject import Subject
-    from rx.core import Observable
     if isinstance(obj, ValueType_):               return obj
     if isinstance(obj, type) or no_type_casting: t = obj
     else:                                        t = type(obj)
@@ -1469,9 +1630,8 @@ def type_spec(obj, no_type_casting = False):
         EZefRef:                    VT.EZefRef,
         Graph:                      VT.Graph,
         Time:                       VT.Time,  
-        Subject:                    VT.Awaitable,
-        Observable:                 VT.Awaitable,
         GraphSlice:                 VT.GraphSlice,
+        **{stream_type: VT.Awaitable for stream_type in rx_stream_types()},
     }.get(t, lambda o: ValueType_(type(o).__name__, 0))
     try:
         return res if str(res) in dir(VT) else res(obj)
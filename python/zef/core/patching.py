@@ -68,8 +68,9 @@ for x in override_types:
 
 # ------------------------- patch Time constructor to allow create of zef Time objects both from time stamps and readable strings ------------------------
 from datetime import datetime, timezone, timedelta
-import dateparser
-import pytz   # for time zones
+from .. import lazy_import
+dateparser = lazy_import("dateparser")
+pytz = lazy_import("pytz")   # for time zones
 
 def create_monkey_patched_Time_ctor(old_init_fct):
     def monkey_patched_Time_ctor(self, x, timezone: str = 'Asia/Singapore'):
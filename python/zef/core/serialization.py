@@ -18,6 +18,11 @@ report_import("zef.core.serialization")
 __all__ = [
     "serialize",
     "deserialize",
+    "serialize_binary",
+    "deserialize_binary",
+    "serialize_iter",
+    "serialize_to_stream",
+    "deserialize_stream",
 ]
 
 from ._core import *
@@ -31,7 +36,7 @@ from .abstract_raes import EntityRef_, RelationRef_, AttributeEntityRef_
 from ._error import Error_
 from ._image import Image_
 from .fx.fx_types import FXElement, Effect
-from .flat_graph import FlatGraph_, FlatRef_, FlatRefs_
+from .flat_graph import FlatGraph_, FlatRef_, FlatRefs_, MappedBlobs
 from ..pyzef import internals as pyinternals
 from .symbolic_expression import SymbolicExpression_
 from .user_value_type import UserValueInstance_
@@ -321,6 +326,10 @@ def serialize_atom(atom):
 
 
 
+def deserialize_bytes(d) -> bytes:
+    import base64
+    return base64.b64decode(d["data"])
+
 def deserialize_tuple(json_d: dict) -> tuple:
     return tuple(deserialize_internal(el) for el in json_d["items"])
 
@@ -554,6 +563,7 @@ serialization_mapping[UserValueInstance_] = serialize_user_value_instance
 serialization_mapping[Val_] = serialize_val
 serialization_mapping[Atom_] = serialize_atom
 
+deserialization_mapping["bytes"] = deserialize_bytes
 deserialization_mapping["dict"] = deserialize_dict
 deserialization_mapping["tuple"] = deserialize_tuple
 deserialization_mapping["ZefRef"] = deserialize_zeftypes
@@ -599,3 +609,517 @@ deserialization_mapping["SymbolicExpression"] = deserialize_symbolicexpression
 deserialization_mapping["UserValueInstance"] = deserialize_user_value_instance
 deserialization_mapping["Val"] = deserialize_val
 deserialization_mapping["Atom"] = deserialize_atom
+
+
+
+####################################
+# * Binary format
+#----------------------------------
+# A compact alternative to the JSON-compatible form above, for when the output
+# doesn't need to be JSON. Python scalars, bytes, lists, tuples, dicts and
+# FlatGraphs are encoded natively. Every other type is encoded as a record of
+# the fields of its JSON-compatible form, so that the deserialization_mapping
+# functions are used unchanged and the two forms always deserialize to the
+# same values. The `_zeftype` tags and field names of records are interned, so
+# each is only written once per message.
+#
+# Layout: the magic header, a version byte, and then a single value. A value
+# is a one byte tag followed by:
+#   None/False/True: nothing
+#   int: zigzag varint (of any size)
+#   float: 8 byte big-endian IEEE double
+#   str/bytes: varint length and the utf8/raw bytes
+#   list/tuple: varint length and the items
+#   dict: varint length and the alternating keys and values
+#   record: the interned tag, a varint number of fields, and the alternating
+#       interned field names and values
+#   object: a value which is the deserialized object itself (used for
+#       non-JSON items that appear inside a JSON-compatible record)
+#   FlatGraph: the key_dict and blobs as values
+# An interned string is either a new string (varint length and utf8 bytes)
+# which is assigned the next id, or a varint reference to a previous id.
+
+import struct as _struct
+
+binary_magic = b"ZEFB"
+binary_version = 1
+
+_B_NONE = 0x00
+_B_FALSE = 0x01
+_B_TRUE = 0x02
+_B_INT = 0x03
+_B_FLOAT = 0x04
+_B_STR = 0x05
+_B_BYTES = 0x06
+_B_LIST = 0x07
+_B_TUPLE = 0x08
+_B_DICT = 0x09
+_B_RECORD = 0x0A
+_B_OBJECT = 0x0B
+_B_FLATGRAPH = 0x0C
+
+_B_ISTR_NEW = 0x00
+_B_ISTR_REF = 0x01
+
+_pack_double = _struct.Struct(">d").pack
+_unpack_double = _struct.Struct(">d").unpack_from
+
+
+class BinaryEncoder:
+    def __init__(self):
+        self.out = bytearray()
+        self.interned = {}
+
+    def varint(self, n):
+        out = self.out
+        while n >= 0x80:
+            out.append((n & 0x7F) | 0x80)
+            n >>= 7
+        out.append(n)
+
+    def istr(self, s):
+        i = self.interned.get(s, None)
+        if i is None:
+            self.interned[s] = len(self.interned)
+            data = s.encode("utf-8")
+            self.out.append(_B_ISTR_NEW)
+            self.varint(len(data))
+            self.out += data
+        else:
+            self.out.append(_B_ISTR_REF)
+            self.varint(i)
+
+    def scalar(self, v):
+        # Returns False if v is not a python scalar or bytes
+        t = type(v)
+        out = self.out
+        if t is str:
+            data = v.encode("utf-8")
+            out.append(_B_STR)
+            self.varint(len(data))
+            out += data
+        elif t is int:
+            out.append(_B_INT)
+            self.varint(v << 1 if v >= 0 else ((-v) << 1) - 1)
+        elif t is float:
+            out.append(_B_FLOAT)
+            out += _pack_double(v)
+        elif t is bool:
+            out.append(_B_TRUE if v else _B_FALSE)
+        elif v is None:
+            out.append(_B_NONE)
+        elif t is bytes:
+            out.append(_B_BYTES)
+            self.varint(len(v))
+            out += v
+        else:
+            return False
+        return True
+
+    def value(self, v):
+        if self.scalar(v):
+            return
+        t = type(v)
+        out = self.out
+        if t is list or t is tuple:
+            out.append(_B_LIST if t is list else _B_TUPLE)
+            self.varint(len(v))
+            for item in v:
+                self.value(item)
+        elif t is dict:
+            out.append(_B_DICT)
+            self.varint(len(v))
+            for key,item in v.items():
+                self.value(key)
+                self.value(item)
+        elif t is FlatGraph_:
+            out.append(_B_FLATGRAPH)
+            self.value(v.key_dict)
+            # The blobs of a FlatGraph opened from a file are not a tuple
+            self.value(tuple(v.blobs))
+        elif t in serialization_mapping:
+            self.record(serialization_mapping[t](v))
+        else:
+            raise Exception(f"Don't know how to serialize type {t}")
+
+    def record(self, d):
+        self.out.append(_B_RECORD)
+        self.istr(d["_zeftype"])
+        self.varint(len(d) - 1)
+        for key,item in d.items():
+            if key == "_zeftype":
+                continue
+            self.istr(key)
+            self.json_value(item)
+
+    def json_value(self, v):
+        # Part of a JSON-compatible form, which must be reproduced exactly.
+        if self.scalar(v):
+            return
+        t = type(v)
+        if t is list:
+            self.out.append(_B_LIST)
+            self.varint(len(v))
+            for item in v:
+                self.json_value(item)
+        elif t is dict:
+            self.out.append(_B_DICT)
+            self.varint(len(v))
+            for key,item in v.items():
+                self.json_value(key)
+                self.json_value(item)
+        else:
+            # Some JSON-compatible forms include raw objects
+            self.out.append(_B_OBJECT)
+            self.value(v)
+
+
+class BinaryDecoder:
+    def __init__(self, data, pos=0):
+        self.data = memoryview(data)
+        self.pos = pos
+        self.interned = []
+
+    def varint(self):
+        data = self.data
+        pos = self.pos
+        b = data[pos]
+        pos += 1
+        n = b & 0x7F
+        shift = 7
+        while b & 0x80:
+            b = data[pos]
+            pos += 1
+            n |= (b & 0x7F) << shift
+            shift += 7
+        self.pos = pos
+        return n
+
+    def raw(self, n):
+        start = self.pos
+        self.pos += n
+        return self.data[start:self.pos]
+
+    def istr(self):
+        kind = self.data[self.pos]
+        self.pos += 1
+        if kind == _B_ISTR_NEW:
+            s = str(self.raw(self.varint()), "utf-8")
+            self.interned.append(s)
+            return s
+        return self.interned[self.varint()]
+
+    def value(self):
+        tag = self.data[self.pos]
+        self.pos += 1
+        if tag == _B_STR:
+            return str(self.raw(self.varint()), "utf-8")
+        elif tag == _B_INT:
+            n = self.varint()
+            return -((n + 1) >> 1) if n & 1 else n >> 1
+        elif tag == _B_FLOAT:
+            v, = _unpack_double(self.data, self.pos)
+            self.pos += 8
+            return v
+        elif tag == _B_LIST:
+            return [self.value() for _ in range(self.varint())]
+        elif tag == _B_TUPLE:
+            return tuple(self.value() for _ in range(self.varint()))
+        elif tag == _B_DICT:
+            n = self.varint()
+            d = {}
+            for _ in range(n):
+                key = self.value()
+                d[key] = self.value()
+            return d
+        elif tag == _B_NONE:
+            return None
+        elif tag == _B_FALSE:
+            return False
+        elif tag == _B_TRUE:
+            return True
+        elif tag == _B_BYTES:
+            return bytes(self.raw(self.varint()))
+        elif tag == _B_RECORD:
+            d = {"_zeftype": self.istr()}
+            for _ in range(self.varint()):
+                key = self.istr()
+                d[key] = self.value()
+            return deserialization_mapping[d["_zeftype"]](d)
+        elif tag == _B_OBJECT:
+            return self.value()
+        elif tag == _B_FLATGRAPH:
+            fg = FlatGraph_()
+            fg.key_dict = self.value()
+            fg.blobs = self.value()
+            return fg
+        raise Exception(f"Unknown tag {tag} in binary serialization at position {self.pos-1}")
+
+
+def serialize_binary(v) -> bytes:
+    """
+    Serializes v, which can be anything that `serialize` accepts, to the
+    compact binary format. The result round trips through
+    `deserialize_binary` to the same value as `deserialize(serialize(v))`.
+    """
+    enc = BinaryEncoder()
+    enc.out += binary_magic
+    enc.out.append(binary_version)
+    enc.value(v)
+    return bytes(enc.out)
+
+def is_binary_serialization(data) -> bool:
+    return isinstance(data, (bytes, bytearray, memoryview)) and bytes(data[:len(binary_magic)]) == binary_magic
+
+def deserialize_binary(data):
+    """
+    Deserializes the output of a previous call to serialize_binary.
+    """
+    if not is_binary_serialization(data):
+        raise Exception("Data is not in the zef binary serialization format")
+    version = data[len(binary_magic)]
+    if version != binary_version:
+        raise Exception(f"Don't understand binary serialization version '{version}'")
+    dec = BinaryDecoder(data, len(binary_magic) + 1)
+    v = dec.value()
+    if dec.pos != len(dec.data):
+        raise Exception("Trailing data after binary serialization")
+    return v
+
+
+####################################
+# * Streaming
+#----------------------------------
+# The binary format written and read incrementally, for values that are too
+# large to hold a second copy of in memory, e.g. when exporting a big
+# FlatGraph to a file or over a socket. The bytes produced are identical to
+# those of serialize_binary.
+#
+# The encoder flushes its buffer whenever it grows past the chunk size after
+# an item of a list, tuple or dict (including the key_dict and blobs of a
+# FlatGraph), and large bytes are passed through in slices, so the memory
+# used is bounded by the chunk size plus the largest single non-container
+# item. The decoder only buffers up to a chunk of the input beyond the item it
+# is reading.
+
+default_stream_chunk_size = 1 << 16
+
+class StreamBinaryEncoder(BinaryEncoder):
+    def __init__(self, chunk_size=default_stream_chunk_size):
+        super().__init__()
+        self.chunk_size = chunk_size
+
+    def take(self):
+        chunk = bytes(self.out)
+        self.out.clear()
+        return chunk
+
+    def iter_value(self, v):
+        t = type(v)
+        out = self.out
+        chunk_size = self.chunk_size
+        if t is list or t is tuple or t is MappedBlobs:
+            out.append(_B_LIST if t is list else _B_TUPLE)
+            self.varint(len(v))
+            # Don't hold on to every blob of a FlatGraph opened from a file
+            items = v.uncached() if t is MappedBlobs else v
+            for item in items:
+                if type(item) in _streamed_types:
+                    yield from self.iter_value(item)
+                else:
+                    self.value(item)
+                    if len(out) >= chunk_size:
+                        yield self.take()
+        elif t is dict:
+            out.append(_B_DICT)
+            self.varint(len(v))
+            for key,item in v.items():
+                self.value(key)
+                if type(item) in _streamed_types:
+                    yield from self.iter_value(item)
+                else:
+                    self.value(item)
+                    if len(out) >= chunk_size:
+                        yield self.take()
+        elif t is FlatGraph_:
+            out.append(_B_FLATGRAPH)
+            yield from self.iter_value(v.key_dict)
+            if v._blobs is None:
+                # Columnar: write the blobs one at a time rather than
+                # materializing (and caching) all of them on the FlatGraph
+                cols = v._columns
+                out.append(_B_TUPLE)
+                self.varint(len(cols))
+                for idx in range(len(cols)):
+                    self.value(cols.blob(idx))
+                    if len(out) >= chunk_size:
+                        yield self.take()
+            else:
+                yield from self.iter_value(v.blobs)
+        elif t is bytes and len(v) > chunk_size:
+            out.append(_B_BYTES)
+            self.varint(len(v))
+            yield self.take()
+            view = memoryview(v)
+            for start in range(0, len(v), chunk_size):
+                yield bytes(view[start:start+chunk_size])
+        else:
+            self.value(v)
+            if len(out) >= chunk_size:
+                yield self.take()
+
+_streamed_types = {list, tuple, dict, bytes, FlatGraph_}
+
+
+class StreamBinaryDecoder(BinaryDecoder):
+    def __init__(self, read, chunk_size=default_stream_chunk_size):
+        # read is a function taking a maximum number of bytes and returning
+        # at least one byte, or an empty bytes at the end of the stream.
+        self.read = read
+        self.chunk_size = chunk_size
+        self.data = bytearray()
+        self.pos = 0
+        self.interned = []
+
+    def fill(self, n):
+        # Make at least n bytes available from the current position
+        data = self.data
+        del data[:self.pos]
+        self.pos = 0
+        while len(data) < n:
+            more = self.read(max(self.chunk_size, n - len(data)))
+            if not more:
+                raise Exception("Unexpected end of stream in binary serialization")
+            data += more
+
+    def at_end(self):
+        if self.pos < len(self.data):
+            return False
+        more = self.read(self.chunk_size)
+        if not more:
+            return True
+        self.data[:] = more
+        self.pos = 0
+        return False
+
+    def byte(self):
+        if self.pos >= len(self.data):
+            self.fill(1)
+        b = self.data[self.pos]
+        self.pos += 1
+        return b
+
+    def raw(self, n):
+        # Note: this copies, as a view would prevent the buffer from resizing
+        if self.pos + n > len(self.data):
+            self.fill(n)
+        start = self.pos
+        self.pos += n
+        return self.data[start:self.pos]
+
+    # The base decoder indexes self.data directly for speed, so the places
+    # where it does so must first make the bytes available.
+
+    def varint(self):
+        b = self.byte()
+        n = b & 0x7F
+        shift = 7
+        while b & 0x80:
+            b = self.byte()
+            n |= (b & 0x7F) << shift
+            shift += 7
+        return n
+
+    def istr(self):
+        if self.pos >= len(self.data):
+            self.fill(1)
+        return super().istr()
+
+    def value(self):
+        if self.pos >= len(self.data):
+            self.fill(1)
+        if self.data[self.pos] == _B_FLOAT and self.pos + 9 > len(self.data):
+            self.fill(9)
+        return super().value()
+
+    def header(self):
+        # Returns False if the stream ended cleanly before the next value
+        if self.at_end():
+            return False
+        head = self.raw(len(binary_magic) + 1)
+        if bytes(head[:len(binary_magic)]) != binary_magic:
+            raise Exception("Stream is not in the zef binary serialization format")
+        version = head[len(binary_magic)]
+        if version != binary_version:
+            raise Exception(f"Don't understand binary serialization version '{version}'")
+        return True
+
+
+def _stream_reader(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        import io
+        return io.BytesIO(source).read
+    if hasattr(source, "recv"):
+        return source.recv
+    if hasattr(source, "read"):
+        return source.read
+    it = iter(source)
+    def read(n):
+        # Chunks are passed through whole, whatever their size
+        for chunk in it:
+            if len(chunk) > 0:
+                return chunk
+        return b""
+    return read
+
+def _stream_writer(sink):
+    if hasattr(sink, "sendall"):
+        return sink.sendall
+    return sink.write
+
+
+def serialize_iter(v, chunk_size=default_stream_chunk_size):
+    """
+    Serializes v to the binary format of serialize_binary, as a generator of
+    bytes chunks of roughly chunk_size each. The serialized form is never
+    held in memory in full.
+
+    Example:
+        with open("export.zefb", "wb") as f:
+            for chunk in serialize_iter(fg):
+                f.write(chunk)
+    """
+    enc = StreamBinaryEncoder(chunk_size)
+    enc.out += binary_magic
+    enc.out.append(binary_version)
+    yield from enc.iter_value(v)
+    if len(enc.out) > 0:
+        yield enc.take()
+
+def serialize_to_stream(v, sink, chunk_size=default_stream_chunk_size):
+    """
+    Writes the serialize_iter chunks of v to sink, which can be a file-like
+    object or a socket.
+    """
+    write = _stream_writer(sink)
+    for chunk in serialize_iter(v, chunk_size):
+        write(chunk)
+
+def deserialize_stream(source, chunk_size=default_stream_chunk_size):
+    """
+    Deserializes values in the binary format from source, as a generator
+    yielding each value in turn until the end of the stream. The source can
+    be a file-like object, a socket, an iterable of bytes chunks (such as the
+    output of serialize_iter) or a bytes object.
+
+    As the source is read ahead by up to chunk_size bytes, it should not be
+    shared with other readers.
+
+    Example:
+        with open("export.zefb", "rb") as f:
+            fg, = deserialize_stream(f)
+    """
+    dec = StreamBinaryDecoder(_stream_reader(source), chunk_size)
+    while dec.header():
+        dec.interned = []
+        yield dec.value()
@@ -55,7 +55,6 @@ def my_fct(x: z_spec1,y: z_spec2, z: z_spec3) -> z_spec4:
 from typing import Optional, Union
 import typing
 import inspect
-import pyperclip
 import traceback
 
 from . import internals
@@ -186,15 +185,117 @@ def time_resolved_hashable(z_fct):
 
 
 
-def compile_in_zef_context(fct_str: str, additional_globals: dict, fake_filename="__zef__"):
+##############################
+# * Compilation caches
+#----------------------------
+# Compiling the source of zef functions dominates loading graphs with many of
+# them, so there are three levels of caching:
+#
+# 1) _local_compiled_zef_functions: by the ZefRef (and its frame) of the function.
+# 2) _compiled_by_closure: by the hash of the source code together with the
+#    hashes of all bound zef functions. The same function seen from different
+#    time slices shares one function object.
+# 3) The code objects on disk, by the hash of the source code only, so that a
+#    new process can skip compiling. The directory can be set with
+#    ZEF_FUNCTION_CACHE_DIR and the disk cache disabled with
+#    ZEF_FUNCTION_CACHE=0.
+
+import os
+import hashlib
+import marshal
+import importlib.util
+
+_compiled_by_closure = {}
+_closure_keys = {}
+_code_cache = {}
+
+_zef_globals = None
+_zef_globals_sizes = None
+def zef_globals(refresh=False):
+    """The namespace that zef functions are executed in.
+
+    The namespace is a snapshot of zef.core and zef.ops, which is rebuilt when
+    either module has gained names since it was taken, e.g. when the first zef
+    function is compiled while zef is still being imported. Pass refresh=True
+    to rebuild it after names have been reassigned."""
+    global _zef_globals, _zef_globals_sizes
     from .. import core
     from .. import ops
-    shared_globals = {
-        **core.__dict__,
-        **ops.__dict__,
-        **additional_globals,     # convert the list of tuples to a dict: the first tuple element is the fct name as a str
-        } # pass variables in, but compiled fct will be in there too
-    code = compile(fct_str, fake_filename, "exec")
+    sizes = (len(core.__dict__), len(ops.__dict__))
+    if refresh or _zef_globals is None or sizes != _zef_globals_sizes:
+        _zef_globals = {**core.__dict__, **ops.__dict__}
+        _zef_globals_sizes = sizes
+    return _zef_globals
+
+def function_cache_dir():
+    if os.environ.get("ZEF_FUNCTION_CACHE", "").lower() in ["0", "false", "no", "off"]:
+        return None
+    path = os.environ.get("ZEF_FUNCTION_CACHE_DIR", "")
+    if path == "":
+        path = os.path.join(os.path.expanduser("~"), ".zef", "function_cache")
+    return path
+
+def source_hash(fct_str: str, fake_filename="__zef__") -> str:
+    # Code objects are specific to the python version, which the magic number
+    # of .pyc files captures.
+    h = hashlib.sha256(importlib.util.MAGIC_NUMBER)
+    h.update(fake_filename.encode() + b"\0")
+    h.update(fct_str.encode())
+    return h.hexdigest()
+
+def closure_hash(fct_str: str, bound_hashes: dict) -> str:
+    h = hashlib.sha256(source_hash(fct_str).encode())
+    for name in sorted(bound_hashes):
+        h.update(f"\0{name}={bound_hashes[name]}".encode())
+    return h.hexdigest()
+
+_digest_size = hashlib.sha256().digest_size
+
+def cached_compile(fct_str: str, fake_filename="__zef__"):
+    key = source_hash(fct_str, fake_filename)
+    code = _code_cache.get(key, None)
+    if code is not None:
+        return code
+
+    cache_dir = function_cache_dir()
+    path = None if cache_dir is None else os.path.join(cache_dir, key + ".zefc")
+    if path is not None:
+        # A truncated or corrupt file can make marshal fail in any way, or
+        # even produce a wrong code object, so the file starts with a digest
+        # of the rest and any failure falls back to compiling.
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            digest,data = data[:_digest_size], data[_digest_size:]
+            if hashlib.sha256(data).digest() == digest:
+                code = marshal.loads(data)
+        except Exception:
+            code = None
+
+    if code is None:
+        code = compile(fct_str, fake_filename, "exec")
+        if path is not None:
+            # The cache is only an optimisation, so failing to write it (e.g. a
+            # read-only home directory) is not an error.
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                data = marshal.dumps(code)
+                with open(tmp_path, "wb") as f:
+                    f.write(hashlib.sha256(data).digest() + data)
+                os.replace(tmp_path, path)
+            except OSError:
+                pass
+
+    _code_cache[key] = code
+    return code
+
+
+def compile_in_zef_context(fct_str: str, additional_globals: dict, fake_filename="__zef__"):
+    # pass variables in, but compiled fct will be in there too
+    shared_globals = dict(zef_globals())
+    shared_globals.update(additional_globals)     # convert the list of tuples to a dict: the first tuple element is the fct name as a str
+    code = cached_compile(fct_str, fake_filename)
     # if type annotations (both input and output) are made, these show up as the 
     # first elements in code.co_names tuple
     # e.g. for def mapper(x: str) -> int: 
@@ -206,15 +307,16 @@ def compile_in_zef_context(fct_str: str, additional_globals: dict, fake_filename
 
 def compile_zef_function(z_fct: ZefRef):
     """"""
-    if time_resolved_hashable(z_fct) in _local_compiled_zef_functions:
-        return z_fct
+    key = time_resolved_hashable(z_fct)
+    if key in _local_compiled_zef_functions:
+        return _local_compiled_zef_functions[key]
 
     g = Graph(z_fct)
     # Prevent garbage collection
     set_keep_alive(g, True)
 
     # first compile all zef functions bound within this zef fct's scope
-    z_bound_fcts_pairs = (
+    z_bound_pairs = (
         z_fct
         | out_rels[RT.Binding]
         | map[lambda z_rel: (z_rel | Out[RT.Name] | value | collect,
@@ -222,13 +324,20 @@ def compile_zef_function(z_fct: ZefRef):
                                  g[z_rel | Out[RT.UseTimeSlice] | value | collect]
                                  | to_graph_slice | collect
                              ] | collect)]
-        | map[lambda p: (p[0], compile_zef_function(p[1]))]
         | collect
     )
+    z_bound_fcts_pairs = [(name, compile_zef_function(z_bound)) for name,z_bound in z_bound_pairs]
+    bound_hashes = {name: _closure_keys[time_resolved_hashable(z_bound)] for name,z_bound in z_bound_pairs}
+
     fct_str = z_fct | Out[RT.PythonSourceCode] | value | collect
-    # what is in the scope of the zef function that will execute?    
-    fct = compile_in_zef_context(fct_str, dict(z_bound_fcts_pairs))
-    _local_compiled_zef_functions[time_resolved_hashable(z_fct)] = fct
+    closure_key = closure_hash(fct_str, bound_hashes)
+    fct = _compiled_by_closure.get(closure_key, None)
+    if fct is None:
+        # what is in the scope of the zef function that will execute?    
+        fct = compile_in_zef_context(fct_str, dict(z_bound_fcts_pairs))
+        _compiled_by_closure[closure_key] = fct
+    _closure_keys[key] = closure_key
+    _local_compiled_zef_functions[key] = fct
     return fct
 
 
@@ -374,4 +374,430 @@ def import_actions(decl):
     actions = []
     for d in decl["definitions"]:
         actions += import_actions_definition(d, decl)
-    return distinct(actions)
\ No newline at end of file
+    return distinct(actions)
+
+##############################
+# * Streaming import
+#----------------------------
+# The functions below import a definition a chunk of rows at a time, with each
+# chunk committed as its own transaction. Rows are first turned into plain
+# tuples ("wishes") which refer to objects by their internal id:
+#
+#   ("E", et, name)                                   - an entity
+#   ("F", owner_name, rt, data_type, ae_name, value)  - a field on an object
+#   ("R", source_name, rt, target_name, rel_name, shared)
+#                                                     - a relation
+#
+# Objects created by an earlier chunk are referenced through the receipt of
+# that chunk's transaction instead of being created again. Relations which are
+# not shared are named after their row, so can't be referred to by any other
+# row and aren't remembered after their chunk.
+
+# Data types which are coerced with the columns. Others are coerced when the
+# wishes are converted to actions, as their values may not be picklable.
+_plain_data_types = {"Int", "Float", "String", "Bool"}
+
+def column_coercer(data_type):
+    aet = aet_str_to_aet(data_type)
+    if is_a(aet, AET.Int):
+        return int
+    elif is_a(aet, AET.Float):
+        return float
+    elif is_a(aet, AET.String):
+        return lambda val: val
+    else:
+        return lambda val: coerce_val(val, aet)
+
+def coerce_column(series, data_type):
+    """Coerces a whole column of a dataframe to python values of the given
+    data_type, with missing values as None. Values of data types that are not
+    plain python types are left as they are."""
+    import pandas.core.dtypes.common as p_dtypes
+    vals = series.tolist()
+    if not series.hasnans:
+        if data_type == "String":
+            return vals
+        if data_type == "Int" and p_dtypes.is_integer_dtype(series.dtype):
+            return vals
+        if data_type == "Float" and p_dtypes.is_float_dtype(series.dtype):
+            return vals
+    mask = series.isna().tolist()
+    if data_type not in _plain_data_types:
+        return [None if m else v for v,m in zip(vals, mask)]
+    f = column_coercer(data_type)
+    return [None if m else f(v) for v,m in zip(vals, mask)]
+
+class RowWishMaker:
+    """Turns coerced columns of one definition into wishes. This only uses
+    plain python data, so it can be used in worker processes too."""
+    def __init__(self, definition, decl):
+        assert validate_definition(definition, decl)
+        self.definition = definition
+        groups = definition["cols"] | group_by[get["purpose"]][["entity","field", "field_on", "ignore", "id", "source", "target"]] | func[dict] | collect
+        self.col_ents = groups["entity"]
+        self.col_fields = groups["field"]
+        self.col_fieldons = groups["field_on"]
+        self.col_source = only(groups["source"]) if definition["kind"] == "relation" else None
+        self.col_target = only(groups["target"]) if definition["kind"] == "relation" else None
+        if len(groups["id"]) == 0:
+            self.col_ID = None
+        elif len(groups["id"]) == 1:
+            self.col_ID = only(groups["id"])
+
+        # The id formatting depends on the ID column of each ET, which is
+        # looked up only once here.
+        self.id_coercers = {}
+        self.id_cols = {}
+        ets = [col["ET"] for col in self.col_ents]
+        if definition["kind"] == "entity":
+            ets += [definition["ET"]]
+        else:
+            ets += [self.col_source["ET"], self.col_target["ET"]]
+        for et in ets:
+            ID_col = get_ent_ID_col(et, decl)
+            self.id_cols[et] = ID_col
+            self.id_coercers[et] = column_coercer(ID_col["data_type"])
+        self.field_suffix = {}
+        for col in self.col_fields + self.col_fieldons + [self.col_ID] + list(self.id_cols.values()):
+            if col is not None:
+                self.field_suffix[col["RT"]] = f" field {RT(col['RT'])}"
+
+    def columns_needed(self):
+        cols = self.col_ents + self.col_fields + self.col_fieldons
+        if self.col_ID is not None:
+            cols = cols + [self.col_ID]
+        if self.definition["kind"] == "relation":
+            cols = cols + [self.col_source, self.col_target]
+        return {col["name"]: col["data_type"] for col in cols}
+
+    def et_id(self, et, val):
+        val = self.id_coercers[et](val)
+        assert val is not None and not is_nan(val)
+        return f"<ET_{et} {val}>"
+
+    def field(self, owner, col, val):
+        if val is None or isinstance(val, float) and math.isnan(val):
+            return None
+        return ("F", owner, col["RT"], col["data_type"], owner + self.field_suffix[col["RT"]], val)
+
+    def wishes(self, columns, row_labels):
+        """columns maps column names to lists of values, coerced as in
+        coerce_column. row_labels are the row indices of the data source."""
+        definition = self.definition
+        wishes = []
+        def add_field(owner, col, val):
+            w = self.field(owner, col, val)
+            if w is not None:
+                wishes.append(w)
+
+        for i,i_row in enumerate(row_labels):
+            # First do everything that is not a relation
+            for col_ent in self.col_ents:
+                val = columns[col_ent["name"]][i]
+                if val is not None:
+                    et = col_ent["ET"]
+                    z_id = self.et_id(et, val)
+                    wishes.append(("E", et, z_id))
+                    add_field(z_id, self.id_cols[et], self.id_coercers[et](val))
+
+            # Next get the object which corresponds to this row
+            if definition["kind"] == "entity":
+                this_id = self.et_id(definition["ET"], columns[self.col_ID["name"]][i])
+                wishes.append(("E", definition["ET"], this_id))
+            elif definition["kind"] == "relation":
+                source_id = self.et_id(self.col_source["ET"], columns[self.col_source["name"]][i])
+                target_id = self.et_id(self.col_target["ET"], columns[self.col_target["name"]][i])
+                wishes.append(("E", self.col_source["ET"], source_id))
+                wishes.append(("E", self.col_target["ET"], target_id))
+
+                if self.col_ID is None:
+                    this_id = rt_id(source_id, target_id, definition["RT"], i_row, "Int")
+                else:
+                    this_id = rt_id(source_id, target_id, definition["RT"], columns[self.col_ID["name"]][i], self.col_ID["data_type"])
+                wishes.append(("R", source_id, definition["RT"], target_id, this_id, self.col_ID is not None))
+            else:
+                raise NotImplementedError()
+
+            if self.col_ID is not None:
+                add_field(this_id, self.col_ID, columns[self.col_ID["name"]][i])
+
+            # All fields for this object
+            for col_field in self.col_fields:
+                add_field(this_id, col_field, columns[col_field["name"]][i])
+
+            # All connections to the other entities
+            for col_ent in self.col_ents:
+                if col_ent["name"] == definition["ID_col"]:
+                    continue
+                val = columns[col_ent["name"]][i]
+                if val is not None:
+                    target_id = self.et_id(col_ent["ET"], val)
+                    rel_id = f"{this_id} {col_ent['RT']} {target_id}"
+                    wishes.append(("R", this_id, col_ent["RT"], target_id, rel_id, True))
+
+            # All fields on connections
+            for col_fieldon in self.col_fieldons:
+                col_target = get_col(self.col_ents, col_fieldon["target"])
+                target_id = self.et_id(col_target["ET"], columns[col_target["name"]][i])
+                rel_id = f"{this_id} {col_target['RT']} {target_id}"
+                add_field(rel_id, col_fieldon, columns[col_fieldon["name"]][i])
+
+        return wishes
+
+def wishes_to_actions(wishes, committed, g):
+    """Converts wishes to actions for a transaction onto g. Entities and
+    relations which are in committed (from previous chunks) or earlier in
+    wishes are not created again, nor are fields which their owner already has
+    on the graph. Returns the actions and the names of the new entities and
+    shared relations, whose uids should be added to committed from the
+    receipt."""
+    actions = []
+    new_names = []
+    pending = set()
+    rts = {}
+    aets = {}
+    refs = {}
+    def get_rt(rt):
+        out = rts.get(rt, None)
+        if out is None:
+            out = rts[rt] = RT(rt)
+        return out
+    def get_aet(data_type):
+        out = aets.get(data_type, None)
+        if out is None:
+            out = aets[data_type] = aet_str_to_aet(data_type)
+        return out
+    def ref(name):
+        uid = committed.get(name, None)
+        if uid is None:
+            return Z[name]
+        z = refs.get(name, None)
+        if z is None:
+            z = refs[name] = now(g[uid])
+        return z
+
+    for wish in wishes:
+        kind = wish[0]
+        if kind == "E":
+            _,et,name = wish
+            if name in committed or name in pending:
+                continue
+            pending.add(name)
+            new_names.append(name)
+            actions.append(ET(et)[name])
+        elif kind == "F":
+            _,owner,rt,data_type,ae_name,val = wish
+            if ae_name in pending:
+                continue
+            if owner in committed and (ref(owner) | Outs[get_rt(rt)] | length | collect) > 0:
+                continue
+            if data_type not in _plain_data_types:
+                val = coerce_val(val, get_aet(data_type))
+                if val is None:
+                    continue
+            pending.add(ae_name)
+            actions += [
+                get_aet(data_type)[ae_name],
+                Z[ae_name] <= val,
+                (ref(owner), get_rt(rt), Z[ae_name]),
+            ]
+        elif kind == "R":
+            _,src,rt,trg,name,shared = wish
+            if name in committed or name in pending:
+                continue
+            pending.add(name)
+            if shared:
+                new_names.append(name)
+            actions.append((ref(src), get_rt(rt)[name], ref(trg)))
+        else:
+            raise Exception(f"Unknown wish kind: {kind}")
+
+    return actions, new_names
+
+def commit_wishes(wishes, g, committed):
+    actions,new_names = wishes_to_actions(wishes, committed, g)
+    if len(actions) == 0:
+        return 0
+    r = actions | transact[g] | run
+    # Only the uids are kept, which are enough to find the objects again in
+    # later chunks. Fields aren't tracked at all: a field of an object from an
+    # earlier chunk is looked up on the graph instead.
+    for name in new_names:
+        committed[name] = base_uid(r[name])
+    return len(actions)
+
+def read_chunks(definition, chunk_size):
+    if definition["data_source"]["type"] == "csv":
+        return pandas.read_csv(definition["data_source"]["filename"], chunksize=chunk_size)
+    else:
+        raise Exception("Unknown data source type")
+
+def chunk_wishes(maker, df):
+    columns = {name: coerce_column(df[name], data_type)
+               for name,data_type in maker.columns_needed().items()}
+    return maker.wishes(columns, df.index.tolist())
+
+def _csv_records(f):
+    """Yields (start, end, is_blank) for the byte range of each record of a csv
+    file opened in binary mode. A newline inside a quoted value doesn't end a
+    record."""
+    pos = 0
+    start = 0
+    in_quotes = False
+    blank = True
+    for line in f:
+        pos += len(line)
+        if line.count(b'"') & 1:
+            in_quotes = not in_quotes
+        blank = blank and line.strip() == b""
+        if not in_quotes:
+            yield start, pos, blank
+            start = pos
+            blank = True
+    if start < pos:
+        yield start, pos, blank
+
+def csv_row_ranges(filename, chunk_size):
+    """Splits a csv file into chunks of chunk_size rows without parsing it.
+    Yields (header_end, first_row, start, end) with the byte ranges of the
+    header and of the rows of each chunk. Blank lines are not counted as rows,
+    as with pandas.read_csv."""
+    with open(filename, "rb") as f:
+        records = _csv_records(f)
+        header_end = None
+        for _,end,blank in records:
+            if not blank:
+                header_end = end
+                break
+        if header_end is None:
+            return
+
+        first_row = 0
+        n_rows = 0
+        for rec_start,rec_end,blank in records:
+            if blank:
+                continue
+            if n_rows == 0:
+                start = rec_start
+            n_rows += 1
+            if n_rows == chunk_size:
+                yield header_end, first_row, start, rec_end
+                first_row += n_rows
+                n_rows = 0
+        if n_rows > 0:
+            yield header_end, first_row, start, rec_end
+
+def read_csv_rows(filename, header_end, first_row, start, end):
+    """Parses one range of rows given by csv_row_ranges. The index of the
+    frame is the row number in the whole file, as with read_chunks."""
+    import io
+    with open(filename, "rb") as f:
+        header = f.read(header_end)
+        f.seek(start)
+        data = f.read(end - start)
+    df = pandas.read_csv(io.BytesIO(header + data))
+    df.index = range(first_row, first_row + len(df))
+    return df
+
+# State of a worker process, set up by _init_wish_worker.
+_worker_definitions = None
+_worker_decl = None
+_worker_makers = {}
+
+def _init_wish_worker(definitions, decl):
+    global _worker_definitions, _worker_decl
+    _worker_definitions = definitions
+    _worker_decl = decl
+    _worker_makers.clear()
+
+def _wishes_worker(i_def, row_range):
+    # Each worker reads and parses its own range of rows, so the parent process
+    # only has to find the row boundaries.
+    definition = _worker_definitions[i_def]
+    maker = _worker_makers.get(i_def, None)
+    if maker is None:
+        maker = RowWishMaker(definition, _worker_decl)
+        _worker_makers[i_def] = maker
+    df = read_csv_rows(definition["data_source"]["filename"], *row_range)
+    return len(df), chunk_wishes(maker, df)
+
+def make_wish_pool(definitions, decl, processes):
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    # Forking a process with zef's threads running is not safe
+    return ProcessPoolExecutor(max_workers=processes,
+                               mp_context=multiprocessing.get_context("spawn"),
+                               initializer=_init_wish_worker,
+                               initargs=(definitions, decl))
+
+def iter_chunk_wishes(definition, decl, chunk_size, pool=None, i_def=None, max_in_flight=8):
+    """Yields (n_rows, wishes) for each chunk of the data source, in order.
+    With a pool, the ranges of rows are read and converted in the worker
+    processes, with a bounded number of chunks in flight."""
+    if pool is None:
+        maker = RowWishMaker(definition, decl)
+        for df in read_chunks(definition, chunk_size):
+            yield len(df), chunk_wishes(maker, df)
+        return
+
+    if definition["data_source"]["type"] != "csv":
+        raise Exception("Unknown data source type")
+
+    from collections import deque
+    in_flight = deque()
+    for row_range in csv_row_ranges(definition["data_source"]["filename"], chunk_size):
+        in_flight.append(pool.submit(_wishes_worker, i_def, row_range))
+        if len(in_flight) >= max_in_flight:
+            yield in_flight.popleft().result()
+    while len(in_flight) > 0:
+        yield in_flight.popleft().result()
+
+def import_definition_streaming(definition, decl, g, *, chunk_size=100_000, progress=None, committed=None, processes=None):
+    """Imports the data source of one definition onto g, transacting each chunk
+    of chunk_size rows separately. Memory use is bounded by the chunk size and
+    one uid per entity and relation imported (none per field, nor per
+    relation of a relation definition without an ID column).
+
+    progress is called after each chunk with a dict describing the progress.
+    committed maps the internal names of entities and shared relations to
+    their uids. It can be shared between calls to refer to the objects of earlier
+    definitions, and is returned at the end.
+
+    With processes, the rows of each chunk are converted to wishes in a pool of
+    that many worker processes. Chunks are still transacted one at a time in
+    order, so the result is the same as without the pool."""
+    if processes is not None and processes > 1:
+        with make_wish_pool([definition], decl, processes) as pool:
+            return _import_definition_streaming(definition, decl, g, chunk_size, progress, committed, pool, 0, 2*processes)
+    return _import_definition_streaming(definition, decl, g, chunk_size, progress, committed)
+
+def _import_definition_streaming(definition, decl, g, chunk_size, progress, committed, pool=None, i_def=None, max_in_flight=8):
+    if committed is None:
+        committed = {}
+
+    n_rows = 0
+    for i_chunk,(n_chunk_rows,wishes) in enumerate(iter_chunk_wishes(definition, decl, chunk_size, pool, i_def, max_in_flight)):
+        n_actions = commit_wishes(wishes, g, committed)
+        n_rows += n_chunk_rows
+        if progress is not None:
+            progress({
+                "tag": definition["tag"],
+                "chunk": i_chunk,
+                "rows": n_rows,
+                "actions": n_actions,
+                "objects": len(committed),
+            })
+    return committed
+
+def import_streaming(decl, g, *, chunk_size=100_000, progress=None, processes=None):
+    """Streaming alternative to `import_actions(decl) | transact[g] | run` for
+    large data sources. See import_definition_streaming for the options."""
+    committed = {}
+    if processes is not None and processes > 1:
+        with make_wish_pool(decl["definitions"], decl, processes) as pool:
+            for i_def,d in enumerate(decl["definitions"]):
+                _import_definition_streaming(d, decl, g, chunk_size, progress, committed, pool, i_def, 2*processes)
+    else:
+        for d in decl["definitions"]:
+            _import_definition_streaming(d, decl, g, chunk_size, progress, committed)
+    return committed
@@ -43,6 +43,14 @@ parser.add_argument("--init-hook", type=str, dest="init_hook", default=os.enviro
                     help="If present, a function in the hooks file to run on initialisation of the data graph")
 parser.add_argument("--debug-level", type=int, dest="debug_level", default=os.environ.get("SIMPLEGQL_DEBUG_LEVEL", "0"),
                     help="The amount of debug messages to output")
+parser.add_argument("--cache-queries", action="store_true", dest="cache_queries", default=(True if "SIMPLEGQL_CACHE_QUERIES" in os.environ else False),
+                    help="Cache the results of read-only queries until the next transaction on the data graph.")
+parser.add_argument("--cache-max-entries", type=int, dest="cache_max_entries", default=int(os.environ.get("SIMPLEGQL_CACHE_MAX_ENTRIES", "1024")),
+                    help="The maximum number of query results to keep in the cache.")
+parser.add_argument("--cache-max-mb", type=int, dest="cache_max_mb", default=int(os.environ.get("SIMPLEGQL_CACHE_MAX_MB", "64")),
+                    help="The maximum total size in MB of the query results to keep in the cache.")
+parser.add_argument("--index-fields", action="store_true", dest="index_fields", default=(True if "SIMPLEGQL_INDEX_FIELDS" in os.environ else False),
+                    help="Maintain an index of the unique and searchable fields, used for upfetches and filtered queries.")
 args = parser.parse_args()
 
 schema_gql = args.schema_file | read_file | run | get["content"] | collect
@@ -122,7 +130,11 @@ server_uuid = start_server(root, g_data,
                            port=args.port,
                            bind_address=args.bind,
                            debug_level=args.debug_level,
-                           read_only=args.read_only)
+                           read_only=args.read_only,
+                           cache_queries=args.cache_queries,
+                           cache_max_entries=args.cache_max_entries,
+                           cache_max_bytes=args.cache_max_mb*2**20,
+                           index_fields=args.index_fields)
 
 import time
 try:
@@ -18,6 +18,9 @@ from ...ops import *
 from functools import partial as P
 from ...core.logger import log
 import functools
+import threading
+import heapq
+import bisect
 
 from ariadne import ObjectType, QueryType, MutationType, EnumType, ScalarType
 
@@ -73,6 +76,61 @@ op_upfetch_field = (assert_type | out_rels[RT.GQL_Field]
                     | collect)
 op_has_upfetch = op_upfetch_field | Not[equals[None]] | collect
 
+##############################
+# * Field metadata
+#----------------------------
+
+class FieldMeta:
+    """The schema details of a GQL_Field needed to resolve it. These are looked
+    up once, so that resolving a field on many objects doesn't traverse the
+    schema graph for each of them."""
+    __slots__ = ["z_field", "name", "target", "is_list", "is_required",
+                 "is_incoming", "is_scalar", "target_has_auth", "rt",
+                 "relation", "is_triple", "self_raet", "other_raet",
+                 "function_resolver"]
+
+    def __init__(self, z_field):
+        self.z_field = z_field
+        self.name = z_field | F.Name | collect
+        self.target = target(z_field)
+        self.is_list = z_field | op_is_list | collect
+        self.is_required = z_field | op_is_required | collect
+        self.is_incoming = z_field | op_is_incoming | collect
+        self.is_scalar = self.target | op_is_scalar | collect
+        self.target_has_auth = self.target | has_out[RT.AllowQuery] | collect
+
+        self.relation = None
+        self.rt = None
+        self.is_triple = False
+        self.self_raet = None
+        self.other_raet = None
+        self.function_resolver = None
+        if z_field | has_out[RT.GQL_Resolve_With] | collect:
+            relation = z_field | Out[RT.GQL_Resolve_With] | collect
+            self.relation = relation
+            self.rt = RT(relation)
+            self.is_triple = source(relation) != relation
+            if self.is_triple:
+                if self.is_incoming:
+                    self.self_raet = rae_type(target(relation))
+                    self.other_raet = rae_type(source(relation))
+                else:
+                    self.self_raet = rae_type(source(relation))
+                    self.other_raet = rae_type(target(relation))
+        elif z_field | has_out[RT.GQL_FunctionResolver] | collect:
+            self.function_resolver = func[z_field | Out[RT.GQL_FunctionResolver] | collect]
+
+_field_metas = {}
+_fields_by_name = {}
+
+def field_meta(z_field):
+    key = uid(z_field)
+    meta = _field_metas.get(key, None)
+    if meta is None:
+        meta = FieldMeta(z_field)
+        _field_metas[key] = meta
+    return meta
+
 ########################################
 # * Generating it all
 #--------------------------------------
@@ -126,6 +184,7 @@ def generate_resolvers_fcts(schema_root):
             
         for z_field in z_type | out_rels[RT.GQL_Field]:
             field_name = z_field | F.Name | collect
+            field_meta(z_field)
 
             is_scalar = z_field | target | op_is_scalar | collect
             is_required = z_field | op_is_required | collect
@@ -429,15 +488,19 @@ def resolve_get2(obj, type_node, graphql_info, query_args):
     return resolve_get(obj, graphql_info, type_node=type_node, **query_args)
 
 def resolve_query(_, info, *, type_node, **params):
-    ents = obtain_initial_list(type_node, params.get("filter", None), info)
+    # Auth is deferred until after the filter, so that it is only run on the
+    # entities that could be returned.
+    ents = obtain_initial_list(type_node, params.get("filter", None), info, auth=False)
 
-    ents = handle_list_params(ents, type_node, params, info)
+    ents = handle_list_params(ents, type_node, params, info, query_auth=True)
 
     return ents | collect
 
 @func
 def resolve_query2(obj, type_node, graphql_info, query_args):
-    return resolve_query(obj, graphql_info, type_node=type_node, **query_args)
+    ents = resolve_query(obj, graphql_info, type_node=type_node, **query_args)
+    prefetch_fields(ents, type_node, graphql_info)
+    return ents
 
 def resolve_aggregate(_, info, *, type_node, **params):
     # We can potentially defer the aggregation till later, by returning a kind
@@ -483,27 +546,42 @@ def resolve_aggregate2(obj, type_node, graphql_info, query_args):
     return resolve_aggregate(obj, graphql_info, type_node=type_node, **query_args)
 
 def resolve_field(z, info, *, z_field, **params):
-    is_list = z_field | op_is_list | collect
-    is_required = z_field | op_is_required | collect
+    meta = field_meta(z_field)
+
+    cache = info.context.get("field_cache", None)
+    if cache is not None and len(params) == 0:
+        try:
+            cached = cache.get((meta, z), None)
+        except TypeError:
+            # Unhashable objects from custom resolvers are never prefetched.
+            cached = None
+        if cached is not None:
+            return cached[0]
 
     opts = internal_resolve_field(z, info, z_field)
 
-    if is_list:
-        opts = handle_list_params(opts, target(z_field), params, info)
+    if meta.is_list:
+        opts = handle_list_params(opts, meta.target, params, info)
 
     opts = collect(opts)
 
-    if is_list:
+    if meta.is_list:
+        if not meta.is_scalar:
+            prefetch_fields(opts, meta.target, info)
         return opts
     else:
-        if len(opts) == 0:
-            if is_required:
-                log.error("A single field has no option and is required!", z=z, z_field=z_field, z_name=fvalue(source(z_field), RT.Name, None), field_name=fvalue(z_field, RT.Name, None))
-            return None
-        if len(opts) >= 2:
-            log.error("A single field has multiple options!", z=z, z_field=z_field, type_name=fvalue(source(z_field), RT.Name, None), field_name=fvalue(z_field, RT.Name, None))
-            return None
-        return single(opts)
+        return single_field_value(z, meta, opts)
+
+def single_field_value(z, meta, opts):
+    if len(opts) == 0:
+        if meta.is_required:
+            log.error("A single field has no option and is required!", z=z, z_field=meta.z_field, z_name=fvalue(source(meta.z_field), RT.Name, None), field_name=meta.name)
+        return None
+    if len(opts) >= 2:
+        log.error("A single field has multiple options!", z=z, z_field=meta.z_field, type_name=fvalue(source(meta.z_field), RT.Name, None), field_name=meta.name)
+        return None
+    return single(opts)
+
 @func
 def resolve_field2(obj, z_field, graphql_info, query_args):
     return resolve_field(obj, graphql_info, z_field=z_field, **query_args)
@@ -708,7 +786,9 @@ def resolve_filter_response(obj, info, *, type_node, **params):
     return ents | collect
 @func
 def resolve_filter_response2(obj, type_node, graphql_info, query_args):
-    return resolve_filter_response(obj, graphql_info, type_node=type_node, **query_args)
+    ents = resolve_filter_response(obj, graphql_info, type_node=type_node, **query_args)
+    prefetch_fields(ents, type_node, graphql_info)
+    return ents
 
 
 
@@ -717,7 +797,7 @@ def resolve_filter_response2(obj, type_node, graphql_info, query_args):
 # * Internal query parts
 #--------------------------------------------
 
-def obtain_initial_list(type_node, filter_opts, info):
+def obtain_initial_list(type_node, filter_opts, info, auth=True):
     gs = info.context["gs"]
 
     type_et = ET(type_node | Out[RT.GQL_Delegate] | collect)
@@ -733,7 +813,7 @@ def obtain_initial_list(type_node, filter_opts, info):
         zs = []
 
         zs = (ids
-              | map[lambda id: find_existing_entity_by_id(info, type_node, id)]
+              | map[lambda id: find_existing_entity_by_id(info, type_node, id, auth=auth)]
               | filter[Not[equals[None]]])
 
         if info.context["debug_level"] >= 3:
@@ -741,19 +821,35 @@ def obtain_initial_list(type_node, filter_opts, info):
 
         return zs
     else:
-        zs = gs | all[type_et] | filter[pass_query_auth[type_node][info]]
+        zs = plan_initial_list(type_node, filter_opts, info)
+        if zs is None:
+            zs = gs | all[type_et]
+        elif info.context["debug_level"] >= 3:
+            log.debug("DEBUG 3: built initial list from field index", length_list=len(zs))
+        if auth:
+            zs = zs | filter[pass_query_auth[type_node][info]]
         if info.context["debug_level"] >= 3:
-            log.debug("DEBUG 3: built initial list from type and auth", length_list=length(zs))
+            log.debug("DEBUG 3: built initial list from type", auth=auth, length_list=length(zs))
         return zs
 
     
 
-def handle_list_params(opts, z_node, params, info):
+def handle_list_params(opts, z_node, params, info, query_auth=False):
     opts = maybe_filter_result(opts, z_node, info, params.get("filter", None))
+    if query_auth:
+        opts = opts | filter[pass_query_auth[z_node][info]]
     if info.context["debug_level"] >= 3:
         log.debug("DEBUG 3: after filtering", length_list=length(opts))
-    opts = maybe_sort_result(opts, z_node, info, params.get("order", None))
-    opts = maybe_paginate_result(opts, params.get("first", None), params.get("offset", None))
+    sort_decl = params.get("order", None)
+    first = params.get("first", None)
+    offset = params.get("offset", None)
+    if sort_decl is not None and first is not None:
+        # Only the top first+offset items can be returned, so there is no need
+        # to sort the whole list.
+        opts = maybe_top_k_result(opts, z_node, info, sort_decl, first + (offset or 0))
+    else:
+        opts = maybe_sort_result(opts, z_node, info, sort_decl)
+    opts = maybe_paginate_result(opts, first, offset)
     return opts
 
 @func
@@ -861,10 +957,15 @@ def scalar_comparison_op(sub):
     return this
                 
 def get_field_rel_by_name(z_type, name):
-    return (z_type | out_rels[RT.GQL_Field]
-            | filter[F.Name | equals[name]]
-            | first
-            | collect)
+    key = (uid(z_type), name)
+    z_field = _fields_by_name.get(key, None)
+    if z_field is None:
+        z_field = (z_type | out_rels[RT.GQL_Field]
+                   | filter[F.Name | equals[name]]
+                   | first
+                   | collect)
+        _fields_by_name[key] = z_field
+    return z_field
 
 # ** Sorting
 
@@ -895,6 +996,44 @@ def maybe_sort_result(opts, z_node, info, sort_decl=None):
 
     return opts
 
+def maybe_top_k_result(opts, z_node, info, sort_decl, k):
+    # Equivalent to maybe_sort_result followed by take[k]. The keys of all
+    # levels are compared together, with the same tie-breaking as the chain of
+    # stable sorts in maybe_sort_result.
+    if k <= 0:
+        return []
+
+    field_resolver = field_resolver_by_name[z_node][info]
+
+    levels = []
+    cur = sort_decl
+    while cur is not None:
+        if "asc" in cur:
+            assert not "desc" in cur
+            levels += [(field_resolver[cur["asc"]], False)]
+        elif "desc" in cur:
+            levels += [(field_resolver[cur["desc"]], True)]
+
+        cur = cur.get("then", None)
+
+    if len(levels) == 0:
+        return opts | take[k] | collect
+
+    directions = [desc for _,desc in levels]
+    def compare(a, b):
+        for x,y,desc in zip(a[0], b[0], directions):
+            if desc:
+                x,y = y,x
+            if x < y:
+                return -1
+            if y < x:
+                return 1
+        return 0
+
+    decorated = ((tuple(val(z) for val,_ in levels), z) for z in opts)
+    top = heapq.nsmallest(k, decorated, key=functools.cmp_to_key(compare))
+    return [z for _,z in top]
+
 # ** Pagination
 
 def maybe_paginate_result(opts, first=None, offset=None):
@@ -905,6 +1044,288 @@ def maybe_paginate_result(opts, first=None, offset=None):
     return opts
 
 
+# ** Planning
+
+# Value indices of unique/searchable scalar fields allow the initial list of a
+# query to be obtained without visiting every entity of the type. The server
+# can maintain a FieldValueIndex for the latest state of the data graph. It is
+# only used for queries on the slice it describes; other queries, or servers
+# without the index, scan the type.
+
+def field_is_indexable(z_field):
+    return ((z_field | op_is_unique | collect or z_field | op_is_searchable | collect)
+            and not z_field | op_is_list | collect
+            and z_field | target | op_is_scalar | collect
+            and z_field | has_out[RT.GQL_Resolve_With] | collect)
+
+def indexed_field_values(z, z_field):
+    # Without auth on the field this is a superset of what a filter can see,
+    # which is fine as the full filter is still applied afterwards.
+    return {val for val in resolve_with_relation(z, z_field) | map[value] | collect
+            if val is not None}
+
+class FieldValueIndex:
+    """Maps (ET, field relation, value) to the uids of the entities having that
+    value, for all unique or searchable scalar fields of a schema.
+
+    The index is built from the latest slice of the data graph by `start` and
+    is then kept up to date by a subscription to the transactions on the
+    graph. Lookups are only answered for the slice the index currently
+    describes, otherwise they return None and the caller should fall back to a
+    scan.
+    """
+    def __init__(self, schema_root):
+        self._lock = threading.Lock()
+        self.gs = None
+        self.types = {}
+        self.rts = set()
+        for z_type in schema_root | Outs[RT.GQL_Type]:
+            if op_is_relation(z_type):
+                continue
+            z_fields = z_type | out_rels[RT.GQL_Field] | filter[field_is_indexable] | collect
+            if len(z_fields) == 0:
+                continue
+            et = ET(z_type | Out[RT.GQL_Delegate] | collect)
+            self.types[uid(z_type)] = (et, [uid(z_field) for z_field in z_fields], z_fields)
+            for z_field in z_fields:
+                self.rts.add(RT(z_field | Out[RT.GQL_Resolve_With] | collect))
+        # field key -> value -> set of uids
+        self.by_value = {}
+        # uid -> field key -> set of values
+        self.ent_values = {}
+        self._sorted_values = {}
+
+    def start(self, g):
+        from ...pyzef import zefops as internal
+        # Subscribe before building, so that no transaction can be missed.
+        # Transactions already part of the built slice are skipped.
+        self._sub = g | internal.subscribe[internal.keep_alive[True]][self._on_transaction]
+        self.rebuild(now(g))
+        return self
+
+    def rebuild(self, gs):
+        with self._lock:
+            self.by_value = {}
+            self.ent_values = {}
+            self._sorted_values = {}
+            for et,field_keys,z_fields in self.types.values():
+                for z in gs | all[et]:
+                    self._set_entity(z, field_keys, z_fields)
+            self.gs = gs
+
+    def _set_entity(self, z, field_keys, z_fields):
+        ent_uid = origin_uid(z)
+        ent_d = self.ent_values.setdefault(ent_uid, {})
+        for field_key,z_field in zip(field_keys, z_fields):
+            new_vals = indexed_field_values(z, z_field)
+            old_vals = ent_d.get(field_key, set())
+            if new_vals == old_vals:
+                continue
+            field_d = self.by_value.setdefault(field_key, {})
+            for val in old_vals - new_vals:
+                uids = field_d[val]
+                uids.discard(ent_uid)
+                if len(uids) == 0:
+                    del field_d[val]
+            for val in new_vals - old_vals:
+                field_d.setdefault(val, set()).add(ent_uid)
+            ent_d[field_key] = new_vals
+            self._sorted_values.pop(field_key, None)
+
+    def _remove_entity(self, ent_uid):
+        ent_d = self.ent_values.pop(ent_uid, {})
+        for field_key,vals in ent_d.items():
+            field_d = self.by_value.get(field_key, {})
+            for val in vals:
+                uids = field_d.get(val, set())
+                uids.discard(ent_uid)
+                if len(uids) == 0:
+                    field_d.pop(val, None)
+            self._sorted_values.pop(field_key, None)
+
+    def _on_transaction(self, root_node):
+        gs = root_node | frame | collect
+        try:
+            with self._lock:
+                if self.gs is None or graph_slice_index(gs) <= graph_slice_index(self.gs):
+                    return
+                missed = graph_slice_index(gs) > graph_slice_index(self.gs) + 1
+            if missed:
+                self.rebuild(gs)
+                return
+            self._apply_transaction(gs, root_node | frame | to_tx | collect)
+        except Exception as exc:
+            log.error("Failed to update field index, falling back to scans", exc_info=exc)
+            with self._lock:
+                self.gs = None
+
+    def _apply_transaction(self, gs, z_tx):
+        terminated = set()
+        touched = {}
+        def touch(z):
+            touched.setdefault(origin_uid(z), z)
+
+        def touch_ends(z):
+            if is_a(z, Relation) and rae_type(z) in self.rts:
+                touch(source(z))
+                touch(target(z))
+            elif is_a(z, AttributeEntity):
+                for rel in (z | in_rels | collect) + (z | out_rels | collect):
+                    if rae_type(rel) in self.rts:
+                        touch(source(rel))
+                        touch(target(rel))
+            else:
+                touch(z)
+
+        for ev in z_tx | events[Terminated] | collect:
+            if is_a(ev.target, Entity):
+                terminated.add(origin_uid(ev.target))
+            touch_ends(ev.target)
+        for ev in z_tx | events[Instantiated] | collect:
+            touch_ends(ev.target)
+        for ev in z_tx | events[Assigned] | collect:
+            touch_ends(ev.target)
+
+        with self._lock:
+            for ent_uid,z in touched.items():
+                if ent_uid in terminated:
+                    self._remove_entity(ent_uid)
+                    continue
+                for et,field_keys,z_fields in self.types.values():
+                    if is_a(z, et):
+                        self._set_entity(z, field_keys, z_fields)
+            self.gs = gs
+
+    def in_sync(self, gs):
+        with self._lock:
+            return self.gs is not None and self.gs == gs
+
+    def field(self, gs, type_node, z_field):
+        """Returns a view of the index for the field on the slice gs, or None
+        if the field isn't indexed."""
+        type_info = self.types.get(uid(type_node), None)
+        field_key = uid(z_field)
+        if type_info is None or field_key not in type_info[1]:
+            return None
+        return FieldValueIndexView(self, gs, field_key)
+
+    def lookup(self, gs, field_key, vals):
+        with self._lock:
+            if self.gs is None or self.gs != gs:
+                raise FieldIndexOutOfSync()
+            field_d = self.by_value.get(field_key, {})
+            out = set()
+            for val in vals:
+                out.update(field_d.get(val, ()))
+            return out
+
+    def lookup_between(self, gs, field_key, low, high):
+        with self._lock:
+            if self.gs is None or self.gs != gs:
+                raise FieldIndexOutOfSync()
+            keys = self._sorted_values.get(field_key, None)
+            if keys is None:
+                keys = sorted(self.by_value.get(field_key, {}))
+                self._sorted_values[field_key] = keys
+            field_d = self.by_value[field_key] if len(keys) > 0 else {}
+            out = set()
+            for val in keys[bisect.bisect_left(keys, low):bisect.bisect_right(keys, high)]:
+                out.update(field_d[val])
+            return out
+
+class FieldIndexOutOfSync(Exception):
+    pass
+
+class FieldValueIndexView:
+    def __init__(self, index, gs, field_key):
+        self.index = index
+        self.gs = gs
+        self.field_key = field_key
+
+    def eq(self, val):
+        return self.index.lookup(self.gs, self.field_key, [val])
+
+    def contained_in(self, vals):
+        return self.index.lookup(self.gs, self.field_key, vals)
+
+    def between(self, low, high):
+        return self.index.lookup_between(self.gs, self.field_key, low, high)
+
+class MaintainedIndexSource:
+    def __init__(self, field_index, type_node, gs):
+        self.field_index = field_index
+        self.type_node = type_node
+        self.gs = gs
+
+    def field(self, z_field):
+        return self.field_index.field(self.gs, self.type_node, z_field)
+
+    def materialize(self, candidates):
+        # Keep the order of gs | all[et], which is the order of the blobs.
+        zs = [self.gs[ent_uid] for ent_uid in candidates]
+        return sorted(zs, key=index)
+
+def plan_field_candidates(source, type_node, fil):
+    # Returns a set of keys of the index source which is a superset of the
+    # entities passing the filter, or None if no index could be used. Only
+    # the conjuncts at the top-level of the filter are considered.
+    candidates = None
+    for key,sub in fil.items():
+        parts = []
+        if key == "and":
+            for part_fil in sub:
+                part = plan_field_candidates(source, type_node, part_fil)
+                if part is not None:
+                    parts += [part]
+        elif key in ["or", "not", "id"]:
+            continue
+        else:
+            z_field = get_field_rel_by_name(type_node, key)
+            if not field_is_indexable(z_field):
+                continue
+            index = source.field(z_field)
+            if index is None:
+                continue
+            try:
+                if isinstance(sub, bool):
+                    parts += [index.eq(sub)]
+                else:
+                    if "eq" in sub:
+                        parts += [index.eq(sub["eq"])]
+                    if "in" in sub:
+                        parts += [index.contained_in(sub["in"])]
+                    if "between" in sub:
+                        parts += [index.between(sub["between"]["min"], sub["between"]["max"])]
+            except TypeError:
+                # Unhashable or unorderable filter values - leave to the filter.
+                pass
+
+        for part in parts:
+            candidates = part if candidates is None else candidates & part
+
+    return candidates
+
+def plan_initial_list(type_node, filter_opts, info):
+    """Uses the field indices to find a list of candidate entities for the
+    filter, or returns None if the filter requires a scan of the whole type.
+    The candidates still need to have the filter applied."""
+    if filter_opts is None or op_is_relation(type_node):
+        return None
+    gs = info.context["gs"]
+    field_index = info.context.get("field_index", None)
+    if field_index is None or not field_index.in_sync(gs):
+        return None
+    source = MaintainedIndexSource(field_index, type_node, gs)
+    try:
+        candidates = plan_field_candidates(source, type_node, filter_opts)
+    except FieldIndexOutOfSync:
+        # A transaction landed while planning.
+        return None
+    if candidates is None:
+        return None
+    return source.materialize(candidates)
+
+
 # ** Resolution
 
 @func
@@ -914,32 +1335,14 @@ def internal_resolve_field(z, info, z_field, auth_required=True):
 
     # Also *only* returns that list. The calling function needs to apply the single/list logic
     
-    is_incoming = z_field | op_is_incoming | collect
+    meta = field_meta(z_field)
     # This is a delegate
-    if z_field | has_out[RT.GQL_Resolve_With] | collect:
-        relation = z_field | Out[RT.GQL_Resolve_With] | collect
-        is_triple = source(relation) != relation
-
-        rt = RT(relation)
-
-        if is_triple:
-            if is_incoming:
-                assert rae_type(z) == rae_type(target(relation)), f"The RAET of the object {z} is not the same as that of the delegate relation {target(relation)!r}"
-            else:
-                assert rae_type(z) == rae_type(source(relation)), f"The RAET of the object {z} is not the same as that of the delegate relation {source(relation)!r}"
-
-        if is_incoming:
-            opts = z | Ins[rt]
-            if is_triple:
-                opts = opts | filter[is_a[rae_type(source(relation))]]
-        else:
-            opts = z | Outs[rt]
-            if is_triple:
-                opts = opts | filter[is_a[rae_type(target(relation))]]
-    elif z_field | has_out[RT.GQL_FunctionResolver] | collect:
+    if meta.relation is not None:
+        opts = resolve_with_relation(z, z_field)
+    elif meta.function_resolver is not None:
         # TODO: Sort this out when renaming info -> ctx/sctx
         context = info.context
-        opts = func[z_field | Out[RT.GQL_FunctionResolver] | collect](z, context, z_field, context)
+        opts = meta.function_resolver(z, context, z_field, context)
         # This is to mimic the behaviour that people probably expect from a
         # non-list resolver.
         if not is_a(opts, List):
@@ -950,12 +1353,12 @@ def internal_resolve_field(z, info, z_field, auth_required=True):
     else:
         raise Exception(f"Don't know how to resolve this field: {z_field}")
 
-    if auth_required:
-        opts = opts | filter[pass_query_auth[target(z_field)][info]]
+    if auth_required and meta.target_has_auth:
+        opts = opts | filter[pass_query_auth[meta.target][info]]
 
     # We must convert final objects from AEs to python types.
     # if z_field | target | is_core_scalar | collect:
-    if z_field | target | op_is_scalar | collect:
+    if meta.is_scalar:
         # With a dynamic resolver, the items could also be values, so only apply value if they are ZefRefs
         opts = opts | map[match[
             (ZefRef, value),
@@ -965,6 +1368,69 @@ def internal_resolve_field(z, info, z_field, auth_required=True):
     return opts
 
 
+def resolve_with_relation(z, z_field):
+    meta = field_meta(z_field)
+
+    if meta.is_triple:
+        assert rae_type(z) == meta.self_raet, f"The RAET of the object {z} is not the same as that of the delegate relation {meta.self_raet!r}"
+
+    if meta.is_incoming:
+        opts = z | Ins[meta.rt]
+    else:
+        opts = z | Outs[meta.rt]
+    if meta.is_triple:
+        opts = opts | filter[is_a[meta.other_raet]]
+
+    return opts
+
+
+# ** Batched resolution
+
+def prefetch_fields(ents, type_node, info):
+    """Resolves the simple scalar fields selected on a list of objects together,
+    storing them in the per-query field cache that resolve_field consults.
+    Fields with arguments, custom resolvers or auth on their type are left to
+    be resolved individually."""
+    field_nodes = getattr(info, "field_nodes", None)
+    if not field_nodes or field_nodes[0].selection_set is None or len(ents) <= 1:
+        return
+    if not all(isinstance(z, ZefRef) for z in ents):
+        return
+
+    from graphql import FieldNode
+    metas = []
+    for selection in field_nodes[0].selection_set.selections:
+        if not isinstance(selection, FieldNode) or len(selection.arguments) > 0:
+            continue
+        name = selection.name.value
+        if name == "id" or name.startswith("__"):
+            continue
+        z_field = get_field_rel_by_name(type_node, name)
+        if z_field is None:
+            continue
+        meta = field_meta(z_field)
+        if meta.relation is None or not meta.is_scalar or meta.target_has_auth:
+            continue
+        if meta not in metas:
+            metas += [meta]
+    if len(metas) == 0:
+        return
+
+    cache = info.context.setdefault("field_cache", {})
+    for meta in metas:
+        for z in ents:
+            key = (meta, z)
+            if key in cache:
+                continue
+            opts = resolve_with_relation(z, meta.z_field) | map[value] | collect
+            if meta.is_list:
+                out = opts
+            else:
+                out = single_field_value(z, meta, opts)
+            # Wrapped so that a None value can also be cached.
+            cache[key] = (out,)
+
+
 # ** Handling adding
 
 def NameGen():
@@ -973,7 +1439,7 @@ def NameGen():
         n += 1
         yield n
 
-def find_existing_entity_by_id(info, type_node, id):
+def find_existing_entity_by_id(info, type_node, id, auth=True):
     if id is None:
         return None
     the_uid = uid(id)
@@ -989,7 +1455,7 @@ def find_existing_entity_by_id(info, type_node, id):
     ent = gs[uid(id)] | collect
     if not is_a(ent, et):
         return None
-    if not ent | pass_query_auth[type_node][info] | collect:
+    if auth and not ent | pass_query_auth[type_node][info] | collect:
         return None
 
     return ent
@@ -1010,6 +1476,20 @@ def find_existing_entity_by_field(info, type_node, z_field, val):
     # because the field is also @unique then this will fail. Better to keep the
     # failure point at the same location so we can determine what kind of error
     # to return and whether this will leak sensitive information.
+    field_index = info.context.get("field_index", None)
+    if field_index is not None:
+        index = field_index.field(gs, type_node, z_field)
+        if index is not None:
+            try:
+                ents = [gs[ent_uid] for ent_uid in index.eq(val)]
+            except (FieldIndexOutOfSync, TypeError):
+                ents = None
+            if ents is not None:
+                return (ents
+                        | filter[pass_query_auth[type_node][info]]
+                        | optional
+                        | collect)
+
     ent = (gs | all[et] | filter[pass_query_auth[type_node][info]]
            | filter[internal_resolve_field[info][z_field] | optional | equals[val]]
            | optional
@@ -1307,11 +1787,48 @@ def auth_helper_auth_field(field_name, auth_type, *, z, type_node, info, **kwds)
 
 
 
+def field_index_duplicates(z_field, type_node, post_checks, r, g, info):
+    # Returns the values of the field held by more than one entity of the type
+    # after the transaction, or None if the field index can't tell. The index
+    # describes the slice before the transaction, so this relies on the
+    # entities of the post checks being the only ones that changed.
+    field_index = info.context.get("field_index", None)
+    if field_index is None:
+        return None
+    index = field_index.field(info.context["gs"], type_node, z_field)
+    if index is None:
+        return None
+
+    gs_now = g | now | collect
+    # The values of the changed entities of this type in the new slice
+    changed = {}
+    for (kind,obj,other_node) in post_checks:
+        if kind not in ["add", "update", "remove"] or uid(other_node) != uid(type_node):
+            continue
+        if isinstance(obj, String):
+            obj = r[obj]
+        if kind == "remove":
+            changed[origin_uid(obj)] = set()
+        else:
+            changed[origin_uid(obj)] = indexed_field_values(obj | to_frame[gs_now] | collect, z_field)
+
+    holders = {}
+    for ent_uid,vals in changed.items():
+        for val in vals:
+            holders.setdefault(val, set()).add(ent_uid)
+    try:
+        for val,ent_uids in holders.items():
+            ent_uids.update(index.eq(val) - set(changed))
+    except (FieldIndexOutOfSync, TypeError):
+        return None
+    return {val for val,ent_uids in holders.items() if len(ent_uids) > 1}
+
 def commit_with_post_checks(actions, post_checks, info):
     g = Graph(info.context["gs"])
     with Transaction(g):
         try:
             r = actions | transact[g] | run
+            hooks_ran = False
             # Test all post checks
             for (kind,obj,type_node) in post_checks:
                 type_name = type_node | fvalue[RT.Name][''] | collect
@@ -1326,6 +1843,7 @@ def commit_with_post_checks(actions, post_checks, info):
 
                 if kind == "add":
                     for z_func in type_node | Outs[RT.OnCreate]:
+                        hooks_ran = True
                         try:
                             func[z_func](obj)
                         except:
@@ -1334,6 +1852,7 @@ def commit_with_post_checks(actions, post_checks, info):
                         raise ExternalError(f"Add auth check for type_node of '{type_name}' returned False")
                 elif kind == "update":
                     for z_func in type_node | Outs[RT.OnUpdate]:
+                        hooks_ran = True
                         try:
                             func[z_func](obj)
                         except:
@@ -1342,6 +1861,7 @@ def commit_with_post_checks(actions, post_checks, info):
                         raise ExternalError(f"Post-update auth check for type_node of '{type_name}' returned False")
                 elif kind == "remove":
                     for z_func in type_node | Outs[RT.OnRemove]:
+                        hooks_ran = True
                         try:
                             func[z_func](obj)
                         except:
@@ -1350,16 +1870,25 @@ def commit_with_post_checks(actions, post_checks, info):
                     # In this case, obj is the field which must be unique
                     z_field = obj
                     assert op_is_unique(z_field)
-                    # Get all values - note this is not filtered by the user's
-                    # viewpoint, so we need to be a little careful.
-                    ents = g | now | all[ET(type_node | Out[RT.GQL_Delegate] | collect)]
-                    vals = ents | map[internal_resolve_field[info][z_field][False]] | concat | collect
-
-                    dis = distinct(vals)
-                    if len(dis) != len(vals):
-                        if info.context["debug_level"] >= 0:
-                            log.error("Non-unique values", vals=set(vals) - set(dis))
-                        raise ExternalError(f"Non-unique values found for field '{z_field | F.Name | collect}' of type_node '{type_name}'")
+                    # Hooks can change any entity, so only without them are
+                    # the entities of the post checks all that changed.
+                    dups = None if hooks_ran else field_index_duplicates(z_field, type_node, post_checks, r, g, info)
+                    if dups is not None:
+                        if len(dups) > 0:
+                            if info.context["debug_level"] >= 0:
+                                log.error("Non-unique values", vals=dups)
+                            raise ExternalError(f"Non-unique values found for field '{z_field | F.Name | collect}' of type_node '{type_name}'")
+                    else:
+                        # Get all values - note this is not filtered by the user's
+                        # viewpoint, so we need to be a little careful.
+                        ents = g | now | all[ET(type_node | Out[RT.GQL_Delegate] | collect)]
+                        vals = ents | map[internal_resolve_field[info][z_field][False]] | concat | collect
+
+                        dis = distinct(vals)
+                        if len(dis) != len(vals):
+                            if info.context["debug_level"] >= 0:
+                                log.error("Non-unique values", vals=set(vals) - set(dis))
+                            raise ExternalError(f"Non-unique values found for field '{z_field | F.Name | collect}' of type_node '{type_name}'")
 
 
         except Exception as exc:
@@ -17,10 +17,12 @@ from ...ops import *
 
 from ...core.fx.http import send_response, permit_cors, middleware, middleware_worker, fallback_not_found, route
 
-from .generate_api2 import generate_resolvers_fcts
+from .generate_api2 import generate_resolvers_fcts, FieldValueIndex
 from ariadne import graphql_sync
 
 from functools import partial as P
+from collections import OrderedDict
+import threading
 import json
 
 from zef.core.logger import log
@@ -74,6 +76,132 @@ def resolve_token(context, request):
     else:
         return auth_result[namespace]
             
+class QueryResultCache:
+    """LRU cache of GraphQL results for read-only queries.
+
+    Entries are keyed on the graph slice index, the normalized query
+    document, the variables, the operation name and the auth context. As the
+    slice index is part of every key, a new transaction on the data graph
+    makes all existing entries unreachable - these are dropped as soon as a
+    newer slice is seen. Queries still running on an older slice neither use
+    nor fill the cache.
+
+    Results are stored in their JSON form, which is also used to account for
+    the size of the cache.
+    """
+    def __init__(self, max_entries=1024, max_bytes=64*2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._n_bytes = 0
+        self._slice_index = None
+        # Parsing the query is needed both to determine whether it is
+        # read-only and to normalize it. This is independent of the slice, so
+        # is kept across invalidations.
+        self._documents = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def document_info(self, query_str):
+        """Returns (normalized document, is_read_only) for the query string,
+        or None if it can not be parsed."""
+        with self._lock:
+            info = self._documents.get(query_str, None)
+            if info is not None:
+                self._documents.move_to_end(query_str)
+                return info
+        from graphql import parse, print_ast, OperationType, GraphQLError
+        try:
+            doc = parse(query_str)
+        except GraphQLError:
+            return None
+        read_only = all(getattr(d, "operation", OperationType.QUERY) == OperationType.QUERY
+                        for d in doc.definitions)
+        info = (print_ast(doc), read_only)
+        with self._lock:
+            self._documents[query_str] = info
+            while len(self._documents) > self.max_entries:
+                self._documents.popitem(last=False)
+        return info
+
+    def make_key(self, slice_index, query, auth_context):
+        info = self.document_info(query.get("query", None))
+        if info is None:
+            return None
+        try:
+            variables = json.dumps(query.get("variables", None), sort_keys=True)
+            auth = json.dumps(auth_context, sort_keys=True, default=str)
+        except (TypeError, ValueError):
+            return None
+        return (slice_index, info[0], variables, query.get("operationName", None), auth)
+
+    def _check_slice(self, slice_index):
+        # Must be called with the lock held. Returns False for a slice older
+        # than the one cached.
+        if self._slice_index is None or slice_index > self._slice_index:
+            if len(self._entries) > 0:
+                self.invalidations += 1
+            self._entries.clear()
+            self._n_bytes = 0
+            self._slice_index = slice_index
+        return slice_index == self._slice_index
+
+    def get(self, slice_index, key):
+        with self._lock:
+            entry = self._entries.get(key, None) if self._check_slice(slice_index) else None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return json.loads(entry)
+
+    def put(self, slice_index, key, data):
+        try:
+            entry = json.dumps(data)
+        except (TypeError, ValueError):
+            return
+        if len(entry) > self.max_bytes:
+            return
+        with self._lock:
+            if not self._check_slice(slice_index):
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._n_bytes -= len(old)
+            self._entries[key] = entry
+            self._n_bytes += len(entry)
+            while len(self._entries) > self.max_entries or self._n_bytes > self.max_bytes:
+                _,evicted = self._entries.popitem(last=False)
+                self._n_bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._n_bytes = 0
+            self._slice_index = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._n_bytes,
+            }
+
+def is_read_only_query(query, cache):
+    if type(query) != dict or type(query.get("query", None)) != str:
+        return False
+    info = cache.document_info(query["query"])
+    return info is not None and info[1]
+
 def query(request, context):
     root = context["z_gql_root"]
     if root | has_out[RT.AuthHeader] | collect:
@@ -109,37 +237,60 @@ def query(request, context):
         log.debug("DEBUG 3: incoming query", q=q)
 
     # We pass in the graph as a fixed slice, so that the queries can be done
-    # consistently.
+    # consistently. The slice is shared by all queries in a batch, and is only
+    # refreshed after a mutation so that later queries see its changes.
     start = now()
     if type(q) == list:
         queries = q
     else:
         queries = [q]
 
+    cache = context.get("query_cache", None)
+    gs = now(context["g_data"])
+
     success = True
     out_data = []
     for query in queries:
+        key = None
+        read_only_query = False
+        if cache is not None:
+            read_only_query = is_read_only_query(query, cache)
+            if read_only_query:
+                key = cache.make_key(graph_slice_index(gs), query, auth_context)
+                if key is not None:
+                    this_data = cache.get(graph_slice_index(gs), key)
+                    if this_data is not None:
+                        out_data += [this_data]
+                        continue
+
         this_success,this_data = graphql_sync(
             context["ari_schema"],
             query,
-            context_value={"gs": now(context["g_data"]),
+            context_value={"gs": gs,
                         "auth": auth_context,
                         "debug_level": context["debug_level"],
-                        "read_only": context["read_only"]},
+                        "read_only": context["read_only"],
+                        "field_index": context["field_index"]},
         )
         if not this_success:
             if context["debug_level"] >= 0:
                 log.error("Failure in GQL query.", data=this_data, q=query, auth_context=auth_context)
             success = False
+        elif key is not None and "errors" not in this_data:
+            cache.put(graph_slice_index(gs), key, this_data)
 
-        out_data += [this_data]
+        if not read_only_query and not context["read_only"]:
+            gs = now(context["g_data"])
 
+        out_data += [this_data]
 
     if type(q) != list:
         out_data = out_data[0]
 
     if context["debug_level"] >= 1:
         log.debug("Total query time", dt=now()-start)
+        if cache is not None:
+            log.debug("Query cache stats", **cache.stats())
 
     response = json.dumps(out_data)
     if context["debug_level"] >= 3:
@@ -158,6 +309,10 @@ def start_server(z_gql_root,
                  logging=True,
                  debug_level=0,
                  read_only=False,
+                 cache_queries=False,
+                 cache_max_entries=1024,
+                 cache_max_bytes=64*2**20,
+                 index_fields=False,
                  ):
 
     gql_dict = generate_resolvers_fcts(z_gql_root)
@@ -175,7 +330,16 @@ def start_server(z_gql_root,
         "ari_schema": ari_schema,
         "debug_level": debug_level,
         "read_only": read_only,
+        "field_index": None,
     }
+    if index_fields:
+        start = now()
+        context["field_index"] = FieldValueIndex(z_gql_root).start(g_data)
+        if debug_level >= 1:
+            log.debug("Built field value index", dt=now()-start)
+    if cache_queries:
+        context["query_cache"] = QueryResultCache(max_entries=cache_max_entries,
+                                                  max_bytes=cache_max_bytes)
 
     if z_gql_root | has_out[RT.AuthJWKURL] | collect:
         url = z_gql_root | F.AuthJWKURL | collect